@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# bench_aggregation.py - Agregación de estadísticas, gráficos y predicción en una sola pasada
+#
+# Genera en memoria --rows artículos con las columnas de STATS_ITEM_COLUMNS (descripción
+# como categoría, importes en céntimos, como las lecturas de la base de datos) y mide:
+# 1. La versión anterior: generate_statistics agrupaba por descripción tres veces y por
+#    mes, y generate_visualizations y predict_future_spending repetían el dropna, el
+#    paso a meses y las mismas agrupaciones para cada gráfico (sin dibujar nada aquí).
+# 2. StatisticsAccumulator sobre el DataFrame entero y por trozos de --chunk-size filas:
+#    una pasada con np.bincount de la que salen las estadísticas, los gráficos y la
+#    predicción (forecast_monthly).
+# Comprueba que los gastos por mes y por producto coinciden.
+# Uso: python benchmarks/bench_aggregation.py [--rows 10000000] [--products 5000] [--chunk-size N]
+
+import argparse
+import os
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import numpy as np
+import pandas as pd
+
+from ExpenditureControl import READ_CHUNK_SIZE, PDFInvoiceProcessor
+
+def make_items(n_rows, n_products, seed=0):
+    rng = np.random.default_rng(seed)
+    invoice_numbers = np.array([str(4700000000 + i) for i in range(n_rows // 10 + 1)], dtype=object)
+    categories = pd.Index([f"PRODUCTO {i:05d}" for i in range(n_products)])
+    dates = pd.to_datetime("2016-01-01") + pd.to_timedelta(np.arange(n_rows) // 10 * 3650 // (n_rows // 10 + 1), unit="D")
+    dates = pd.Series(dates)
+    # Algunas fechas vacías, como las páginas sin "Fecha"
+    dates[rng.random(n_rows) < 0.01] = pd.NaT
+    return pd.DataFrame({
+        "Nº Factura": invoice_numbers[np.arange(n_rows) // 10],
+        "Fecha Factura": dates,
+        "Cantidad": rng.integers(1, 50, n_rows).astype(float),
+        "Precio Unitario (EUR)": rng.integers(5, 20000, n_rows),
+        "Valor Neto (EUR)": rng.integers(5, 200000, n_rows),
+        "Descripción": pd.Categorical.from_codes(rng.integers(0, n_products, n_rows), categories),
+    })
+
+def legacy_aggregations(df_items):
+    """Las agrupaciones de generate_statistics, generate_visualizations y predict_future_spending anteriores."""
+    stats = {}
+    stats['total_invoices'] = len(df_items['Nº Factura'].unique())
+    stats['total_spent'] = df_items['Valor Neto (EUR)'].sum()
+    stats['avg_item_price'] = df_items['Precio Unitario (EUR)'].mean()
+    stats['most_expensive_item'] = df_items.loc[df_items['Precio Unitario (EUR)'].idxmax()]
+    df_items_filtered = df_items.dropna(subset=['Fecha Factura', 'Valor Neto (EUR)'])
+    df_items_filtered['Mes'] = df_items_filtered['Fecha Factura'].dt.to_period('M')
+    stats['monthly_spending'] = df_items_filtered.groupby('Mes')['Valor Neto (EUR)'].sum()
+    stats['top_products'] = df_items_filtered['Descripción'].value_counts().head(10)
+    stats['spending_per_product'] = df_items_filtered.groupby('Descripción')['Valor Neto (EUR)'].sum().sort_values(ascending=False).head(10)
+    stats['spending_per_product'] = df_items_filtered.groupby('Descripción')['Valor Neto (EUR)'].sum().sort_values(ascending=False)
+    stats['total_quantity_per_product'] = df_items_filtered.groupby('Descripción')['Cantidad'].sum().sort_values(ascending=False)
+
+    # generate_visualizations: un dropna y una agrupación por gráfico
+    charts = df_items.dropna(subset=['Fecha Factura', 'Valor Neto (EUR)'])
+    charts['Mes'] = charts['Fecha Factura'].dt.to_period('M')
+    charts.groupby('Mes')['Valor Neto (EUR)'].sum()
+    charts.groupby('Descripción')['Valor Neto (EUR)'].sum().sort_values(ascending=False).head(10)
+    charts.groupby('Descripción')['Cantidad'].sum().sort_values(ascending=False).head(10)
+    # predict_future_spending, llamada desde generate_visualizations
+    forecast = df_items.dropna(subset=['Fecha Factura', 'Valor Neto (EUR)'])
+    forecast['Fecha Numerica'] = (forecast['Fecha Factura'] - forecast['Fecha Factura'].min()).dt.days
+    forecast.groupby(forecast['Fecha Factura'].dt.to_period('M'))['Valor Neto (EUR)'].sum().reset_index()
+    charts['Mes'] = charts['Fecha Factura'].dt.to_period('M')
+    charts.groupby('Mes')['Valor Neto (EUR)'].sum()
+    return stats
+
+def engine_aggregations(processor, data):
+    stats = processor.generate_statistics(data, None)
+    processor.forecast_monthly(stats['monthly_spending'], stats['last_date'])
+    return stats
+
+def chunks(df, chunk_size):
+    for start in range(0, len(df), chunk_size):
+        yield df.iloc[start:start + chunk_size]
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+def same_aggregates(expected, stats):
+    products = expected['spending_per_product']
+    products.index = products.index.astype(object)
+    spending = stats['spending_per_product']
+    return (expected['monthly_spending'].equals(stats['monthly_spending'].rename_axis('Mes'))
+            and products.sort_index().equals(spending.sort_index())
+            and expected['total_spent'] == stats['total_spent'])
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del motor de agregación de las estadísticas")
+    parser.add_argument("--rows", type=int, default=10_000_000, help="Artículos generados")
+    parser.add_argument("--products", type=int, default=5000, help="Productos distintos")
+    parser.add_argument("--chunk-size", type=int, default=READ_CHUNK_SIZE, help="Filas por trozo")
+    args = parser.parse_args()
+    warnings.simplefilter("ignore")
+
+    seconds, df_items = timed(lambda: make_items(args.rows, args.products))
+    print(f"{args.rows:,} artículos de {args.products:,} productos generados en {seconds:.1f} s")
+    processor = PDFInvoiceProcessor()
+    # La primera importación de scikit-learn no forma parte de la agregación
+    import sklearn.linear_model
+    legacy_time, expected = timed(lambda: legacy_aggregations(df_items))
+    print(f"versión anterior (agrupaciones repetidas)   {legacy_time:6.2f} s")
+    status = 0
+    for label, data in (("una pasada, DataFrame entero", lambda: df_items),
+                        (f"una pasada, trozos de {args.chunk_size:,}", lambda: chunks(df_items, args.chunk_size))):
+        seconds, stats = timed(lambda: engine_aggregations(processor, data()))
+        same = same_aggregates(expected, stats)
+        status |= not same
+        print(f"{label:<43} {seconds:6.2f} s  (x{legacy_time / seconds:5.1f})  "
+              f"{'✅ mismos agregados' if same else '❌ agregados distintos'}")
+    return int(status)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# bench_chunked_reads.py - Memoria y tiempo de estadísticas, predicción y exportación por trozos
+#
+# Genera una base de datos con --rows artículos (una factura cada 10, 1000 productos
+# distintos) y ejecuta cada operación en un proceso aparte, cargando todo con
+# get_all_data (como antes) o por trozos con iter_items/iter_invoices. Informa del
+# tiempo y del pico de memoria (RSS máximo, que incluye las páginas de la base de datos
+# leídas con mmap) de cada proceso y comprueba que los resultados coinciden.
+# Uso: python benchmarks/bench_chunked_reads.py [--rows 5000000] [--chunk-size N] [--keep DIR]
+
+import argparse
+import filecmp
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC_DIR)
+
+from ExpenditureControl import READ_CHUNK_SIZE, DatabaseManager
+
+# El producto k (id k + 1) tiene el código k; el artículo n es del producto n % 1000
+GENERATE_PRODUCTS = """
+    WITH RECURSIVE seq(k) AS (SELECT 0 UNION ALL SELECT k + 1 FROM seq WHERE k < 999)
+    INSERT INTO products (id, product_code, description)
+    SELECT k + 1, CAST(k AS TEXT), 'Producto ' || (k * 31 % 1000) FROM seq
+"""
+GENERATE_ITEMS = """
+    WITH RECURSIVE seq(n) AS (SELECT 0 UNION ALL SELECT n + 1 FROM seq WHERE n < ? - 1)
+    INSERT INTO items (invoice_number, invoice_date, item_number, position, quantity, unit_price,
+                       product_id, discount, iva, net_value)
+    SELECT CAST(4700000000 + n / 10 AS TEXT), date('2016-01-01', '+' || (n / 10 * 3650 / (? / 10 + 1)) || ' days'),
+           printf('%013d', n * 7919 % 10000000000000), n % 10 + 1, n % 50 + 1, n % 20000,
+           n % 1000 + 1, 0, 21, (n % 50 + 1) * (n % 20000)
+    FROM seq
+"""
+GENERATE_INVOICES = """
+    INSERT INTO invoices (invoice_number, invoice_date, ports, net_value, iva, iva_amount, total_amount)
+    SELECT invoice_number, MIN(invoice_date), 0, SUM(net_value), 21, CAST(ROUND(SUM(net_value) * 0.21) AS INTEGER),
+           CAST(ROUND(SUM(net_value) * 1.21) AS INTEGER)
+    FROM items GROUP BY invoice_number
+"""
+
+# Código que ejecuta cada proceso: argv = base de datos, operación, modo, directorio, trozo.
+# Por trozos cada operación lee solo sus columnas, como la línea de comandos
+CHILD = """
+import json, resource, sys, time, warnings
+warnings.simplefilter("ignore")
+from ExpenditureControl import *
+db_path, operation, mode, output_dir, chunk_size = sys.argv[1:6]
+db, processor = DatabaseManager(db_path), PDFInvoiceProcessor()
+start = time.perf_counter()
+if mode == "trozos":
+    columns = {"stats": (STATS_ITEM_COLUMNS, STATS_TOTAL_COLUMNS), "forecast": (FORECAST_ITEM_COLUMNS, None)}
+    item_columns, total_columns = columns.get(operation, (None, None))
+    df_items = db.iter_items(int(chunk_size), columns=item_columns)
+    df_invoices = db.iter_invoices(int(chunk_size), columns=total_columns)
+else:
+    df_items, df_invoices = db.get_all_data()
+if operation == "stats":
+    result = format_statistics(processor.generate_statistics(df_items, df_invoices))
+elif operation == "forecast":
+    result = [round(float(value), 2) for value in processor.predict_future_spending(df_items)[0]]
+else:
+    export_csv_files(df_items, df_invoices, output_dir)
+    result = None
+peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+print(json.dumps({"seconds": time.perf_counter() - start, "peak_mb": peak_mb, "result": result}))
+"""
+
+def run_child(db_path, operation, mode, output_dir, chunk_size):
+    env = dict(os.environ, PYTHONPATH=SRC_DIR)
+    completed = subprocess.run([sys.executable, "-c", CHILD, db_path, operation, mode, output_dir, str(chunk_size)],
+                               env=env, capture_output=True, text=True)
+    if completed.returncode:
+        # -9: el sistema ha matado el proceso por falta de memoria
+        return {"error": f"terminado con código {completed.returncode}" + (" (sin memoria)" if completed.returncode == -9 else ""),
+                "stderr": completed.stderr.strip().splitlines()[-1:]}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de las lecturas por trozos")
+    parser.add_argument("--rows", type=int, default=5_000_000, help="Artículos de la base de datos")
+    parser.add_argument("--chunk-size", type=int, default=READ_CHUNK_SIZE, help="Filas por trozo")
+    parser.add_argument("--keep", metavar="DIR", help="Directorio donde dejar la base de datos y los CSV")
+    args = parser.parse_args()
+
+    tmp_dir = args.keep or tempfile.mkdtemp()
+    os.makedirs(tmp_dir, exist_ok=True)
+    db_path = os.path.join(tmp_dir, "bench_chunked_reads.db")
+    if not os.path.exists(db_path):
+        start = time.perf_counter()
+        db = DatabaseManager(db_path)
+        db.create_tables()
+        with db.write_transaction() as cursor:
+            cursor.execute(GENERATE_PRODUCTS)
+            cursor.execute(GENERATE_ITEMS, (args.rows, args.rows))
+            cursor.execute(GENERATE_INVOICES)
+        db.close()
+        print(f"Base de datos con {args.rows:,} artículos generada en {time.perf_counter() - start:.1f} s")
+
+    status = 0
+    for operation in ("forecast", "stats", "export"):
+        results = {}
+        for mode in ("trozos", "todo"):
+            output_dir = os.path.join(tmp_dir, f"{operation}_{mode}")
+            os.makedirs(output_dir, exist_ok=True)
+            results[mode] = run_child(db_path, operation, mode, output_dir, args.chunk_size)
+            if "error" in results[mode]:
+                print(f"{operation:<9} {mode:<7} ❌ {results[mode]['error']} {' '.join(results[mode]['stderr'])}")
+            else:
+                print(f"{operation:<9} {mode:<7} {results[mode]['seconds']:8.1f} s  "
+                      f"pico de memoria {results[mode]['peak_mb']:8,.0f} MB")
+        if "error" in results["trozos"]:
+            status = 1
+            continue
+        if "error" in results["todo"]:
+            # Sin la carga completa no hay con qué comparar
+            continue
+        if operation == "export":
+            same = all(filecmp.cmp(os.path.join(tmp_dir, "export_trozos", name), os.path.join(tmp_dir, "export_todo", name),
+                                   shallow=False) for name in ("articulos.csv", "totales.csv"))
+        else:
+            same = results["trozos"]["result"] == results["todo"]["result"]
+        status |= not same
+        print(f"{'':<9} {'✅ mismos resultados' if same else '❌ resultados distintos'}")
+    return int(status)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# bench_db_concurrency.py - Ingesta y lecturas a la vez sobre la misma base de datos
+#
+# Un hilo escribe lotes con insert_rows (como stream_pdf_directory) mientras otro lee
+# todos los datos con get_all_data (como el refresco de la interfaz y las estadísticas).
+# Compara las conexiones gestionadas de DatabaseManager (WAL, pool de lectura) con el
+# esquema anterior: una conexión nueva por llamada en modo rollback journal.
+# Uso: python benchmarks/bench_db_concurrency.py [--rows 200000] [--batch-size 500] [--seconds 10]
+
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from ExpenditureControl import DatabaseManager
+
+class LegacyDatabaseManager(DatabaseManager):
+    """Conexión nueva por operación con el journal por defecto, como antes del pool."""
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=DELETE")
+        return conn
+
+    @contextmanager
+    def write_transaction(self):
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute("BEGIN")
+        try:
+            yield cursor
+        except BaseException:
+            conn.rollback()
+            conn.close()
+            raise
+        conn.commit()
+        conn.close()
+
+    @contextmanager
+    def read_connection(self):
+        conn = self._connect()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+def item_row(index):
+    invoice_number = str(4700000000 + index // 10)
+    return (invoice_number, "2024-01-15", f"{index:013d}", index % 10 + 1, 2.0, 350, "1", 0.0, 21.0, 700,
+            "Descripción no encontrada")
+
+def run(db_class, db_path, n_rows, batch_size, seconds):
+    db = db_class(db_path)
+    db.create_tables()
+    # Datos previos para que cada lectura tenga un coste realista
+    db.insert_rows([item_row(i) for i in range(n_rows)], [])
+
+    done = threading.Event()
+    write_latencies = []
+    read_latencies = []
+    errors = []
+
+    def writer():
+        index = n_rows
+        try:
+            while not done.is_set():
+                rows = [item_row(i) for i in range(index, index + batch_size)]
+                start = time.perf_counter()
+                db.insert_rows(rows, [])
+                write_latencies.append(time.perf_counter() - start)
+                index += batch_size
+        except sqlite3.Error as e:
+            errors.append(f"escritura: {e}")
+
+    def reader():
+        try:
+            while not done.is_set():
+                start = time.perf_counter()
+                df_items, _ = db.get_all_data()
+                if df_items.empty:
+                    errors.append("lectura: resultado vacío")
+                read_latencies.append(time.perf_counter() - start)
+        except sqlite3.Error as e:
+            errors.append(f"lectura: {e}")
+
+    threads = [threading.Thread(target=writer), threading.Thread(target=reader)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    done.set()
+    for thread in threads:
+        thread.join()
+    db.close()
+    return write_latencies, read_latencies, errors
+
+def describe(label, latencies, seconds):
+    if not latencies:
+        return f"{label}: ninguna operación completada"
+    ordered = sorted(latencies)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return (f"{label}: {len(latencies) / seconds:7.1f} op/s  mediana {statistics.median(latencies) * 1000:7.1f} ms  "
+            f"p95 {p95 * 1000:7.1f} ms  máx {ordered[-1] * 1000:7.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de escrituras y lecturas concurrentes")
+    parser.add_argument("--rows", type=int, default=200000, help="Artículos iniciales en la base de datos")
+    parser.add_argument("--batch-size", type=int, default=500, help="Filas por lote de escritura")
+    parser.add_argument("--seconds", type=float, default=10, help="Duración de cada prueba")
+    args = parser.parse_args()
+
+    status = 0
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for label, db_class in (("anterior", LegacyDatabaseManager), ("gestionada", DatabaseManager)):
+            writes, reads, errors = run(db_class, os.path.join(tmp_dir, f"{label}.db"), args.rows,
+                                        args.batch_size, args.seconds)
+            print(f"--- Conexión {label} ---")
+            print("  " + describe("escrituras", writes, args.seconds))
+            print("  " + describe("lecturas  ", reads, args.seconds))
+            # Cada lectura devuelve toda la tabla: con más escrituras, cada lectura lee más filas
+            print(f"  filas escritas durante la prueba: {len(writes) * args.batch_size}")
+            for error in errors[:5]:
+                print(f"  ❌ {error}")
+            status |= bool(errors) and db_class is DatabaseManager
+    return int(status)
+
+if __name__ == "__main__":
+    sys.exit(main())
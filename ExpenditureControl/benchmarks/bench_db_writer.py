@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# bench_db_writer.py - Escritura de lotes en el hilo de análisis frente al DatabaseWriter
+#
+# Simula una ingesta de --rows artículos en lotes de --batch-size filas. Por cada lote el
+# hilo principal espera --parse-ms milisegundos, como cuando espera los resultados de los
+# procesos del pool, y después guarda el lote: directamente con insert_rows (como antes)
+# o enviándolo a un DatabaseWriter. Informa del tiempo total, del tiempo que el análisis
+# ha estado parado esperando a la base de datos y comprueba que se guarda lo mismo.
+# Uso: python benchmarks/bench_db_writer.py [--rows 300000] [--batch-size 500] [--parse-ms 5]
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from bench_db_concurrency import item_row
+from ExpenditureControl import WRITER_QUEUE_SIZE, DatabaseManager, DatabaseWriter, RunMetrics
+
+def ingest(db, n_rows, batch_size, parse_seconds, queue_size=None):
+    """Devuelve (segundos totales, segundos esperando a la base de datos, transacciones)."""
+    metrics = RunMetrics("bench")
+    writer = DatabaseWriter(db, queue_size=queue_size, metrics=metrics) if queue_size else None
+    waited = 0.0
+    start = time.perf_counter()
+    for first in range(0, n_rows, batch_size):
+        time.sleep(parse_seconds)
+        rows = [item_row(index) for index in range(first, min(first + batch_size, n_rows))]
+        wait_start = time.perf_counter()
+        if writer is None:
+            with metrics.stage("insert"):
+                db.insert_rows(rows, [])
+        else:
+            writer.submit(rows, [])
+        waited += time.perf_counter() - wait_start
+    if writer is not None:
+        wait_start = time.perf_counter()
+        writer.close()
+        waited += time.perf_counter() - wait_start
+    return time.perf_counter() - start, waited, metrics.stages["insert"]["calls"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del hilo escritor de la base de datos")
+    parser.add_argument("--rows", type=int, default=300_000, help="Artículos a insertar")
+    parser.add_argument("--batch-size", type=int, default=500, help="Filas por lote del análisis")
+    parser.add_argument("--parse-ms", type=float, default=5.0, help="Milisegundos de análisis por lote")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    status = 0
+    counts = set()
+    modes = [("directo", None), (f"hilo escritor, cola de {WRITER_QUEUE_SIZE}", WRITER_QUEUE_SIZE),
+             ("hilo escritor, cola de 1", 1)]
+    for index, (label, queue_size) in enumerate(modes):
+        db = DatabaseManager(os.path.join(tmp_dir, f"bench_db_writer_{index}.db"))
+        db.create_tables()
+        seconds, waited, commits = ingest(db, args.rows, args.batch_size, args.parse_ms / 1000, queue_size)
+        counts.add(db.count_items())
+        if db.check_rollups():
+            print(f"❌ {label}: las tablas resumen no coinciden")
+            status = 1
+        db.close()
+        print(f"{label:<26} {seconds:7.2f} s  ({args.rows / seconds:9,.0f} artículos/s)  "
+              f"análisis parado {waited:6.2f} s  {commits:5,} transacciones")
+
+    if counts != {args.rows}:
+        print(f"❌ Artículos guardados: {sorted(counts)}")
+        status = 1
+    else:
+        print("✅ Mismos artículos en todos los modos")
+    for name in os.listdir(tmp_dir):
+        os.remove(os.path.join(tmp_dir, name))
+    os.rmdir(tmp_dir)
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
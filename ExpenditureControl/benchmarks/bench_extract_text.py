@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# bench_extract_text.py - Micro-benchmark del escáner de líneas de extract_data_from_text
+#
+# Extrae una sola vez el texto de los PDFs de muestra y compara la versión anterior
+# del escáner (tres pasadas y regex recompiladas en cada llamada) con la actual.
+# Uso: python benchmarks/bench_extract_text.py [--samples DIR] [--repeat N]
+
+import argparse
+import glob
+import os
+import re
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import pdfplumber
+from ExpenditureControl import PDFInvoiceProcessor
+
+DEFAULT_SAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "assets", "samples")
+
+def legacy_extract_data_from_text(text, filename):
+    """Copia del escáner anterior, solo como referencia para el benchmark."""
+    items_data = []
+    totals_data = []
+    invoice_date = None
+    invoice_number = None
+
+    lines = text.split('\n')
+
+    for line in lines:
+        if 'Nº factura' in line:
+            invoice_match = re.search(r'Nº factura\s+(\S+)', line)
+            if invoice_match:
+                invoice_number = invoice_match.group(1).strip()
+                break
+
+    for line in lines:
+        if 'Fecha' in line:
+            date_match = re.search(r'Fecha\s+(\d{2}\.\d{2}\.\d{4})', line)
+            if date_match:
+                try:
+                    invoice_date = datetime.strptime(date_match.group(1), '%d.%m.%Y')
+                    break
+                except ValueError:
+                    invoice_date = None
+
+    item_pattern = re.compile(r'^\s*(\d{13,})\s+(\S+)\s+(\d+)\s+([\d,.-]+)\s+(\S+)\s+([\d,.-]+)\s+([\d,.-]+)\s+([\d,.-]+)$')
+    description_pattern = re.compile(r'^(?!Nº pedido Oficina)(?!Albarán)(?!Dirección de envío)(?!WURTH)\s+(.*)$')
+    total_pattern = re.compile(r'^\s*([\d,]+)\s+([\d,]+)\s+([\d,]+%)\s+([\d,]+)\s+([\d,]+)$')
+
+    for i, line in enumerate(lines):
+        line = line.strip()
+
+        item_match = item_pattern.search(line)
+        if item_match:
+            item_data = list(item_match.groups())
+            description_found = False
+            for j in range(1, 3):
+                if i + j < len(lines):
+                    next_line = lines[i + j].strip()
+                    description_match = description_pattern.search(next_line)
+                    if description_match:
+                        description = description_match.group(1).strip()
+                        if description and '€' not in description:
+                            item_data.append(description)
+                            description_found = True
+                            break
+
+            if not description_found:
+                item_data.append("Descripción no encontrada")
+
+            items_data.append(item_data)
+            continue
+
+        total_match = total_pattern.search(line)
+        if total_match:
+            totals_data.append(list(total_match.groups()))
+
+    for item in items_data:
+        item.extend([invoice_number, invoice_date])
+
+    for total in totals_data:
+        total.extend([invoice_number, invoice_date])
+
+    return items_data, totals_data, invoice_date, invoice_number
+
+def load_page_texts(samples_dir):
+    pdf_files = sorted(set(glob.glob(os.path.join(samples_dir, "*.pdf")) + glob.glob(os.path.join(samples_dir, "*.PDF"))))
+    texts = []
+    for pdf_file in pdf_files:
+        with pdfplumber.open(pdf_file) as pdf:
+            for page in pdf.pages:
+                texts.append((os.path.basename(pdf_file), page.extract_text()))
+    return pdf_files, texts
+
+def time_scanner(scanner, texts, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for filename, text in texts:
+            scanner(text, filename)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del escáner de texto de facturas")
+    parser.add_argument("--samples", default=DEFAULT_SAMPLES, help="Directorio con PDFs de muestra")
+    parser.add_argument("--repeat", type=int, default=2000, help="Repeticiones sobre todas las páginas")
+    args = parser.parse_args()
+
+    pdf_files, texts = load_page_texts(args.samples)
+    if not texts:
+        print(f"❌ No se encontraron PDFs en {args.samples}")
+        return 1
+
+    processor = PDFInvoiceProcessor()
+    for filename, text in texts:
+        if processor.extract_data_from_text(text, filename) != legacy_extract_data_from_text(text, filename):
+            print(f"❌ Resultado distinto en {filename}")
+            return 1
+
+    n_lines = sum(text.count('\n') + 1 for _, text in texts) * args.repeat
+    legacy_time = time_scanner(legacy_extract_data_from_text, texts, args.repeat)
+    current_time = time_scanner(processor.extract_data_from_text, texts, args.repeat)
+
+    print(f"PDFs: {len(pdf_files)}  páginas: {len(texts)}  líneas escaneadas: {n_lines}")
+    print(f"Escáner anterior: {n_lines / legacy_time:,.0f} líneas/s")
+    print(f"Escáner actual:   {n_lines / current_time:,.0f} líneas/s")
+    print(f"Mejora: x{legacy_time / current_time:.2f} (resultados idénticos)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# bench_extraction_engines.py - Compara los motores de extracción de texto por plantilla
+#
+# Para cada plantilla de INVOICE_TEMPLATES mide páginas/s frente a page.extract_text()
+# de pdfplumber y comprueba que extract_data_from_text obtiene los mismos datos.
+# Uso: python benchmarks/bench_extraction_engines.py [--samples DIR] [--template NOMBRE]
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from ExpenditureControl import INVOICE_TEMPLATES, PDFInvoiceProcessor, iter_page_texts, list_pdf_files
+
+DEFAULT_SAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "assets", "samples")
+
+def run_engine(pdf_files, template):
+    """Extrae y analiza todas las páginas; devuelve (segundos, páginas, resultados por página)."""
+    processor = PDFInvoiceProcessor()
+    results = []
+    start = time.perf_counter()
+    for pdf_file in pdf_files:
+        filename = os.path.basename(pdf_file)
+        for page_index, page_count, text in iter_page_texts(pdf_file, template=template):
+            results.append((filename, page_index, processor.extract_data_from_text(text, filename)))
+    return time.perf_counter() - start, len(results), results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de los motores de extracción de texto")
+    parser.add_argument("--samples", default=DEFAULT_SAMPLES, help="Directorio con PDFs de muestra")
+    parser.add_argument("--template", action="append", choices=sorted(INVOICE_TEMPLATES),
+                        help="Plantilla a comparar (por defecto todas)")
+    args = parser.parse_args()
+
+    pdf_files = list_pdf_files(args.samples)
+    if not pdf_files:
+        print(f"❌ No se encontraron PDFs en {args.samples}")
+        return 1
+
+    base_time, n_pages, base_results = run_engine(pdf_files, None)
+    print(f"PDFs: {len(pdf_files)}  páginas: {n_pages}")
+    print(f"{'pdfplumber (genérica)':<28} {n_pages / base_time:8.1f} páginas/s")
+
+    status = 0
+    for template in args.template or sorted(INVOICE_TEMPLATES):
+        engine = INVOICE_TEMPLATES[template]["engine"]
+        elapsed, _, results = run_engine(pdf_files, template)
+        differences = [(filename, page) for (filename, page, data), (_, _, expected) in zip(results, base_results)
+                       if data != expected]
+        if len(results) != len(base_results):
+            differences.append(("número de páginas", len(results)))
+
+        label = f"{template} ({engine})"
+        print(f"{label:<28} {n_pages / elapsed:8.1f} páginas/s  x{base_time / elapsed:.2f}  "
+              f"{'resultados idénticos' if not differences else f'{len(differences)} páginas distintas'}")
+        for filename, page in differences[:10]:
+            print(f"   ❌ {filename} página {page}")
+        if differences:
+            status = 1
+
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
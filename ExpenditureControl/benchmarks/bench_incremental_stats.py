@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# bench_incremental_stats.py - Estadísticas incrementales frente a recalcularlas enteras
+#
+# Sobre una base de datos de --rows artículos (ver bench_snapshot.py), para las
+# estadísticas recorriendo los artículos (stats --no-rollups) y con un filtro de fechas:
+# 1. Primer cálculo con StatisticsCache vacía (recorre todo y guarda los agregados).
+# 2. Añade --append-rows artículos y sus facturas, como una ingesta, y mide el cálculo
+#    incremental (solo las filas nuevas, combinadas con los agregados guardados) frente
+#    al cálculo completo, y comprueba con statistics_differences que coinciden.
+# 3. Borra unos artículos (una reescritura): el siguiente cálculo recorre todo otra vez.
+# Uso: python benchmarks/bench_incremental_stats.py [--rows 2000000] [--append-rows 2000] [--keep DIR]
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from bench_db_concurrency import item_row
+from bench_snapshot import build_database
+
+from ExpenditureControl import DatabaseManager, PDFInvoiceProcessor, RunMetrics, StatisticsCache, \
+    cached_statistics, load_statistics, statistics_differences
+
+FILTERS = {
+    "sin filtros (--no-rollups)": {},
+    "desde 2020-01-01": {"start_date": "2020-01-01"},
+}
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+def new_rows(first, n_rows):
+    """Artículos y totales de facturas nuevas (números que no existen en la base de datos generada)."""
+    items = [(str(4900000000 + (first + index) // 10),) + item_row(first + index)[1:] for index in range(n_rows)]
+    invoices = sorted({row[0] for row in items})
+    totals = [(number, "2024-01-15", 0, 3500, 21.0, 735, 4235) for number in invoices]
+    return items, totals
+
+def incremental(db, cache, filters):
+    processor = PDFInvoiceProcessor(metrics=RunMetrics("stats"))
+    stats = cached_statistics(db, processor, cache, use_rollups=False, **filters)
+    return stats, processor.metrics.counters
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de las estadísticas incrementales")
+    parser.add_argument("--rows", type=int, default=2_000_000, help="Artículos de la base de datos")
+    parser.add_argument("--append-rows", type=int, default=2000, help="Artículos añadidos en cada ingesta")
+    parser.add_argument("--keep", metavar="DIR", help="Directorio donde dejar la base de datos")
+    args = parser.parse_args()
+    warnings.simplefilter("ignore")
+
+    tmp_dir = args.keep or tempfile.mkdtemp()
+    os.makedirs(tmp_dir, exist_ok=True)
+    db_path = os.path.join(tmp_dir, "bench_incremental_stats.db")
+    if not os.path.exists(db_path):
+        seconds, _ = timed(lambda: build_database(db_path, args.rows))
+        print(f"Base de datos con {args.rows:,} artículos generada en {seconds:.1f} s")
+    cache_path = os.path.join(tmp_dir, "stats_cache.db")
+    if os.path.exists(cache_path):
+        os.remove(cache_path)
+
+    db = DatabaseManager(db_path)
+    cache = StatisticsCache(cache_path)
+    status = 0
+    for label, filters in FILTERS.items():
+        seconds, _ = timed(lambda: incremental(db, cache, filters))
+        print(f"{label}: primer cálculo {seconds:.2f} s")
+
+    first = 10 * args.rows
+    for step in ("ingesta 1", "ingesta 2", "tras borrar 10 artículos"):
+        if step.startswith("tras"):
+            with db.write_transaction() as cursor:
+                cursor.execute("DELETE FROM items WHERE id IN (SELECT id FROM items ORDER BY id LIMIT 10)")
+        else:
+            db.insert_rows(*new_rows(first, args.append_rows))
+            first += args.append_rows
+        for label, filters in FILTERS.items():
+            incremental_time, (stats, counters) = timed(lambda: incremental(db, cache, filters))
+            full_time, expected = timed(lambda: load_statistics(db, PDFInvoiceProcessor(), use_rollups=False, **filters))
+            differences = statistics_differences(expected, stats)
+            status |= bool(differences)
+            mode = "incremental" if counters.get("incremental_statistics") else "completo"
+            print(f"{step:<25} {label:<27} {mode:<11} {incremental_time:6.2f} s "
+                  f"({counters.get('statistics_rows', 0):>9,} filas)  completo {full_time:6.2f} s  "
+                  f"{'✅ iguales' if not differences else f'❌ {len(differences)} diferencias'}")
+    db.close()
+    if not args.keep:
+        shutil.rmtree(tmp_dir)
+    return int(status)
+
+if __name__ == "__main__":
+    sys.exit(main())
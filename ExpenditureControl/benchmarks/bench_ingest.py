@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# bench_ingest.py - Benchmark de la ingesta completa de PDFs (extracción + base de datos)
+#
+# Genera (o reutiliza) un corpus de facturas sintéticas, lo procesa con
+# stream_pdf_directory sobre una base de datos temporal e informa de ficheros/s,
+# páginas/s, filas/s, memoria máxima y tiempo de escritura en la base de datos.
+# Con --save-baseline guarda el resultado; con --baseline lo compara y termina con
+# código 1 si el rendimiento empeora más que la tolerancia.
+# Uso: python benchmarks/bench_ingest.py --files 1000 --items 20 --workers 4
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from ExpenditureControl import INVOICE_TEMPLATES, DatabaseManager, PDFInvoiceProcessor, RunMetrics
+from synthetic_invoices import generate_corpus
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ingest_baseline.json")
+
+# Métricas en las que un valor mayor es mejor
+THROUGHPUT_METRICS = ("files_per_s", "pages_per_s", "rows_per_s")
+
+def peak_rss_mb(who):
+    """Memoria residente máxima en MB (ru_maxrss está en KB en Linux y en bytes en macOS)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def run_benchmark(corpus_dir, n_files, pages_per_invoice, workers, template, batch_size):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Una ruta absoluta como nombre hace que DatabaseManager no use la carpeta de la aplicación
+        db = DatabaseManager(os.path.join(tmp_dir, "bench.db"))
+        db.create_tables()
+
+        with RunMetrics("bench_ingest") as metrics:
+            processor = PDFInvoiceProcessor(template=template, metrics=metrics)
+            saved_items, saved_totals = processor.stream_pdf_directory(corpus_dir, db, workers=workers, batch_size=batch_size)
+        elapsed = metrics.duration
+        db.close()
+
+    rows = saved_items + saved_totals
+    return {
+        "files": n_files,
+        "pages": n_files * pages_per_invoice,
+        "rows": rows,
+        "failed_files": len(processor.failed_files),
+        "seconds": elapsed,
+        "files_per_s": n_files / elapsed,
+        "pages_per_s": n_files * pages_per_invoice / elapsed,
+        "rows_per_s": rows / elapsed,
+        "commit_seconds": metrics.stages.get("insert", {}).get("seconds", 0.0),
+        "stages": {name: stage["seconds"] for name, stage in metrics.stages.items()},
+        "peak_rss_mb": peak_rss_mb(resource.RUSAGE_SELF) if resource else None,
+        "workers_peak_rss_mb": peak_rss_mb(resource.RUSAGE_CHILDREN) if resource else None,
+    }
+
+def compare_with_baseline(result, baseline, tolerance):
+    """Imprime la comparación y devuelve True si no hay regresiones."""
+    if baseline["params"] != result["params"]:
+        print(f"⚠️  La referencia usa otros parámetros ({baseline['params']}); no se compara.")
+        return True
+
+    ok = True
+    for metric in THROUGHPUT_METRICS:
+        ratio = result[metric] / baseline[metric]
+        regression = ratio < 1 - tolerance
+        ok &= not regression
+        print(f"{'❌' if regression else '✅'} {metric}: {result[metric]:,.1f} frente a {baseline[metric]:,.1f} (x{ratio:.2f})")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de ingesta de facturas PDF")
+    parser.add_argument("--files", type=int, default=200, help="Número de facturas sintéticas")
+    parser.add_argument("--items", type=int, default=10, help="Artículos por factura")
+    parser.add_argument("--pages", type=int, default=1, help="Páginas por factura")
+    parser.add_argument("--workers", type=int, default=1, help="Procesos en paralelo")
+    parser.add_argument("--template", choices=sorted(INVOICE_TEMPLATES), help="Plantilla de extracción")
+    parser.add_argument("--batch-size", type=int, default=500, help="Filas por transacción")
+    parser.add_argument("--corpus", help="Directorio del corpus (por defecto uno temporal por parámetros)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Fichero JSON de referencia")
+    parser.add_argument("--save-baseline", action="store_true", help="Guarda este resultado como referencia")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Empeoramiento admitido (0.10 = 10%%)")
+    args = parser.parse_args()
+
+    corpus_dir = args.corpus or os.path.join(
+        tempfile.gettempdir(), f"expenditure_bench_{args.files}x{args.items}x{args.pages}")
+    start = time.perf_counter()
+    generate_corpus(corpus_dir, args.files, args.items, args.pages)
+    print(f"Corpus: {corpus_dir} ({time.perf_counter() - start:.1f} s para generarlo)")
+
+    result = run_benchmark(corpus_dir, args.files, args.pages, args.workers, args.template, args.batch_size)
+    result["params"] = {"files": args.files, "items": args.items, "pages": args.pages,
+                        "workers": args.workers, "template": args.template, "batch_size": args.batch_size}
+
+    print(f"Ficheros: {result['files']}  páginas: {result['pages']}  filas: {result['rows']}  "
+          f"errores: {result['failed_files']}")
+    print(f"Tiempo total: {result['seconds']:.2f} s  (escritura en BD {result['commit_seconds']:.2f} s)")
+    print("Etapas: " + "  ".join(f"{name} {seconds:.2f} s" for name, seconds in
+                                 sorted(result["stages"].items(), key=lambda item: -item[1])))
+    print(f"{result['files_per_s']:,.1f} ficheros/s  {result['pages_per_s']:,.1f} páginas/s  "
+          f"{result['rows_per_s']:,.1f} filas/s")
+    if result["peak_rss_mb"] is not None:
+        print(f"Memoria máxima: {result['peak_rss_mb']:.1f} MB (procesos del pool: {result['workers_peak_rss_mb']:.1f} MB)")
+
+    status = 0
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"💾 Referencia guardada en {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            status = 0 if compare_with_baseline(result, json.load(f), args.tolerance) else 1
+
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
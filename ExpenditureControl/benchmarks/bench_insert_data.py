@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# bench_insert_data.py - Compara DatabaseManager.insert_data con la inserción fila a fila anterior
+#
+# Genera DataFrames sintéticos con las columnas de create_dataframes, los inserta con la
+# versión anterior (to_dict('records') + un execute por fila) y con la actual, informa de
+# filas/s y comprueba que las tablas resultantes son idénticas.
+# Uso: python benchmarks/bench_insert_data.py [--rows 500000] [--batch-size N] [--skip-legacy]
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import numpy as np
+import pandas as pd
+
+from ExpenditureControl import INSERT_BATCH_SIZE, PRODUCT_INSERT_SQL, DatabaseManager
+
+def make_frames(n_items, seed=0):
+    rng = np.random.default_rng(seed)
+    n_invoices = max(1, n_items // 10)
+    invoice_numbers = np.array([str(4700000000 + i) for i in range(n_invoices)], dtype=object)
+    invoice_dates = pd.to_datetime("2023-01-01") + pd.to_timedelta(rng.integers(0, 730, n_invoices), unit="D")
+    invoice_of_item = rng.integers(0, n_invoices, n_items)
+    item_dates = pd.Series(invoice_dates[invoice_of_item])
+    # Algunas fechas vacías, como las páginas sin "Fecha"
+    item_dates[rng.random(n_items) < 0.01] = pd.NaT
+
+    df_items = pd.DataFrame({
+        "Nº Artículo": [f"{n:013d}" for n in rng.integers(10**12, 10**13, n_items)],
+        "Posición": rng.integers(1, 50, n_items).astype(str),
+        "Cantidad": rng.integers(1, 100, n_items).astype(float),
+        "Precio Unitario (EUR)": rng.integers(5, 20000, n_items),
+        "Código Producto": "1",
+        "Descuento %": 0.0,
+        "IVA %": 21.0,
+        "Valor Neto (EUR)": rng.integers(5, 200000, n_items),
+        "Descripción": "Descripción no encontrada",
+        "Nº Factura": invoice_numbers[invoice_of_item],
+        "Fecha Factura": item_dates,
+    })
+    df_totals = pd.DataFrame({
+        "Portes (EUR)": 0,
+        "Valor Neto (EUR)": rng.integers(100, 1000000, n_invoices),
+        "IVA %": 21.0,
+        "Importe IVA (EUR)": rng.integers(21, 210000, n_invoices),
+        "Importe Total (EUR)": rng.integers(121, 1210000, n_invoices),
+        "Nº Factura": invoice_numbers,
+        "Fecha Factura": invoice_dates,
+    })
+    return df_items, df_totals
+
+def legacy_insert_data(db, df_items, df_totals):
+    """Copia de DatabaseManager.insert_data antes de la inserción por lotes (con la tabla products)."""
+    conn = sqlite3.connect(db.db_path)
+    cursor = conn.cursor()
+
+    for item in df_items.to_dict('records'):
+        invoice_date_ts = item.get('Fecha Factura')
+        if pd.isna(invoice_date_ts):
+            invoice_date_str = None
+        else:
+            invoice_date_str = invoice_date_ts.strftime('%Y-%m-%d')
+
+        cursor.execute(PRODUCT_INSERT_SQL, (item.get('Código Producto'), item.get('Descripción')))
+        cursor.execute("""
+            INSERT OR REPLACE INTO items (
+                invoice_number, invoice_date, item_number, position, quantity,
+                unit_price, product_id, discount, iva, net_value
+            ) VALUES (?1, ?2, ?3, ?4, ?5, ?6, (SELECT id FROM products WHERE product_code IS ?7 AND description IS ?11),
+                      ?8, ?9, ?10)
+        """, (
+            item.get('Nº Factura'), invoice_date_str, item.get('Nº Artículo'),
+            item.get('Posición'), item.get('Cantidad'), item.get('Precio Unitario (EUR)'),
+            item.get('Código Producto'), item.get('Descuento %'), item.get('IVA %'),
+            item.get('Valor Neto (EUR)'), item.get('Descripción')
+        ))
+
+    for total in df_totals.to_dict('records'):
+        invoice_date_ts = total.get('Fecha Factura')
+        if pd.isna(invoice_date_ts):
+            invoice_date_str = None
+        else:
+            invoice_date_str = invoice_date_ts.strftime('%Y-%m-%d')
+
+        cursor.execute("""
+            INSERT OR IGNORE INTO invoices (
+                invoice_number, invoice_date, ports, net_value, iva, iva_amount, total_amount
+            ) VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (
+            total.get('Nº Factura'), invoice_date_str, total.get('Portes (EUR)'),
+            total.get('Valor Neto (EUR)'), total.get('IVA %'), total.get('Importe IVA (EUR)'),
+            total.get('Importe Total (EUR)')
+        ))
+
+    conn.commit()
+    conn.close()
+
+def table_contents(db):
+    conn = sqlite3.connect(db.db_path)
+    contents = (
+        conn.execute("SELECT * FROM items ORDER BY id").fetchall(),
+        conn.execute("SELECT * FROM products ORDER BY id").fetchall(),
+        conn.execute("SELECT * FROM invoices ORDER BY id").fetchall(),
+    )
+    conn.close()
+    return contents
+
+def run(tmp_dir, name, insert, df_items, df_totals):
+    db = DatabaseManager(os.path.join(tmp_dir, name))
+    db.create_tables()
+    start = time.perf_counter()
+    insert(db)
+    elapsed = time.perf_counter() - start
+    db.close()
+    rows = len(df_items) + len(df_totals)
+    print(f"{name:<10} {elapsed:8.2f} s  {rows / elapsed:12,.0f} filas/s")
+    return elapsed, table_contents(db)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de DatabaseManager.insert_data")
+    parser.add_argument("--rows", type=int, default=500000, help="Artículos a insertar (más un 10%% de totales)")
+    parser.add_argument("--batch-size", type=int, default=INSERT_BATCH_SIZE, help="Filas por executemany")
+    parser.add_argument("--skip-legacy", action="store_true", help="No ejecuta la versión fila a fila")
+    args = parser.parse_args()
+
+    df_items, df_totals = make_frames(args.rows)
+    print(f"Artículos: {len(df_items)}  totales: {len(df_totals)}")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        new_time, new_contents = run(tmp_dir, "bulk.db", lambda db: db.insert_data(df_items, df_totals, batch_size=args.batch_size),
+                                     df_items, df_totals)
+        if args.skip_legacy:
+            return 0
+
+        legacy_time, legacy_contents = run(tmp_dir, "legacy.db", lambda db: legacy_insert_data(db, df_items, df_totals),
+                                           df_items, df_totals)
+        print(f"Mejora: x{legacy_time / new_time:.2f}")
+        if new_contents != legacy_contents:
+            print("❌ Las tablas resultantes son distintas")
+            return 1
+        print("✅ Tablas idénticas")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
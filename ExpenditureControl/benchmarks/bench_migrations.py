@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# bench_migrations.py - Tiempo de las migraciones del esquema sobre una base de datos grande
+#
+# Crea una base de datos en la versión 0 del esquema (sin clave natural ni índices) con
+# --rows artículos, un 5 % de ellos repetidos como tras procesar dos veces los mismos PDFs,
+# mide DatabaseManager.migrate() y después la reescritura completa de items con
+# rebuild_table para cada tamaño de lote, que es lo que cuesta una migración que cambia
+# el tipo de una columna.
+# Uso: python benchmarks/bench_migrations.py [--rows 10000000] [--batch-size N ...] [--keep DIR]
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from ExpenditureControl import MIGRATION_BATCH_SIZE, SCHEMA_MIGRATIONS, DatabaseManager, rebuild_table
+
+ITEM_COLUMNS = ["id", "invoice_number", "invoice_date", "item_number", "position", "quantity", "unit_price",
+                "product_id", "discount", "iva", "net_value"]
+
+# Cada fila n usa la clave de n - 1 cuando n es múltiplo de 20: un 5 % de duplicados
+GENERATE_ITEMS = """
+    WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < ?),
+    keys(n, k) AS (SELECT n, CASE WHEN n % 20 = 0 THEN n - 1 ELSE n END FROM seq)
+    INSERT INTO items (invoice_number, invoice_date, item_number, position, quantity, unit_price,
+                       product_code, discount, iva, net_value, description)
+    SELECT CAST(4700000000 + k / 10 AS TEXT), date('2023-01-01', '+' || (k / 10 % 730) || ' days'),
+           printf('%013d', k * 7919 % 10000000000000), k % 10 + 1, n % 50 + 1, (n % 20000) / 100.0,
+           '1', 0, 21, (n % 50 + 1) * (n % 20000) / 100.0, 'Descripción no encontrada'
+    FROM keys
+"""
+
+def build_version_zero(db_path, n_rows):
+    """Base de datos con el esquema inicial, sin aplicar ninguna migración."""
+    db = DatabaseManager(db_path)
+    db.create_tables(migrate=False)
+    db.close()
+
+    conn = sqlite3.connect(db_path)
+    conn.execute(GENERATE_ITEMS, (n_rows,))
+    conn.commit()
+    conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de las migraciones del esquema")
+    parser.add_argument("--rows", type=int, default=10_000_000, help="Artículos de la base de datos")
+    parser.add_argument("--batch-size", type=int, action="append",
+                        help=f"Filas por sentencia en rebuild_table (por defecto {MIGRATION_BATCH_SIZE})")
+    parser.add_argument("--keep", metavar="DIR", help="Directorio donde dejar la base de datos generada")
+    args = parser.parse_args()
+
+    tmp_dir = args.keep or tempfile.mkdtemp()
+    db_path = os.path.join(tmp_dir, "bench_migrations.db")
+    if os.path.exists(db_path):
+        os.remove(db_path)
+
+    start = time.perf_counter()
+    build_version_zero(db_path, args.rows)
+    print(f"Base de datos v0 con {args.rows:,} artículos generada en {time.perf_counter() - start:.1f} s "
+          f"({os.path.getsize(db_path) / 2**20:,.0f} MB)")
+
+    db = DatabaseManager(db_path)
+    start = time.perf_counter()
+    version = db.migrate()
+    elapsed = time.perf_counter() - start
+    print(f"migrate() hasta la versión {version} ({len(SCHEMA_MIGRATIONS)} migraciones): {elapsed:.1f} s "
+          f"({args.rows / elapsed:,.0f} filas/s)")
+
+    with db.read_connection() as conn:
+        n_items = conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+        create_sql = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'items'").fetchone()[0]
+        index_sqls = [row[0] for row in conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'items' AND sql IS NOT NULL")]
+    print(f"Artículos tras la migración: {n_items:,}")
+
+    # Tras una migración que reescribe la tabla, sqlite_master guarda el nombre entre comillas
+    create_template = create_sql.replace('"items"', "items", 1).replace("CREATE TABLE items", "CREATE TABLE {table}", 1)
+    for batch_size in args.batch_size or [MIGRATION_BATCH_SIZE]:
+        start = time.perf_counter()
+        with db.write_transaction() as cursor:
+            copied = rebuild_table(cursor, "items", create_template, ITEM_COLUMNS, batch_size=batch_size)
+            copy_time = time.perf_counter() - start
+            # Como en una migración real: los índices se vuelven a crear sobre la tabla nueva
+            for index_sql in index_sqls:
+                cursor.execute(index_sql)
+        elapsed = time.perf_counter() - start
+        print(f"rebuild_table(items) con lotes de {batch_size:,}: {elapsed:.1f} s ({copied / elapsed:,.0f} filas/s; "
+              f"copia {copy_time:.1f} s, índices {elapsed - copy_time:.1f} s)")
+
+    db.close()
+    if not args.keep:
+        os.remove(db_path)
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+        os.rmdir(tmp_dir)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# bench_money.py - Importes en céntimos enteros frente a euros en coma flotante
+#
+# Genera --rows importes con el formato de las facturas ("1234,56") agrupados en
+# facturas de --items-per-invoice líneas y mide:
+# 1. La conversión de los textos: parse_decimal (float en euros) frente a parse_cents, y
+#    la de una columna como en create_dataframes. Comprueba también los casos límite
+#    (abonos con el signo detrás, "12,50-") y que los importes no válidos lanzan ValueError.
+# 2. La exactitud: la suma de todos los importes y cuántas facturas no cuadran (la suma de
+#    sus líneas distinta del importe de la factura) en float y en céntimos, frente al
+#    resultado exacto con Decimal.
+# 3. La suma total y por mes con NumPy/pandas en float64 y en int64.
+# Uso: python benchmarks/bench_money.py [--rows 2000000] [--items-per-invoice 12]
+
+import argparse
+import os
+import sys
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import numpy as np
+import pandas as pd
+
+from synthetic_invoices import format_amount
+from ExpenditureControl import cents_column, parse_cents, parse_decimal
+
+# Importes con su valor en céntimos, y los que parse_cents debe rechazar
+EDGE_CASES = {"12,50-": -1250, "-20,5": -2050, "+3,005": 301, "7": 700, " 12,34 ": 1234}
+INVALID_AMOUNTS = ("-", "", "12,50x", "-12,50-", "1_0,00", ",50")
+
+def check_edge_cases():
+    """Errores de parse_cents en los casos límite (lista vacía si no hay ninguno)."""
+    errors = [f"{text!r} -> {parse_cents(text)} (esperado {cents})"
+              for text, cents in EDGE_CASES.items() if parse_cents(text) != cents]
+    for text in INVALID_AMOUNTS:
+        try:
+            errors.append(f"{text!r} -> {parse_cents(text)} (esperado ValueError)")
+        except ValueError:
+            pass
+    return errors
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de los importes en céntimos")
+    parser.add_argument("--rows", type=int, default=2_000_000, help="Importes generados")
+    parser.add_argument("--items-per-invoice", type=int, default=12, help="Líneas por factura")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    cents = rng.integers(-2_000, 2_000_000, args.rows)
+    texts = [format_amount(int(value)) for value in cents]
+    invoices = np.arange(args.rows) // args.items_per_invoice
+    months = pd.PeriodIndex(pd.to_datetime("2016-01-01") + pd.to_timedelta(invoices % 3650, unit="D"), freq="M")
+    status = 0
+
+    print(f"{args.rows:,} importes en {invoices[-1] + 1:,} facturas")
+    float_time, euros = timed(lambda: [parse_decimal(text) for text in texts])
+    cents_time, parsed = timed(lambda: [parse_cents(text) for text in texts])
+    # Lo que costaría obtener los céntimos pasando por float
+    rounded_time, _ = timed(lambda: [round(parse_decimal(text) * 100) for text in texts])
+    print(f"parse_decimal (float)        {float_time:6.2f} s  ({args.rows / float_time:11,.0f} importes/s)")
+    print(f"parse_cents (céntimos)       {cents_time:6.2f} s  ({args.rows / cents_time:11,.0f} importes/s)")
+    print(f"round(parse_decimal * 100)   {rounded_time:6.2f} s  ({args.rows / rounded_time:11,.0f} importes/s)")
+    column = pd.Series(texts, dtype=object)
+    float_time, _ = timed(lambda: column.str.replace(',', '.').astype(float))
+    cents_time, _ = timed(lambda: cents_column(column))
+    print(f"columna con str.replace + astype(float) {float_time:6.2f} s, con cents_column {cents_time:6.2f} s")
+    if parsed != cents.tolist():
+        print("❌ parse_cents no devuelve los céntimos generados")
+        status = 1
+    errors = check_edge_cases()
+    for error in errors:
+        print(f"❌ parse_cents: {error}")
+    if not errors:
+        print(f"✅ casos límite de parse_cents ({len(EDGE_CASES) + len(INVALID_AMOUNTS)})")
+    status |= bool(errors)
+
+    euros = np.array(euros)
+    parsed = np.array(parsed, dtype=np.int64)
+    exact = sum(Decimal(text.replace(',', '.')) for text in texts)
+    float_total = euros.sum()
+    cents_total = int(parsed.sum())
+    print(f"suma exacta (Decimal)   {exact}")
+    print(f"suma en float           {float_total:.10f}  (error {abs(Decimal(float_total) - exact):.3e} EUR)")
+    print(f"suma en céntimos        {Decimal(cents_total) / 100}  "
+          f"{'✅ exacta' if Decimal(cents_total) / 100 == exact else '❌ distinta'}")
+    status |= Decimal(cents_total) / 100 != exact
+
+    # El importe de cada factura se calcula aparte (como en su PDF) y se compara con la suma de sus líneas
+    invoice_cents = np.zeros(invoices[-1] + 1, dtype=np.int64)
+    np.add.at(invoice_cents, invoices, parsed)
+    invoice_euros = invoice_cents / 100
+    line_sums = pd.Series(euros).groupby(invoices).sum().to_numpy()
+    float_mismatches = int((line_sums != invoice_euros).sum())
+    cents_mismatches = int((pd.Series(parsed).groupby(invoices).sum().to_numpy() != invoice_cents).sum())
+    print(f"facturas que no cuadran: float {float_mismatches:,}, céntimos {cents_mismatches:,}")
+    status |= cents_mismatches != 0
+
+    repeat = 20
+    float_time, _ = timed(lambda: [euros.sum() for _ in range(repeat)])
+    cents_time, _ = timed(lambda: [parsed.sum() for _ in range(repeat)])
+    print(f"suma NumPy: float64 {float_time / repeat * 1000:7.2f} ms, int64 {cents_time / repeat * 1000:7.2f} ms")
+    float_time, by_month_euros = timed(lambda: pd.Series(euros).groupby(months).sum())
+    cents_time, by_month_cents = timed(lambda: pd.Series(parsed).groupby(months).sum())
+    drift = (by_month_euros * 100 - by_month_cents).abs().max()
+    print(f"suma por mes: float64 {float_time:6.3f} s, int64 {cents_time:6.3f} s "
+          f"(diferencia máxima {drift:.2e} céntimos)")
+    return int(status)
+
+if __name__ == "__main__":
+    sys.exit(main())
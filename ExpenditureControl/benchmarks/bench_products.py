@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# bench_products.py - Tabla de productos frente a código y descripción repetidos en items
+#
+# Crea una base de datos con --rows artículos de --products productos distintos en la
+# versión 2 del esquema (items con product_code y description), mide su tamaño y la
+# lectura de las columnas de estadísticas con la agrupación por descripción como antes
+# (cadenas), aplica la migración 3 y repite las medidas con query_items, que devuelve
+# la descripción como categoría. Comprueba que las agrupaciones coinciden.
+# Uso: python benchmarks/bench_products.py [--rows 2000000] [--products 5000] [--keep DIR]
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import pandas as pd
+
+from ExpenditureControl import SCHEMA_MIGRATIONS, STATS_ITEM_COLUMNS, DatabaseManager
+
+GENERATE_ITEMS = """
+    WITH RECURSIVE seq(n) AS (SELECT 0 UNION ALL SELECT n + 1 FROM seq WHERE n < ? - 1),
+    bought(n, k) AS (SELECT n, n * 7919 % ? FROM seq)
+    INSERT INTO items (invoice_number, invoice_date, item_number, position, quantity, unit_price,
+                       product_code, discount, iva, net_value, description)
+    SELECT CAST(4700000000 + n / 10 AS TEXT), date('2016-01-01', '+' || (n / 10 % 3650) || ' days'),
+           printf('%013d', k), n % 10 + 1, n % 50 + 1, (n % 20000) / 100.0, printf('%06d', k), 0, 21,
+           (n % 50 + 1) * (n % 20000) / 100.0, 'TORNILLO HEXAGONAL DIN 933 ZINCADO M' || (k % 30) || ' REF ' || k
+    FROM bought
+"""
+
+def database_size(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute("VACUUM")
+    conn.close()
+    return os.path.getsize(db_path) / 2**20
+
+def group_by_description(df):
+    grouped = df.groupby('Descripción', observed=True)['Valor Neto (EUR)'].agg(['sum', 'size'])
+    grouped.index = grouped.index.astype(object)
+    return grouped.sort_index()
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la tabla de productos")
+    parser.add_argument("--rows", type=int, default=2_000_000, help="Artículos de la base de datos")
+    parser.add_argument("--products", type=int, default=5000, help="Productos distintos")
+    parser.add_argument("--keep", metavar="DIR", help="Directorio donde dejar la base de datos")
+    args = parser.parse_args()
+
+    tmp_dir = args.keep or tempfile.mkdtemp()
+    os.makedirs(tmp_dir, exist_ok=True)
+    db_path = os.path.join(tmp_dir, "bench_products.db")
+    if os.path.exists(db_path):
+        os.remove(db_path)
+
+    # Versión 2: el esquema inicial con las dos primeras migraciones
+    db = DatabaseManager(db_path)
+    db.create_tables(migrate=False)
+    with db.write_transaction() as cursor:
+        cursor.execute(GENERATE_ITEMS, (args.rows, args.products))
+        for number, _, migration in SCHEMA_MIGRATIONS[:2]:
+            migration(cursor)
+            cursor.execute(f"PRAGMA user_version = {number}")
+    db.close()
+    size_before = database_size(db_path)
+
+    columns = ", ".join({"Nº Factura": "invoice_number", "Fecha Factura": "invoice_date", "Cantidad": "quantity",
+                         "Precio Unitario (EUR)": "unit_price", "Valor Neto (EUR)": "net_value",
+                         "Descripción": "description"}[column] + f' AS "{column}"' for column in STATS_ITEM_COLUMNS)
+    conn = sqlite3.connect(db_path)
+    read_before, df_before = timed(lambda: pd.read_sql_query(f"SELECT {columns} FROM items ORDER BY id", conn))
+    conn.close()
+    group_before, grouped_before = timed(lambda: group_by_description(df_before))
+    memory_before = df_before.memory_usage(deep=True).sum() / 2**20
+    del df_before
+
+    db = DatabaseManager(db_path)
+    migration_time, _ = timed(db.migrate)
+    db.close()
+    size_after = database_size(db_path)
+
+    db = DatabaseManager(db_path)
+    read_after, df_after = timed(lambda: db.query_items(columns=STATS_ITEM_COLUMNS))
+    group_after, grouped_after = timed(lambda: group_by_description(df_after))
+    memory_after = df_after.memory_usage(deep=True).sum() / 2**20
+    db.close()
+
+    print(f"{args.rows:,} artículos de {args.products:,} productos; migraciones 3 a {len(SCHEMA_MIGRATIONS)} "
+          f"en {migration_time:.1f} s")
+    print(f"{'':<22} {'cadenas':>10} {'productos':>10}")
+    print(f"{'base de datos (MB)':<22} {size_before:10,.0f} {size_after:10,.0f}")
+    print(f"{'lectura (s)':<22} {read_before:10.2f} {read_after:10.2f}")
+    print(f"{'DataFrame (MB)':<22} {memory_before:10,.0f} {memory_after:10,.0f}")
+    print(f"{'agrupación (s)':<22} {group_before:10.3f} {group_after:10.3f}")
+    # Tras la migración 6 los importes están en céntimos
+    same = grouped_before.index.equals(grouped_after.index) and (grouped_before['size'] == grouped_after['size']).all() \
+        and ((grouped_before['sum'] * 100 - grouped_after['sum']).abs() < 1e-3).all()
+    print("✅ Mismas agrupaciones" if same else "❌ Agrupaciones distintas")
+
+    if not args.keep:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+        os.rmdir(tmp_dir)
+    return int(not same)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# bench_queries.py - Carga de datos filtrada en SQL frente a get_all_data + filtro en pandas
+#
+# Crea una base de datos con --rows artículos sintéticos (ver bench_insert_data.py) y mide,
+# para cada caso, la carga completa con get_all_data seguida del filtro en pandas (como
+# antes de la API de consulta) y la misma selección con DatabaseManager.query_items.
+# Comprueba que ambas devuelven las mismas filas.
+# Uso: python benchmarks/bench_queries.py [--rows 1000000] [--repeat 3]
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from bench_insert_data import make_frames
+from ExpenditureControl import FORECAST_ITEM_COLUMNS, STATS_ITEM_COLUMNS, DatabaseManager
+
+def best_time(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la API de consulta filtrada")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Artículos de la base de datos")
+    parser.add_argument("--repeat", type=int, default=3, help="Repeticiones de cada medida (se toma la mejor)")
+    args = parser.parse_args()
+
+    df_items, df_totals = make_frames(args.rows)
+    invoice_sample = sorted(df_totals["Nº Factura"].sample(100, random_state=0))
+
+    def date_filter(df):
+        return df[(df["Fecha Factura"] >= "2024-03-01") & (df["Fecha Factura"] <= "2024-03-31")]
+
+    # (nombre, filtro en pandas sobre get_all_data, argumentos de query_items)
+    cases = [
+        ("todo, columnas de estadísticas", lambda df: df[list(STATS_ITEM_COLUMNS)],
+         {"columns": STATS_ITEM_COLUMNS}),
+        ("un mes, columnas de predicción", lambda df: date_filter(df)[list(FORECAST_ITEM_COLUMNS)],
+         {"columns": FORECAST_ITEM_COLUMNS, "start_date": "2024-03-01", "end_date": "2024-03-31"}),
+        ("100 facturas", lambda df: df[df["Nº Factura"].isin(invoice_sample)],
+         {"invoice_numbers": invoice_sample}),
+        ("un código de producto", lambda df: df[df["Código Producto"] == "1"].head(1000),
+         {"product_code": "1", "limit": 1000}),
+    ]
+
+    status = 0
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = DatabaseManager(os.path.join(tmp_dir, "bench_queries.db"))
+        db.create_tables()
+        db.insert_data(df_items, df_totals)
+        print(f"Artículos: {len(df_items):,}")
+
+        for name, pandas_filter, query in cases:
+            legacy_time, legacy = best_time(lambda: pandas_filter(db.get_all_data()[0]), args.repeat)
+            new_time, new = best_time(lambda: db.query_items(**query), args.repeat)
+            # El orden puede cambiar (con fechas se ordena por fecha): se comparan las filas
+            same = (list(new.columns) == list(legacy.columns) and len(new) == len(legacy)
+                    and sorted(map(tuple, new.astype(str).values)) == sorted(map(tuple, legacy.astype(str).values)))
+            status |= not same
+            print(f"{name:<32} filas {len(new):>9,}  get_all_data {legacy_time:7.3f} s  "
+                  f"query_items {new_time:7.3f} s  x{legacy_time / new_time:7.1f}  {'✅' if same else '❌ distintas'}")
+        db.close()
+    return int(status)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# bench_rollups.py - Estadísticas desde las tablas resumen frente a recorrer items
+#
+# 1. Coste de los triggers en la escritura: insert_data de --insert-rows artículos
+#    sintéticos con y sin los triggers de las tablas resumen.
+# 2. Sobre una base de datos de --rows artículos (ver bench_chunked_reads.py): tiempo de
+#    rollup_statistics frente a generate_statistics por trozos, que deben coincidir, y
+#    de rebuild_rollups y check_rollups.
+# Uso: python benchmarks/bench_rollups.py [--rows 5000000] [--insert-rows 300000] [--keep DIR]
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import warnings
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from bench_chunked_reads import GENERATE_INVOICES, GENERATE_ITEMS, GENERATE_PRODUCTS
+from bench_insert_data import make_frames
+import numpy as np
+import pandas as pd
+
+from ExpenditureControl import DatabaseManager, PDFInvoiceProcessor, create_rollup_triggers, fill_rollups, \
+    load_statistics
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+def same_statistics(raw, rollup):
+    """Compara dos diccionarios de estadísticas; las sumas en coma flotante pueden variar en el último bit."""
+    if list(raw) != list(rollup):
+        return False
+    for key, value in raw.items():
+        other = rollup[key]
+        if key == 'most_expensive_item':
+            same = value.astype(str).equals(other.astype(str))
+        elif isinstance(value, pd.Series):
+            # Con importes empatados el orden puede variar: se compara como diccionario
+            same = len(value) == len(other) and all(np.isclose(other.get(k, np.nan), v) for k, v in value.items())
+        elif isinstance(value, pd.Timestamp):
+            same = value == other
+        else:
+            same = bool(np.isclose(value, other, rtol=1e-9))
+        if not same:
+            print(f"  {key}: {value!r:.200} != {other!r:.200}")
+            return False
+    return True
+
+def insert_cost(tmp_dir, n_rows):
+    df_items, df_totals = make_frames(n_rows)
+    times = {}
+    for label in ("sin triggers", "con triggers"):
+        db = DatabaseManager(os.path.join(tmp_dir, f"insert_{label.replace(' ', '_')}.db"))
+        db.create_tables()
+        if label == "sin triggers":
+            with db.write_transaction() as cursor:
+                for (name,) in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'").fetchall():
+                    cursor.execute(f"DROP TRIGGER {name}")
+        times[label], _ = timed(lambda: db.insert_data(df_items, df_totals))
+        # Segunda pasada: las mismas filas actualizan las existentes (triggers de UPDATE)
+        times[label + ", reinsertando"], _ = timed(lambda: db.insert_data(df_items, df_totals))
+        if label == "con triggers" and db.check_rollups():
+            print("❌ Las tablas resumen no coinciden tras insertar")
+            return 1
+        db.close()
+    for label, seconds in times.items():
+        print(f"insert_data {label:<28} {seconds:7.2f} s  ({n_rows / seconds:10,.0f} artículos/s)")
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de las tablas resumen")
+    parser.add_argument("--rows", type=int, default=5_000_000, help="Artículos de la base de datos grande")
+    parser.add_argument("--insert-rows", type=int, default=300_000, help="Artículos para medir la escritura")
+    parser.add_argument("--keep", metavar="DIR", help="Directorio donde dejar las bases de datos")
+    args = parser.parse_args()
+    warnings.simplefilter("ignore")
+
+    tmp_dir = args.keep or tempfile.mkdtemp()
+    os.makedirs(tmp_dir, exist_ok=True)
+    status = insert_cost(tmp_dir, args.insert_rows)
+
+    db_path = os.path.join(tmp_dir, "bench_rollups.db")
+    if not os.path.exists(db_path):
+        db = DatabaseManager(db_path)
+        db.create_tables()
+        # Generación masiva sin triggers y resúmenes calculados al final, como en la migración
+        with db.write_transaction() as cursor:
+            for (name,) in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'").fetchall():
+                cursor.execute(f"DROP TRIGGER {name}")
+            cursor.execute(GENERATE_PRODUCTS)
+            cursor.execute(GENERATE_ITEMS, (args.rows, args.rows))
+            cursor.execute(GENERATE_INVOICES)
+            fill_rollups(cursor)
+            create_rollup_triggers(cursor)
+        db.close()
+
+    db = DatabaseManager(db_path)
+    processor = PDFInvoiceProcessor()
+    n_items = db.count_items()
+    raw_time, raw = timed(lambda: load_statistics(db, processor, use_rollups=False))
+    rollup_time, rollup = timed(lambda: load_statistics(db, processor))
+    print(f"Estadísticas de {n_items:,} artículos: recorriendo items {raw_time:.2f} s, "
+          f"tablas resumen {rollup_time:.3f} s (x{raw_time / rollup_time:,.0f})")
+    with db.read_connection() as conn:
+        rollup_rows = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                       for table in ("monthly_rollup", "product_rollup", "invoice_rollup")}
+    print("Filas de las tablas resumen: " + ", ".join(f"{table} {rows:,}" for table, rows in rollup_rows.items()))
+    if not same_statistics(raw, rollup):
+        print("❌ Las estadísticas no coinciden")
+        status = 1
+    else:
+        print("✅ Mismas estadísticas")
+
+    rebuild_time, _ = timed(db.rebuild_rollups)
+    check_time, differences = timed(db.check_rollups)
+    print(f"rebuild_rollups {rebuild_time:.2f} s, check_rollups {check_time:.2f} s ({len(differences)} diferencias)")
+    status |= bool(differences)
+    db.close()
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# bench_search.py - Búsqueda de artículos con FTS5 frente a cargar los datos y filtrar en pandas
+#
+# Sobre una base de datos de --rows artículos de 1000 productos (ver bench_chunked_reads.py)
+# mide la primera página de search_items con el índice FTS5 y con LIKE (sin índice) y la
+# búsqueda leyendo los artículos por trozos y filtrando con str.contains, como había que
+# hacerlo antes. Comprueba que FTS5 y pandas encuentran los mismos artículos (LIKE busca
+# el texto en cualquier parte y no solo al comienzo de las palabras).
+# Uso: python benchmarks/bench_search.py [--rows 5000000] [--repeat 3] [--keep DIR]
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from bench_chunked_reads import GENERATE_INVOICES, GENERATE_ITEMS, GENERATE_PRODUCTS
+import pandas as pd
+
+from ExpenditureControl import SEARCH_COUNT_LIMIT, SEARCH_ITEM_COLUMNS, SEARCH_PAGE_SIZE, DatabaseManager
+
+# (texto, expresión regular equivalente para str.contains sobre código y descripción)
+CASES = [
+    ("123", r"(?:^|\W)123"),
+    ("producto 77", r"(?i)^(?=.*(?:^|\W)producto)(?=.*(?:^|\W)77)"),
+    ("producto 5", r"(?i)^(?=.*(?:^|\W)producto)(?=.*(?:^|\W)5)"),
+    ("producto", r"(?i)(?:^|\W)producto"),
+]
+
+def best_time(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def pandas_search(db, pattern):
+    """Número de artículos e ids de la primera página leyendo todos los artículos por trozos."""
+    total, pages = 0, []
+    for chunk in db.iter_items(columns=("id",) + SEARCH_ITEM_COLUMNS):
+        found = (chunk["Código Producto"].astype(str) + " " + chunk["Descripción"].astype(str)).str.contains(pattern)
+        total += int(found.sum())
+        pages.append(chunk[found].sort_values(["Fecha Factura", "id"], ascending=False).head(SEARCH_PAGE_SIZE))
+    first_page = pd.concat(pages).sort_values(["Fecha Factura", "id"], ascending=False).head(SEARCH_PAGE_SIZE)
+    return total, first_page["id"].tolist()
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la búsqueda de artículos")
+    parser.add_argument("--rows", type=int, default=5_000_000, help="Artículos de la base de datos")
+    parser.add_argument("--repeat", type=int, default=3, help="Repeticiones de cada búsqueda (se toma la mejor)")
+    parser.add_argument("--keep", metavar="DIR", help="Directorio donde dejar la base de datos")
+    args = parser.parse_args()
+
+    tmp_dir = args.keep or tempfile.mkdtemp()
+    os.makedirs(tmp_dir, exist_ok=True)
+    db_path = os.path.join(tmp_dir, "bench_search.db")
+    if not os.path.exists(db_path):
+        db = DatabaseManager(db_path)
+        db.create_tables()
+        with db.write_transaction() as cursor:
+            cursor.execute(GENERATE_PRODUCTS)
+            cursor.execute(GENERATE_ITEMS, (args.rows, args.rows))
+            cursor.execute(GENERATE_INVOICES)
+        db.close()
+
+    db = DatabaseManager(db_path)
+    db.create_tables()
+    status = 0
+    for text, pattern in CASES:
+        db._search_index = None
+        fts_time, (_, fts_total) = best_time(lambda: db.search_items(text), args.repeat)
+        db._search_index = False
+        like_time, _ = best_time(lambda: db.search_items(text), args.repeat)
+        pandas_time, (pandas_total, pandas_ids) = best_time(lambda: pandas_search(db, pattern), 1)
+        # Comprobación con el recuento completo, fuera de la medida
+        db._search_index = None
+        fts_page, exact_total = db.search_items(text, columns=("id",), count_limit=args.rows)
+        same = exact_total == pandas_total and fts_page["id"].tolist() == pandas_ids
+        status |= not same
+        found = f"> {SEARCH_COUNT_LIMIT:,}" if fts_total is None else f"{fts_total:,}"
+        print(f"{text!r:<14} {pandas_total:>10,} artículos ({found:>8})  FTS5 {fts_time * 1000:7.1f} ms  "
+              f"LIKE {like_time * 1000:7.1f} ms  pandas {pandas_time:6.1f} s  {'✅' if same else '❌ distintos'}")
+    db.close()
+    return int(status)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# bench_snapshot.py - Cargas desde la instantánea en columnas (Arrow IPC) frente a SQLite
+#
+# Sobre una base de datos de --rows artículos (ver bench_chunked_reads.py) mide:
+# 1. refresh_snapshot desde cero, y después de añadir --append-rows artículos con
+#    insert_rows (actualización incremental: solo se leen las filas nuevas).
+# 2. get_all_data, las estadísticas recorriendo los artículos por trozos (stats
+#    --no-rollups) y la predicción, leyendo de SQLite y de la instantánea, y comprueba
+#    que los resultados coinciden.
+# 3. El coste de los triggers de data_version al insertar.
+# Uso: python benchmarks/bench_snapshot.py [--rows 5000000] [--append-rows 50000] [--keep DIR]
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from bench_chunked_reads import GENERATE_INVOICES, GENERATE_ITEMS, GENERATE_PRODUCTS
+from bench_db_concurrency import item_row
+from bench_rollups import same_statistics
+import pandas as pd
+
+from ExpenditureControl import DATA_VERSION_TRIGGERS, FORECAST_ITEM_COLUMNS, STATS_ITEM_COLUMNS, \
+    STATS_TOTAL_COLUMNS, DatabaseManager, PDFInvoiceProcessor, create_data_version_triggers, \
+    create_rollup_triggers, fill_rollups
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+def snapshot_size(db):
+    return sum(os.path.getsize(os.path.join(db.snapshot_dir, name)) for name in os.listdir(db.snapshot_dir))
+
+def build_database(db_path, n_rows):
+    db = DatabaseManager(db_path)
+    db.create_tables()
+    # Generación masiva sin triggers, como en bench_rollups.py
+    with db.write_transaction() as cursor:
+        for (name,) in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'").fetchall():
+            cursor.execute(f"DROP TRIGGER {name}")
+        cursor.execute(GENERATE_PRODUCTS)
+        cursor.execute(GENERATE_ITEMS, (n_rows, n_rows))
+        cursor.execute(GENERATE_INVOICES)
+        fill_rollups(cursor)
+        create_rollup_triggers(cursor)
+        create_data_version_triggers(cursor)
+        cursor.execute("UPDATE data_version SET version = version + 1, rewrites = rewrites + 1")
+    db.close()
+
+def loads(db, processor, sources):
+    """Tiempos y resultados de cada carga leyendo de cada origen ("SQLite" o "instantánea")."""
+    snapshot_dir = db.snapshot_dir
+    results = {}
+    for source in sources:
+        # Sin directorio de instantánea todo se lee de SQLite
+        db.snapshot_dir = snapshot_dir if source == "instantánea" else snapshot_dir + "-no-existe"
+        results[source] = {
+            "get_all_data": timed(db.get_all_data),
+            "estadísticas": timed(lambda: processor.generate_statistics(db.iter_items(columns=STATS_ITEM_COLUMNS),
+                                                                        db.iter_invoices(columns=STATS_TOTAL_COLUMNS))),
+            "predicción": timed(lambda: processor.predict_future_spending(db.iter_items(columns=FORECAST_ITEM_COLUMNS))),
+        }
+    db.snapshot_dir = snapshot_dir
+    return results
+
+def trigger_cost(tmp_dir, n_rows):
+    rows = [item_row(index) for index in range(n_rows)]
+    times = {}
+    for label in ("sin triggers de data_version", "con triggers de data_version"):
+        db = DatabaseManager(os.path.join(tmp_dir, f"triggers_{len(times)}.db"))
+        db.create_tables()
+        if label.startswith("sin"):
+            with db.write_transaction() as cursor:
+                for trigger_sql in DATA_VERSION_TRIGGERS:
+                    cursor.execute(f"DROP TRIGGER {trigger_sql.split()[5]}")
+        times[label], _ = timed(lambda: db.insert_rows(rows, []))
+        db.close()
+    for label, seconds in times.items():
+        print(f"insert_rows {label:<30} {seconds:6.2f} s  ({n_rows / seconds:9,.0f} artículos/s)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la instantánea en columnas")
+    parser.add_argument("--rows", type=int, default=5_000_000, help="Artículos de la base de datos")
+    parser.add_argument("--append-rows", type=int, default=50_000, help="Artículos añadidos antes de la actualización incremental")
+    parser.add_argument("--keep", metavar="DIR", help="Directorio donde dejar la base de datos")
+    args = parser.parse_args()
+    warnings.simplefilter("ignore")
+
+    tmp_dir = args.keep or tempfile.mkdtemp()
+    os.makedirs(tmp_dir, exist_ok=True)
+    db_path = os.path.join(tmp_dir, "bench_snapshot.db")
+    if not os.path.exists(db_path):
+        seconds, _ = timed(lambda: build_database(db_path, args.rows))
+        print(f"Base de datos con {args.rows:,} artículos generada en {seconds:.1f} s")
+
+    db = DatabaseManager(db_path)
+    processor = PDFInvoiceProcessor()
+    seconds, state = timed(lambda: db.refresh_snapshot(rebuild=True))
+    if state is None:
+        print("❌ La instantánea necesita pyarrow")
+        return 1
+    print(f"refresh_snapshot desde cero: {seconds:.1f} s ({snapshot_size(db) / 2**20:,.0f} MB, "
+          f"base de datos {os.path.getsize(db_path) / 2**20:,.0f} MB)")
+
+    status = 0
+    results = loads(db, processor, ("SQLite", "instantánea"))
+    for operation in results["SQLite"]:
+        sql_time, sql_result = results["SQLite"][operation]
+        snapshot_time, snapshot_result = results["instantánea"][operation]
+        if operation == "get_all_data":
+            same = all(a.equals(b) for a, b in zip(sql_result, snapshot_result))
+        elif operation == "estadísticas":
+            same = same_statistics(sql_result, snapshot_result)
+        else:
+            same = all(pd.Series(a).equals(pd.Series(b)) for a, b in zip(sql_result, snapshot_result))
+        status |= not same
+        print(f"{operation:<13} SQLite {sql_time:7.2f} s  instantánea {snapshot_time:7.2f} s  "
+              f"(x{sql_time / snapshot_time:5.1f})  {'✅ iguales' if same else '❌ distintos'}")
+    del results
+
+    first = db.count_items()
+    db.insert_rows([item_row(first + index) for index in range(args.append_rows)], [])
+    seconds, state = timed(db.refresh_snapshot)
+    print(f"refresh_snapshot tras añadir {args.append_rows:,} artículos: {seconds:.2f} s "
+          f"({len(state['tables']['items']['segments'])} segmentos de artículos)")
+    sql_items = loads(db, processor, ("SQLite",))["SQLite"]["get_all_data"][1][0]
+    snapshot_items = db.get_all_data()[0]
+    same = sql_items.equals(snapshot_items)
+    status |= not same
+    print(f"get_all_data tras la actualización incremental: {'✅ iguales' if same else '❌ distintos'}")
+    db.close()
+
+    trigger_cost(tmp_dir, 300_000)
+    if not args.keep:
+        shutil.rmtree(tmp_dir)
+    return int(status)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# bench_startup.py - Tiempo de arranque de ExpenditureControl frente a un presupuesto
+#
+# Mide en procesos nuevos (sin cachés de importación en memoria):
+#   - el tiempo de "import ExpenditureControl" y qué librerías pesadas deja cargadas,
+#   - el tiempo hasta que la ventana principal está dibujada (necesita pantalla).
+# Termina con código 1 si alguna medida supera su presupuesto.
+# Uso: python benchmarks/bench_startup.py [--repeat N] [--import-budget S] [--window-budget S]
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+# Presupuestos en segundos (mediana de las repeticiones)
+IMPORT_BUDGET = 0.5
+WINDOW_BUDGET = 1.5
+
+# Librerías que no deben cargarse al importar el módulo
+HEAVY_MODULES = ("pandas", "numpy", "pdfplumber", "matplotlib", "sklearn", "seaborn", "tkinter")
+
+IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import ExpenditureControl
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "loaded": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+WINDOW_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import ExpenditureControl
+ExpenditureControl.load_tkinter()
+tk = ExpenditureControl.tk
+root = tk.Tk()
+app = ExpenditureControl.PDFProcessorApp(root)
+
+def shown():
+    # Primer ciclo libre del bucle de eventos: la ventana ya está dibujada
+    print(json.dumps({"seconds": time.perf_counter() - start,
+                      "pandas_loaded": "pandas" in sys.modules}))
+    root.destroy()
+
+root.after_idle(shown)
+root.mainloop()
+"""
+
+def run_probe(code):
+    env = dict(os.environ, PYTHONPATH=SRC_DIR + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "error desconocido")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de arranque de ExpenditureControl")
+    parser.add_argument("--repeat", type=int, default=5, help="Procesos a lanzar por medida")
+    parser.add_argument("--import-budget", type=float, default=IMPORT_BUDGET, help="Segundos máximos de importación")
+    parser.add_argument("--window-budget", type=float, default=WINDOW_BUDGET, help="Segundos máximos hasta la ventana")
+    args = parser.parse_args()
+
+    status = 0
+
+    imports = [run_probe(IMPORT_PROBE) for _ in range(args.repeat)]
+    import_time = statistics.median(probe["seconds"] for probe in imports)
+    loaded = sorted(set(module for probe in imports for module in probe["loaded"]))
+    ok = import_time <= args.import_budget and not loaded
+    print(f"{'✅' if ok else '❌'} import ExpenditureControl: {import_time:.3f} s (presupuesto {args.import_budget:.2f} s)")
+    if loaded:
+        print(f"   ❌ Librerías cargadas al importar: {', '.join(loaded)}")
+    status |= not ok
+
+    try:
+        windows = [run_probe(WINDOW_PROBE) for _ in range(args.repeat)]
+    except RuntimeError as e:
+        print(f"⚠️  No se pudo medir la ventana (¿sin pantalla?): {e}")
+        return int(status)
+
+    window_time = statistics.median(probe["seconds"] for probe in windows)
+    ok = window_time <= args.window_budget
+    print(f"{'✅' if ok else '❌'} Ventana dibujada: {window_time:.3f} s (presupuesto {args.window_budget:.2f} s)")
+    if any(probe["pandas_loaded"] for probe in windows):
+        print("   ⚠️  pandas ya estaba cargado al dibujar la ventana")
+    status |= not ok
+
+    return int(status)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# bench_stats_cache.py - Caché de estadísticas y gráficos por versión de los datos
+#
+# Sobre una base de datos de --rows artículos (ver bench_snapshot.py) y una caché
+# StatisticsCache vacía, mide "Generar Estadísticas" (estadísticas y gráficos, como la
+# ventana) sin filtros y con un filtro de fechas:
+# 1. La primera vez (se calcula todo y se guarda en la caché).
+# 2. La segunda vez con los datos sin cambios (se lee de la caché).
+# 3. Después de añadir --append-rows artículos con insert_rows: la versión de los datos
+#    cambia y se vuelve a calcular.
+# Comprueba que las estadísticas de la caché coinciden con las calculadas.
+# Uso: python benchmarks/bench_stats_cache.py [--rows 2000000] [--append-rows 1000] [--keep DIR]
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from bench_db_concurrency import item_row
+from bench_rollups import same_statistics
+from bench_snapshot import build_database
+
+from ExpenditureControl import DatabaseManager, PDFInvoiceProcessor, RunMetrics, StatisticsCache, \
+    cached_statistics
+
+FILTERS = {
+    "sin filtros": {},
+    "desde 2020-01-01": {"start_date": "2020-01-01"},
+}
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+def generate(db, cache, output_dir, filters):
+    """Como "Generar Estadísticas" en la ventana; devuelve las estadísticas y los aciertos de la caché."""
+    processor = PDFInvoiceProcessor(metrics=RunMetrics("stats"))
+    stats = cached_statistics(db, processor, cache, output_dir, **filters)
+    return stats, processor.metrics.counters
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la caché de estadísticas")
+    parser.add_argument("--rows", type=int, default=2_000_000, help="Artículos de la base de datos")
+    parser.add_argument("--append-rows", type=int, default=1000, help="Artículos añadidos para invalidar la caché")
+    parser.add_argument("--keep", metavar="DIR", help="Directorio donde dejar la base de datos")
+    args = parser.parse_args()
+    warnings.simplefilter("ignore")
+
+    tmp_dir = args.keep or tempfile.mkdtemp()
+    os.makedirs(tmp_dir, exist_ok=True)
+    db_path = os.path.join(tmp_dir, "bench_stats_cache.db")
+    if not os.path.exists(db_path):
+        seconds, _ = timed(lambda: build_database(db_path, args.rows))
+        print(f"Base de datos con {args.rows:,} artículos generada en {seconds:.1f} s")
+    cache_path = os.path.join(tmp_dir, "stats_cache.db")
+    if os.path.exists(cache_path):
+        os.remove(cache_path)
+
+    db = DatabaseManager(db_path)
+    cache = StatisticsCache(cache_path)
+    output_dir = os.path.join(tmp_dir, "graficos")
+    status = 0
+    for phase in ("primera vez", "datos sin cambios", f"tras añadir {args.append_rows:,} artículos"):
+        if phase.startswith("tras"):
+            first = db.count_items()
+            db.insert_rows([item_row(first + index) for index in range(args.append_rows)], [])
+        for label, filters in FILTERS.items():
+            seconds, (stats, counters) = timed(lambda: generate(db, cache, output_dir, filters))
+            expected = generate(db, None, output_dir, filters)[0]
+            same = same_statistics(expected, stats)
+            # Solo la segunda vez deben salir de la caché
+            hits = counters.get("stats_cache_hits", 0) + counters.get("chart_cache_hits", 0)
+            status |= not same or (hits == 2) != (phase == "datos sin cambios")
+            print(f"{phase:<28} {label:<17} {seconds:7.2f} s  aciertos de la caché {hits}  "
+                  f"{'✅ iguales' if same else '❌ distintas'}")
+    db.close()
+    print(f"Caché: {os.path.getsize(cache_path) / 2**10:,.0f} KB")
+    if not args.keep:
+        shutil.rmtree(tmp_dir)
+    return int(status)
+
+if __name__ == "__main__":
+    sys.exit(main())
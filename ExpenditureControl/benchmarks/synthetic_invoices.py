@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# synthetic_invoices.py - Generador de facturas PDF sintéticas para los benchmarks
+#
+# Escribe PDFs mínimos (sin dependencias externas) con la misma disposición de líneas
+# que las facturas de Würth que entiende extract_data_from_text: cabecera con
+# "Nº factura" y "Fecha", líneas de artículo de 8 columnas seguidas de su descripción
+# y la línea de totales en la última página.
+# Uso: python benchmarks/synthetic_invoices.py DIR [--files N] [--items N] [--pages N]
+
+import argparse
+import os
+import random
+import sys
+from datetime import date, timedelta
+
+PAGE_WIDTH = 595.276
+PAGE_HEIGHT = 841.89
+LINE_HEIGHT = 12
+FONT_SIZE = 8
+
+PRODUCTS = [
+    "ABRAZADERA SIMPLE M6 47MM", "TUBO WURTHFLEX PG 29", "PACKFIX-NEGRO-500MM-MANUAL",
+    "TORNILLO CARCASA LARGO", "CASQUILLO EXTERIOR", "VARILLA DE PRESION", "MUELLE DEL FROTADOR",
+    "BROCA HSS 6MM", "TACO NYLON 8MM", "CINTA AISLANTE NEGRA", "SILICONA NEUTRA BLANCA",
+    "GUANTE NITRILO T9", "DISCO CORTE INOX 125MM", "BRIDA NEGRA 300MM", "TERMINAL PUNTERA 1,5MM",
+]
+
+def format_amount(cents):
+    """Importe en céntimos con coma decimal y sin separador de miles, como en las facturas."""
+    sign = "-" if cents < 0 else ""
+    cents = abs(cents)
+    return f"{sign}{cents // 100},{cents % 100:02d}"
+
+def _pdf_string(text):
+    encoded = text.encode("cp1252")
+    return b"(" + encoded.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+def _content_stream(lines):
+    """Dibuja cada línea (x, top, texto) con Helvetica; top se mide desde arriba como en pdfplumber."""
+    parts = [b"BT", b"/F1 %d Tf" % FONT_SIZE]
+    for x, top, text in lines:
+        y = PAGE_HEIGHT - top - FONT_SIZE
+        parts.append(b"1 0 0 1 %.2f %.2f Tm " % (x, y) + _pdf_string(text) + b" Tj")
+    parts.append(b"ET")
+    return b"\n".join(parts)
+
+def write_pdf(path, pages):
+    """Escribe un PDF con una página por lista de líneas (x, top, texto)."""
+    n_pages = len(pages)
+    # 1: catálogo, 2: árbol de páginas, 3: fuente, después página y contenido de cada página
+    page_ids = [4 + 2 * i for i in range(n_pages)]
+    objects = {
+        1: b"<< /Type /Catalog /Pages 2 0 R >>",
+        2: b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % pid for pid in page_ids) + b"] /Count %d >>" % n_pages,
+        3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    }
+    for page_id, lines in zip(page_ids, pages):
+        stream = _content_stream(lines)
+        objects[page_id] = (
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.3f %.3f] " % (PAGE_WIDTH, PAGE_HEIGHT)
+            + b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (page_id + 1)
+        )
+        objects[page_id + 1] = b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream"
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for obj_id in sorted(objects):
+        offsets[obj_id] = len(output)
+        output += b"%d 0 obj\n" % obj_id + objects[obj_id] + b"\nendobj\n"
+
+    xref_offset = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for obj_id in sorted(objects):
+        output += b"%010d 00000 n \n" % offsets[obj_id]
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+
+    with open(path, "wb") as f:
+        f.write(output)
+
+def invoice_pages(invoice_number, invoice_date, items, pages_per_invoice):
+    """Reparte los artículos (línea, descripción, neto en céntimos) entre las páginas y añade los totales."""
+    pages = []
+    per_page = -(-len(items) // pages_per_invoice) if items else 0
+    for page_index in range(pages_per_invoice):
+        top = 160
+        lines = [
+            (73, top, f"Nº factura {invoice_number} CEBE/942/ZF/127266634"),
+            (73, top + LINE_HEIGHT, "Nº cliente 127266634 EMPRESA DE PRUEBA SL"),
+            (73, top + 2 * LINE_HEIGHT, f"Fecha {invoice_date.strftime('%d.%m.%Y')} 28935 MOSTOLES-MADRID"),
+            (73, top + 3 * LINE_HEIGHT, f"Página {page_index + 1}/{pages_per_invoice}"),
+            (73, top + 5 * LINE_HEIGHT, "NºArtículo Pos. Cantidad Precio en CP Dto % IVA % Valor neto"),
+        ]
+        top += 7 * LINE_HEIGHT
+        for item_line, description, _ in items[page_index * per_page:(page_index + 1) * per_page]:
+            lines.append((74, top, item_line))
+            lines.append((85, top + LINE_HEIGHT, description))
+            top += 2 * LINE_HEIGHT + 4
+        pages.append(lines)
+
+    net_cents = sum(net for _, _, net in items)
+    iva_cents = round(net_cents * 0.21)
+    pages[-1].append((130, 760, "Portes EUR Valor neto EUR IVA Impte. IVA EUR Importe total EUR"))
+    pages[-1].append((156, 775, f"0,00 {format_amount(net_cents)} 21,00% {format_amount(iva_cents)} "
+                                f"{format_amount(net_cents + iva_cents)}"))
+    return pages
+
+def random_items(rng, n_items):
+    items = []
+    for position in range(1, n_items + 1):
+        quantity = rng.randint(1, 50)
+        price_cents = rng.randint(5, 20000)
+        net_cents = quantity * price_cents
+        item_number = "".join(rng.choice("0123456789") for _ in range(13))
+        item_line = f"{item_number} {position} {quantity} {format_amount(price_cents)} 1 0 21 {format_amount(net_cents)}"
+        description = f"{rng.choice(PRODUCTS)} {position * 10}"
+        items.append((item_line, description, net_cents))
+    return items
+
+def generate_corpus(directory, n_files, items_per_invoice=10, pages_per_invoice=1, seed=0,
+                    start_date=date(2023, 1, 1), days=730):
+    """Genera n_files facturas en directory (reutiliza las que ya existen) y devuelve sus rutas."""
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for index in range(n_files):
+        invoice_number = str(4700000000 + index)
+        invoice_date = start_date + timedelta(days=rng.randrange(days))
+        items = random_items(rng, items_per_invoice)
+        path = os.path.join(directory, f"factura_{invoice_number}.pdf")
+        if not os.path.exists(path):
+            write_pdf(path, invoice_pages(invoice_number, invoice_date, items, pages_per_invoice))
+        paths.append(path)
+    return paths
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera facturas PDF sintéticas")
+    parser.add_argument("directory", help="Directorio de destino")
+    parser.add_argument("--files", type=int, default=100, help="Número de facturas")
+    parser.add_argument("--items", type=int, default=10, help="Artículos por factura")
+    parser.add_argument("--pages", type=int, default=1, help="Páginas por factura")
+    parser.add_argument("--seed", type=int, default=0, help="Semilla del generador aleatorio")
+    args = parser.parse_args()
+
+    paths = generate_corpus(args.directory, args.files, args.items, args.pages, args.seed)
+    print(f"✅ {len(paths)} facturas en {os.path.abspath(args.directory)}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
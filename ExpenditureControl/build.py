@@ -192,7 +192,6 @@ def check_dependencies():
         import numpy as np
         import sklearn
         import matplotlib
-        import seaborn as sns
         from PIL import Image
         import tkinter as tk
         print("✅ Todas las dependencias están instaladas")
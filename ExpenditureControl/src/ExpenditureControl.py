@@ -1,23 +1,44 @@
-import pdfplumber
-import pandas as pd
 import re
 import os
 import glob
-import numpy as np
-from sklearn.linear_model import LinearRegression
-from sklearn.preprocessing import PolynomialFeatures
-import matplotlib.pyplot as plt
-import seaborn as sns
 from datetime import datetime
-import tkinter as tk
-from tkinter import filedialog, messagebox, ttk
+import argparse
 import threading
 import sqlite3
+import hashlib
+import json
+import time
+import zlib
+import pickle
 import shutil
 import sys
-import matplotlib
-matplotlib.use("Agg")  # Forzar backend no interactivo para evitar conflictos con Tkinter
-import matplotlib.pyplot as plt
+import multiprocessing
+import functools
+import queue
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# pandas, numpy, pdfplumber, Tkinter, matplotlib y scikit-learn se importan solo donde se
+# usan: la ventana aparece antes de cargar las librerías de análisis y la línea de
+# comandos funciona en servidores sin entorno gráfico
+tk = filedialog = messagebox = ttk = None
+
+def load_tkinter():
+    """Importa Tkinter la primera vez que se abre la interfaz gráfica."""
+    global tk, filedialog, messagebox, ttk
+    if tk is None:
+        import tkinter
+        from tkinter import filedialog as tk_filedialog, messagebox as tk_messagebox, ttk as tk_ttk
+        tk, filedialog, messagebox, ttk = tkinter, tk_filedialog, tk_messagebox, tk_ttk
+
+def load_pyplot():
+    """Importa matplotlib con un backend no interactivo para evitar conflictos con Tkinter."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
 
 def get_app_data_path():
     """Obtiene la ruta para los datos de la aplicación."""
@@ -31,17 +52,1194 @@ def get_app_data_path():
     os.makedirs(path, exist_ok=True)
     return path
 
+# Los PDFs mayores que este tamaño se reparten por páginas entre varias tareas del pool
+LARGE_PDF_BYTES = 2 * 1024 * 1024
+PAGES_PER_TASK = 8
+
+# Filas (artículos + totales) por transacción en el modo streaming
+STREAM_BATCH_SIZE = 500
+
+# Plantillas de factura conocidas: motor de extracción ("pdfplumber" o "pdfminer") y zonas
+# (x0, top, x1, bottom en puntos desde la esquina superior izquierda) donde están el
+# número, la fecha, los artículos y los totales. Sin zonas se usa la página completa.
+INVOICE_TEMPLATES = {
+    "wurth": {"engine": "pdfminer", "regions": [(60, 150, 600, 850)]},
+}
+
+# Tamaño máximo de la caché de texto extraído antes de expulsar los PDFs menos usados
+TEXT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Caché de estadísticas y gráficos por versión de los datos (ver StatisticsCache):
+# entradas que se guardan como máximo e incrementar STATS_CACHE_FORMAT cuando cambie
+# lo que devuelve load_statistics o cómo se dibujan los gráficos
+STATS_CACHE_MAX_ENTRIES = 64
+STATS_CACHE_FORMAT = 1
+
+# Incrementar cuando cambie extract_data_from_text para que se vuelvan a procesar los PDFs
+PARSER_VERSION = 1
+
+def list_pdf_files(directory_path):
+    """Devuelve los PDFs de un directorio en orden estable."""
+    pdf_files = glob.glob(os.path.join(directory_path, "*.pdf"))
+    pdf_files.extend(glob.glob(os.path.join(directory_path, "*.PDF")))
+    return sorted(set(pdf_files))
+
+def parse_decimal(value):
+    """Convierte un número con coma decimal ("192,00" o "21,00%") a float."""
+    if value is None:
+        return None
+    return float(value.replace('%', '').replace(',', '.'))
+
+# Importe de parse_cents: signo delante o detrás (abonos "12,50-") y coma o punto decimal
+AMOUNT_PATTERN = re.compile(r'^([+-]?)(\d+)(?:[,.](\d+))?(-?)$', re.ASCII)
+
+def parse_cents(value):
+    """Convierte un importe con coma decimal ("192,00", "-20,5", "12,50-" o "7") a céntimos enteros.
+
+    Se calcula con enteros, sin pasar por float, así los importes son exactos. Con
+    más de dos decimales se redondea al céntimo (la mitad se aleja del cero). Un
+    importe no válido (vacío, solo el signo, otros caracteres) lanza ValueError.
+    """
+    if value is None:
+        return None
+    if value[-3:-2] == ',' and len(value) > 3:
+        # El caso de las facturas: dos decimales tras la coma ("1234,56" -> 123456). Solo
+        # si quedan dígitos ASCII: int() también aceptaría "1_0,00" o dígitos de otras escrituras
+        digits = value.replace(',', '', 1)
+        if digits.isdigit() and digits.isascii():
+            return int(digits)
+    match = AMOUNT_PATTERN.match(value.strip())
+    if match is None or (match.group(1) and match.group(4)):
+        raise ValueError(f"Importe no válido: {value!r}")
+    sign, whole, fraction, trailing = match.groups()
+    fraction = (fraction or '').ljust(3, '0')
+    cents = int(whole) * 100 + int(fraction[:2]) + (fraction[2] >= '5')
+    return -cents if sign == '-' or trailing else cents
+
+def cents_column(values):
+    """Columna (pd.Series) de importes en texto a céntimos: int64, o float64 si falta alguno."""
+    import pandas as pd
+    
+    return pd.to_numeric(pd.Series([parse_cents(value) for value in values.tolist()], index=values.index))
+
+def cents_to_euros(cents):
+    """Importe (o Series, array) en céntimos a euros, solo para mostrarlo o exportarlo."""
+    return cents / 100
+
+def euros_frame(df):
+    """DataFrame con las columnas de importes (MONEY_COLUMNS) en euros; sin importes, el mismo df."""
+    money = [column for column in df.columns if column in MONEY_COLUMNS]
+    if not money:
+        return df
+    return df.assign(**{column: cents_to_euros(df[column]) for column in money})
+
+def format_db_date(value):
+    """Convierte una fecha a texto ISO para SQLite; None si no hay fecha."""
+    if value is None:
+        return None
+    return value.strftime('%Y-%m-%d')
+
+def parse_filter_date(value):
+    """Fecha de un filtro de consulta (texto AAAA-MM-DD, date o datetime) en texto ISO para SQLite."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        return datetime.strptime(value.strip(), '%Y-%m-%d').strftime('%Y-%m-%d')
+    return format_db_date(value)
+
+def item_to_db_row(item):
+    """Convierte un artículo extraído por extract_data_from_text a una fila de la tabla items."""
+    (item_number, position, quantity, unit_price, product_code, discount, iva, net_value,
+     description, invoice_number, invoice_date) = item
+    return (
+        invoice_number, format_db_date(invoice_date), item_number, position,
+        parse_decimal(quantity), parse_cents(unit_price), product_code, parse_decimal(discount),
+        parse_decimal(iva), parse_cents(net_value), description
+    )
+
+def total_to_db_row(total):
+    """Convierte un total extraído por extract_data_from_text a una fila de la tabla invoices."""
+    ports, net_value, iva, iva_amount, total_amount, invoice_number, invoice_date = total
+    return (
+        invoice_number, format_db_date(invoice_date), parse_cents(ports), parse_cents(net_value),
+        parse_decimal(iva), parse_cents(iva_amount), parse_cents(total_amount)
+    )
+
+def file_content_hash(file_path, block_size=1024 * 1024):
+    """Calcula el SHA-256 del contenido de un fichero."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def count_pdf_pages(pdf_file):
+    """Cuenta las páginas de un PDF sin extraer su texto."""
+    import pdfplumber
+    
+    with pdfplumber.open(pdf_file) as pdf:
+        return len(pdf.pages)
+
+def text_cache_key(content_hash, template=None):
+    """Clave de TextCache: el texto depende del motor de extracción de la plantilla."""
+    return content_hash if template is None else f"{content_hash}:{template}"
+
+def iter_page_texts(pdf_file, first_page=0, last_page=None, template=None):
+    """Genera (page_index, page_count, text) de un rango de páginas con el motor de la plantilla.
+
+    Sin plantilla se usa page.extract_text() de pdfplumber sobre la página completa.
+    """
+    config = INVOICE_TEMPLATES[template] if template is not None else {"engine": "pdfplumber", "regions": None}
+    if config["engine"] == "pdfminer":
+        yield from _iter_pdfminer_page_texts(pdf_file, first_page, last_page, config["regions"])
+        return
+    
+    import pdfplumber
+    
+    with pdfplumber.open(pdf_file) as pdf:
+        page_count = len(pdf.pages)
+        for page_index, page in enumerate(pdf.pages[first_page:last_page], start=first_page):
+            if config["regions"]:
+                texts = [page.crop(region).extract_text() for region in _clip_regions(config["regions"], page.width, page.height)]
+                text = '\n'.join(texts)
+            else:
+                text = page.extract_text()
+            yield page_index, page_count, text
+
+def _clip_regions(regions, width, height):
+    return [(x0, top, min(x1, width), min(bottom, height)) for x0, top, x1, bottom in regions]
+
+def _iter_pdfminer_page_texts(pdf_file, first_page, last_page, regions):
+    """Lee el texto directamente de pdfminer, sin el análisis de caracteres de pdfplumber."""
+    from pdfminer.converter import PDFPageAggregator
+    from pdfminer.pdfdocument import PDFDocument
+    from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+    from pdfminer.pdfpage import PDFPage
+    from pdfminer.pdfparser import PDFParser
+    
+    with open(pdf_file, 'rb') as f:
+        document = PDFDocument(PDFParser(f))
+        pages = list(PDFPage.create_pages(document))
+        resource_manager = PDFResourceManager(caching=True)
+        device = PDFPageAggregator(resource_manager, laparams=None)
+        interpreter = PDFPageInterpreter(resource_manager, device)
+        for page_index, page in enumerate(pages[first_page:last_page], start=first_page):
+            interpreter.process_page(page)
+            layout = device.get_result()
+            yield page_index, len(pages), _pdfminer_layout_text(layout, regions)
+
+def _iter_layout_chars(container):
+    from pdfminer.layout import LTChar, LTContainer
+    
+    for obj in container:
+        if isinstance(obj, LTChar):
+            yield obj
+        elif isinstance(obj, LTContainer):
+            yield from _iter_layout_chars(obj)
+
+def _pdfminer_layout_text(layout, regions, x_tolerance=3, y_tolerance=3):
+    """Reconstruye las líneas de una página igual que page.extract_text() de pdfplumber.
+
+    Solo se usan los caracteres horizontales (el texto girado del margen no contiene
+    datos de la factura) que caen dentro de alguna de las zonas de la plantilla.
+    """
+    height = layout.height
+    chars = []
+    for char in _iter_layout_chars(layout):
+        if not char.upright:
+            continue
+        top = height - char.y1
+        bottom = height - char.y0
+        if regions and not any(x0 <= char.x0 and char.x1 <= x1 and y0 <= top and bottom <= y1
+                               for x0, y0, x1, y1 in regions):
+            continue
+        chars.append((top, char.x0, char.x1, char.get_text()))
+    
+    # Agrupa en líneas los caracteres cuya altura difiere menos de y_tolerance
+    chars.sort()
+    lines = []
+    last_top = None
+    for char in chars:
+        if last_top is None or char[0] > last_top + y_tolerance:
+            lines.append([])
+        lines[-1].append(char)
+        last_top = char[0]
+    
+    text_lines = []
+    for line in lines:
+        line.sort(key=lambda char: char[1])
+        parts = []
+        previous_x1 = None
+        gap = False
+        for top, x0, x1, text in line:
+            if text.isspace():
+                gap = True
+                continue
+            if previous_x1 is not None and (gap or x0 > previous_x1 + x_tolerance):
+                parts.append(' ')
+            parts.append(text)
+            previous_x1 = x1
+            gap = False
+        if parts:
+            text_lines.append(''.join(parts))
+    
+    return '\n'.join(text_lines)
+
+def extract_pdf_pages(pdf_file, first_page=0, last_page=None, cache_path=None, content_hash=None, template=None,
+                      timings=None):
+    """Extrae los datos de un rango de páginas de un PDF.
+
+    Se ejecuta tanto en el proceso principal como en los procesos del pool, por eso
+    no lanza excepciones: devuelve los resultados obtenidos hasta el fallo y el error.
+    Con cache_path se reutiliza el texto de TextCache y se guardan las páginas nuevas.
+    Si se pasa el diccionario timings se le suman los segundos de cada etapa
+    ("text_cache", "pdf_text" y "parse").
+    """
+    processor = PDFInvoiceProcessor()
+    filename = os.path.basename(pdf_file)
+    results = []
+    cache = None
+    cache_key = None
+    new_pages = []
+    page_count = 0
+    error = None
+    stage_seconds = {"text_cache": 0.0, "pdf_text": 0.0, "parse": 0.0}
+    start = time.perf_counter()
+    try:
+        if cache_path:
+            # Las tablas ya existen: las crea la TextCache del proceso principal
+            if _worker_text_cache is not None and _worker_text_cache.db_path == cache_path:
+                cache = _worker_text_cache
+            else:
+                cache = TextCache(cache_path, create=False)
+            if content_hash is None:
+                content_hash = file_content_hash(pdf_file)
+            cache_key = text_cache_key(content_hash, template)
+            texts = cache.get_pages(cache_key, first_page, last_page)
+            loaded = time.perf_counter()
+            stage_seconds["text_cache"] = loaded - start
+            start = loaded
+            if texts is not None:
+                results = [processor.extract_data_from_text(text, filename) for text in texts]
+                stage_seconds["parse"] = time.perf_counter() - start
+                if timings is not None:
+                    add_stage_times(timings, stage_seconds)
+                return results, None
+        
+        for page_index, page_count, text in iter_page_texts(pdf_file, first_page, last_page, template):
+            extracted = time.perf_counter()
+            if cache is not None and text is not None:
+                new_pages.append((page_index, text))
+            results.append(processor.extract_data_from_text(text, filename))
+            parsed = time.perf_counter()
+            stage_seconds["pdf_text"] += extracted - start
+            stage_seconds["parse"] += parsed - extracted
+            start = parsed
+    except Exception as e:
+        error = str(e)
+    
+    if new_pages:
+        start = time.perf_counter()
+        try:
+            cache.put_pages(cache_key, page_count, new_pages)
+        except sqlite3.Error as e:
+            # La caché es solo una optimización: un fallo no invalida la extracción
+            print(f"Error guardando texto en caché para {filename}: {e}")
+        stage_seconds["text_cache"] += time.perf_counter() - start
+    
+    if timings is not None:
+        add_stage_times(timings, stage_seconds)
+    return results, error
+
+def add_stage_times(timings, stage_seconds):
+    """Suma a timings los segundos de cada etapa (las etapas a cero no se registran)."""
+    for stage, seconds in stage_seconds.items():
+        if seconds:
+            timings[stage] = timings.get(stage, 0.0) + seconds
+
+# TextCache con una sola conexión de cada proceso del pool (ver init_pool_worker)
+_worker_text_cache = None
+
+def init_pool_worker(cache_path):
+    """Inicializador de los procesos del pool: abre una vez la caché de texto para todas sus tareas."""
+    global _worker_text_cache
+    if cache_path:
+        _worker_text_cache = TextCache(cache_path, create=False, persistent=True)
+
+def _extract_pdf_pages_timed(*args):
+    """Versión de extract_pdf_pages para el pool que devuelve también sus tiempos por etapa."""
+    timings = {}
+    results, error = extract_pdf_pages(*args, timings=timings)
+    return results, error, timings
+
+class _StageTimer:
+    __slots__ = ("metrics", "name", "start")
+    
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics.add_time(self.name, time.perf_counter() - self.start)
+        return False
+
+# Contexto vacío compartido: stage() lo devuelve cuando las métricas están desactivadas
+_NULL_STAGE = nullcontext()
+
+class RunMetrics:
+    """Tiempos por etapa, contadores y perfil opcional de una ejecución.
+
+    Uso: "with RunMetrics('ingest') as metrics:" y dentro "with metrics.stage('insert'):"
+    o metrics.count('pages', n). Desactivado, stage() devuelve un contexto vacío y
+    count() no hace nada, así la instrumentación apenas cuesta. Las etapas pueden
+    anidarse, por eso la suma de sus tiempos puede superar la duración total. Con
+    workers > 1 "pdf_text" y "parse" suman el tiempo de todos los procesos del pool.
+    Se puede usar desde varios hilos (el hilo escritor mide "insert" a la vez que el
+    análisis mide sus etapas).
+    """
+    def __init__(self, command=None, enabled=True, profile=False):
+        self.command = command
+        self.enabled = enabled
+        self.stages = {}
+        self.counters = {}
+        self.started_at = None
+        self.duration = None
+        self.profiler = None
+        self._profile = profile and enabled
+        self._start = None
+        self._lock = threading.Lock()
+    
+    def __enter__(self):
+        self.started_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self._start = time.perf_counter()
+        if self._profile:
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.profiler is not None:
+            self.profiler.disable()
+        self.duration = time.perf_counter() - self._start
+        if exc_type is not None:
+            self.count("errors")
+        return False
+    
+    def stage(self, name):
+        """Context manager que suma su duración a la etapa name."""
+        if not self.enabled:
+            return _NULL_STAGE
+        return _StageTimer(self, name)
+    
+    def add_time(self, name, seconds, calls=1):
+        with self._lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                self.stages[name] = stage = {"seconds": 0.0, "calls": 0}
+            stage["seconds"] += seconds
+            stage["calls"] += calls
+    
+    def add_timings(self, timings):
+        """Suma los tiempos devueltos por extract_pdf_pages (una llamada por etapa)."""
+        if self.enabled and timings:
+            for name, seconds in timings.items():
+                self.add_time(name, seconds)
+    
+    def count(self, name, n=1):
+        if self.enabled:
+            with self._lock:
+                self.counters[name] = self.counters.get(name, 0) + n
+    
+    def to_dict(self):
+        return {
+            "command": self.command, "started_at": self.started_at, "duration": self.duration,
+            "stages": self.stages, "counters": self.counters,
+        }
+    
+    def save_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2, ensure_ascii=False)
+    
+    def save_profile(self, path):
+        """Guarda el perfil cProfile (ábrelo con pstats o snakeviz)."""
+        if self.profiler is None:
+            raise ValueError("La ejecución no se ha perfilado")
+        self.profiler.dump_stats(path)
+    
+    def format_summary(self):
+        lines = [f"=== TIEMPOS ({self.command}: {self.duration or 0:.3f} s) ==="]
+        for name, stage in sorted(self.stages.items(), key=lambda item: -item[1]["seconds"]):
+            lines.append(f"  {name:<18} {stage['seconds']:9.3f} s  ({stage['calls']} llamadas)")
+        if self.counters:
+            lines.append("  " + "  ".join(f"{name}={value}" for name, value in sorted(self.counters.items())))
+        return "\n".join(lines)
+
+def timed_stage(name):
+    """Decorador para métodos de objetos con atributo metrics: mide el método como la etapa name."""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.metrics.stage(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+# Conexiones de DatabaseManager: WAL para que las lecturas no esperen a la escritura,
+# synchronous=NORMAL (con WAL solo puede perderse la última transacción si se corta
+# la luz), 256 MB de mmap y 64 MB de caché de páginas por conexión
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA temp_store=MEMORY",
+)
+# Segundos que una conexión espera a que se libere un bloqueo antes de fallar
+SQLITE_BUSY_TIMEOUT = 30
+READ_POOL_SIZE = 4
+# DatabaseWriter: lotes en cola antes de que submit() espere al hilo escritor, filas
+# (artículos + totales) que se agrupan como máximo en una transacción y segundos que
+# un lote puede esperar en memoria antes de confirmarse
+WRITER_QUEUE_SIZE = 16
+WRITER_COMMIT_ROWS = 5000
+WRITER_FLUSH_INTERVAL = 1.0
+
+# Milisegundos entre las comprobaciones de la ventana de los mensajes de los hilos de
+# trabajo (ver PDFProcessorApp.poll_messages) y del cierre del hilo escritor
+UI_POLL_MS = 100
+
+# Un artículo se identifica por factura, posición y número de artículo: volver a procesar
+# una factura actualiza sus líneas en lugar de duplicarlas (el id se conserva). Las filas
+# traen el código y la descripción (columnas de ITEM_COLUMNS); items guarda el id del
+# producto, que PRODUCT_INSERT_SQL ha dado de alta antes en la misma transacción
+ITEM_UPSERT_SQL = """
+    INSERT INTO items (
+        invoice_number, invoice_date, item_number, position, quantity, 
+        unit_price, product_id, discount, iva, net_value
+    ) VALUES (?1, ?2, ?3, ?4, ?5, ?6, (SELECT id FROM products WHERE product_code IS ?7 AND description IS ?11),
+              ?8, ?9, ?10)
+    ON CONFLICT (invoice_number, position, item_number) DO UPDATE SET
+        invoice_date = excluded.invoice_date, quantity = excluded.quantity, unit_price = excluded.unit_price,
+        product_id = excluded.product_id, discount = excluded.discount, iva = excluded.iva,
+        net_value = excluded.net_value
+"""
+# Da de alta un producto (código, descripción) si no existe. UNIQUE no impide repetir
+# pares con NULL: se comprueba con IS, que también usa el índice
+PRODUCT_INSERT_SQL = """
+    INSERT INTO products (product_code, description)
+    SELECT ?1, ?2 WHERE NOT EXISTS (SELECT 1 FROM products WHERE product_code IS ?1 AND description IS ?2)
+"""
+# Se conserva la primera línea de totales de cada factura
+INVOICE_INSERT_SQL = """
+    INSERT OR IGNORE INTO invoices (
+        invoice_number, invoice_date, ports, net_value, iva, iva_amount, total_amount
+    ) VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Filas por llamada a executemany en DatabaseManager.insert_data
+INSERT_BATCH_SIZE = 50000
+# Filas por DataFrame en las lecturas por trozos (DatabaseManager.iter_items)
+READ_CHUNK_SIZE = 100000
+
+# Columnas de los DataFrames de create_dataframes/get_all_data en el orden de las tablas
+ITEM_COLUMNS = (
+    "Nº Factura", "Fecha Factura", "Nº Artículo", "Posición", "Cantidad", "Precio Unitario (EUR)",
+    "Código Producto", "Descuento %", "IVA %", "Valor Neto (EUR)", "Descripción"
+)
+TOTAL_COLUMNS = (
+    "Nº Factura", "Fecha Factura", "Portes (EUR)", "Valor Neto (EUR)", "IVA %",
+    "Importe IVA (EUR)", "Importe Total (EUR)"
+)
+# Columna de la tabla de cada columna de los DataFrames ("id" se devuelve sin renombrar)
+ITEM_SQL_COLUMNS = dict(zip(ITEM_COLUMNS, (
+    "invoice_number", "invoice_date", "item_number", "position", "quantity", "unit_price",
+    "product_code", "discount", "iva", "net_value", "description"
+)))
+TOTAL_SQL_COLUMNS = dict(zip(TOTAL_COLUMNS, (
+    "invoice_number", "invoice_date", "ports", "net_value", "iva", "iva_amount", "total_amount"
+)))
+# Posición del código y de la descripción en las filas de items (ver item_to_db_row)
+PRODUCT_CODE_INDEX = ITEM_COLUMNS.index("Código Producto")
+DESCRIPTION_INDEX = ITEM_COLUMNS.index("Descripción")
+# Columnas de items que se guardan en la tabla products: se leen como pd.Categorical
+# con las categorías de read_product_dictionary
+PRODUCT_SQL_COLUMNS = ("product_code", "description")
+# Columnas REAL: se leen como float64 aunque haya valores nulos o la consulta no devuelva filas
+SQL_FLOAT_COLUMNS = frozenset({"quantity", "discount", "iva"})
+# Importes: se guardan como INTEGER en céntimos (ver parse_cents) y los DataFrames los
+# traen en céntimos (int64, o float64 si hay nulos). Solo se pasan a euros para
+# mostrarlos o exportarlos (ver cents_to_euros y euros_frame)
+MONEY_SQL_COLUMNS = frozenset({"unit_price", "net_value", "ports", "iva_amount", "total_amount"})
+MONEY_COLUMNS = frozenset({"Precio Unitario (EUR)", "Valor Neto (EUR)", "Portes (EUR)", "Importe IVA (EUR)",
+                           "Importe Total (EUR)"})
+
+# Artículos por página de DatabaseManager.search_items y columnas que devuelve. Se
+# cuentan como mucho SEARCH_COUNT_LIMIT resultados: contar millones no cabe en milisegundos
+SEARCH_PAGE_SIZE = 50
+SEARCH_COUNT_LIMIT = 10000
+SEARCH_ITEM_COLUMNS = ("Fecha Factura", "Nº Factura", "Código Producto", "Descripción", "Cantidad",
+                       "Precio Unitario (EUR)", "Valor Neto (EUR)")
+
+# Columnas que leen las estadísticas, los gráficos y la predicción (ver DatabaseManager.query_data)
+STATS_ITEM_COLUMNS = ("Nº Factura", "Fecha Factura", "Cantidad", "Precio Unitario (EUR)", "Valor Neto (EUR)", "Descripción")
+STATS_TOTAL_COLUMNS = ("Importe IVA (EUR)", "Importe Total (EUR)")
+FORECAST_ITEM_COLUMNS = ("Fecha Factura", "Valor Neto (EUR)")
+
+# Instantánea en columnas de items e invoices (ver DatabaseManager.refresh_snapshot):
+# ficheros Arrow IPC sin comprimir junto a la base de datos que se leen con mmap, sin
+# copiar los importes. Cada actualización incremental añade un segmento; al llegar a
+# SNAPSHOT_MAX_SEGMENTS se reescriben en uno solo. Necesita pyarrow (opcional); sin él
+# todo se lee de SQLite. SNAPSHOT_FORMAT cambia si cambian las columnas guardadas
+SNAPSHOT_FORMAT = 2
+SNAPSHOT_MAX_SEGMENTS = 8
+SNAPSHOT_TABLES = {
+    "items": ("id", "invoice_number", "invoice_date", "item_number", "position", "quantity", "unit_price",
+              "product_id", "discount", "iva", "net_value"),
+    "invoices": ("id", "invoice_number", "invoice_date", "ports", "net_value", "iva", "iva_amount", "total_amount"),
+}
+
+def query_filter_conditions(start_date=None, end_date=None, invoice_numbers=None, product_code=None,
+                            description=None):
+    """Condiciones SQL de los filtros de consulta como listas de (condición, parámetros).
+
+    Devuelve por separado las de fecha y número de factura, que valen para items e
+    invoices, y las de producto, que solo existen en items. Las fechas son inclusivas;
+    los números de factura van en un único parámetro JSON, así el filtro no depende
+    del límite de variables de SQLite. description busca el texto en cualquier parte
+    de la descripción (sin distinguir mayúsculas en ASCII). Los filtros de producto se
+    evalúan sobre la tabla products, que tiene una fila por producto y no por compra.
+    """
+    invoice_conditions = []
+    start_date, end_date = parse_filter_date(start_date), parse_filter_date(end_date)
+    if start_date:
+        invoice_conditions.append(("invoice_date >= ?", [start_date]))
+    if end_date:
+        invoice_conditions.append(("invoice_date <= ?", [end_date]))
+    if invoice_numbers is not None:
+        numbers = [str(number) for number in invoice_numbers]
+        invoice_conditions.append(("invoice_number IN (SELECT value FROM json_each(?))", [json.dumps(numbers)]))
+
+    product_conditions = []
+    if product_code:
+        product_conditions.append(("product_id IN (SELECT id FROM products WHERE product_code = ?)", [str(product_code)]))
+    if description:
+        product_conditions.append(("product_id IN (SELECT id FROM products WHERE description LIKE ? ESCAPE '\\')",
+                                   [like_contains(description)]))
+    return invoice_conditions, product_conditions
+
+def like_contains(text):
+    """Patrón de LIKE ... ESCAPE '\\' que busca text en cualquier parte."""
+    pattern = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{pattern}%"
+
+def search_condition(text, full_text=True):
+    """Condición (SQL, parámetros) sobre items de DatabaseManager.search_items.
+
+    Cada palabra de text tiene que aparecer en el código o en la descripción del
+    producto: con full_text como comienzo de palabra en el índice FTS5 (las comillas
+    evitan que se interprete la sintaxis de FTS5) y sin él en cualquier parte con LIKE.
+    None si text no tiene ninguna palabra.
+    """
+    words = [word for word in text.split() if any(char.isalnum() for char in word)]
+    if not words:
+        return None
+    if full_text:
+        match = " ".join('"' + word.replace('"', '""') + '"*' for word in words)
+        return "product_id IN (SELECT rowid FROM products_fts WHERE products_fts MATCH ?)", [match]
+    likes, params = [], []
+    for word in words:
+        likes.append("(product_code LIKE ? ESCAPE '\\' OR description LIKE ? ESCAPE '\\')")
+        params += [like_contains(word)] * 2
+    return f"product_id IN (SELECT id FROM products WHERE {' AND '.join(likes)})", params
+
+def where_clause(conditions):
+    """Texto WHERE y parámetros de una lista de (condición, parámetros)."""
+    if not conditions:
+        return "", []
+    return " WHERE " + " AND ".join(condition for condition, _ in conditions), [
+        param for _, params in conditions for param in params
+    ]
+
+def read_product_dictionary(conn):
+    """Diccionario de la tabla products para decodificar product_id.
+
+    Devuelve, para cada columna de PRODUCT_SQL_COLUMNS, (códigos, categorías): las
+    categorías son los valores distintos ordenados y códigos[product_id] la posición
+    del valor de ese producto en ellas (-1 si es NULL), así una columna de ids se
+    convierte en pd.Categorical sin crear una cadena por fila.
+    """
+    import numpy as np
+    import pandas as pd
+    
+    products = pd.read_sql_query("SELECT id, product_code, description FROM products", conn)
+    ids = products['id'].to_numpy(dtype='int64')
+    size = int(ids.max()) + 1 if len(ids) else 1
+    dictionary = {}
+    for column in PRODUCT_SQL_COLUMNS:
+        codes, categories = pd.factorize(products[column], sort=True)
+        codes_by_id = np.full(size, -1, dtype=codes.dtype)
+        codes_by_id[ids] = codes
+        dictionary[column] = (codes_by_id, categories)
+    return dictionary
+
+def typed_frame(df, columns, selected, product_columns, products):
+    """DataFrame con los nombres y tipos de create_dataframes a partir de las columnas leídas.
+
+    df trae las columnas de la tabla (product_id en lugar de las de PRODUCT_SQL_COLUMNS),
+    de SQLite o de la instantánea. Las columnas que no cambian de tipo no se copian.
+    """
+    import pandas as pd
+    
+    data = {}
+    product_ids = df['product_id'].to_numpy() if product_columns else None
+    for name, column in zip(columns, selected):
+        if column in product_columns:
+            codes_by_id, categories = products[column]
+            data[name] = pd.Categorical.from_codes(codes_by_id[product_ids], categories)
+        elif column == 'invoice_date' and not pd.api.types.is_datetime64_dtype(df[column]):
+            data[name] = pd.to_datetime(df[column], format='%Y-%m-%d')
+        elif column in MONEY_SQL_COLUMNS and df[column].dtype == object:
+            # Sin filas o con todo nulo SQLite no da el tipo: céntimos en int64, o float64 con NaN
+            data[name] = df[column].astype('float64' if df[column].isna().any() else 'int64')
+        else:
+            data[name] = df[column]
+    return pd.DataFrame(data, index=df.index, copy=False)
+
+def snapshot_schema(table):
+    """Esquema Arrow de la instantánea de table: fechas como timestamp, sin texto que volver a convertir."""
+    import pyarrow as pa
+    
+    types = {"id": pa.int64(), "product_id": pa.int64(), "position": pa.int64(), "invoice_date": pa.timestamp("ns"),
+             "invoice_number": pa.string(), "item_number": pa.string()}
+    types.update(dict.fromkeys(MONEY_SQL_COLUMNS, pa.int64()))
+    return pa.schema([(column, types.get(column, pa.float64())) for column in SNAPSHOT_TABLES[table]])
+
+def snapshot_record_batch(df, schema):
+    """Convierte un trozo leído de SQLite (columnas de SNAPSHOT_TABLES) en un RecordBatch de schema."""
+    import pandas as pd
+    import pyarrow as pa
+    
+    arrays = []
+    for field in schema:
+        values = df[field.name]
+        if field.name == "invoice_date":
+            values = pd.to_datetime(values, format='%Y-%m-%d')
+        # Los NaN de las cantidades y porcentajes se guardan como NaN y no como nulos: así se leen sin copiar
+        arrays.append(pa.array(values, type=field.type, from_pandas=not pa.types.is_floating(field.type)))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+def iter_row_batches(df, columns, batch_size=INSERT_BATCH_SIZE):
+    """Convierte un DataFrame en listas de tuplas (una por fila) de batch_size filas como máximo.
+
+    La fecha se convierte a texto 'AAAA-MM-DD' en una sola operación sobre la columna
+    (NaT pasa a None) y cada columna se pasa a tipos de Python con tolist() por lote,
+    sin recorrer las filas con to_dict('records'). Las columnas que falten valen None.
+    """
+    import pandas as pd
+    
+    n_rows = len(df)
+    if not n_rows:
+        return
+    
+    arrays = []
+    for column in columns:
+        if column not in df.columns:
+            arrays.append(None)
+        elif column == "Fecha Factura":
+            dates = pd.to_datetime(df[column])
+            arrays.append(dates.dt.strftime('%Y-%m-%d').astype(object).where(dates.notna(), None).to_numpy())
+        else:
+            arrays.append(df[column].to_numpy())
+    
+    for start in range(0, n_rows, batch_size):
+        end = min(start + batch_size, n_rows)
+        batch = [array[start:end].tolist() if array is not None else [None] * (end - start) for array in arrays]
+        yield list(zip(*batch))
+
+# Filas por sentencia al reescribir tablas en las migraciones
+MIGRATION_BATCH_SIZE = 200000
+
+def copy_table_in_batches(cursor, source, target, columns, expressions=None, batch_size=MIGRATION_BATCH_SIZE,
+                          on_progress=None):
+    """Copia las filas de source en target por rangos de id.
+
+    expressions da la expresión SQL de cada columna de destino (por defecto la
+    columna del mismo nombre), así la conversión de tipos se hace dentro de SQLite.
+    Los rangos recorren la clave primaria en orden y cada sentencia procesa como
+    mucho batch_size ids. Devuelve el número de filas copiadas.
+    """
+    expressions = expressions or columns
+    max_id = cursor.execute(f"SELECT MAX(id) FROM {source}").fetchone()[0] or 0
+    insert = (f"INSERT INTO {target} ({', '.join(columns)}) "
+              f"SELECT {', '.join(expressions)} FROM {source} WHERE id > ? AND id <= ? ORDER BY id")
+    copied = 0
+    for start in range(0, max_id, batch_size):
+        cursor.execute(insert, (start, start + batch_size))
+        copied += cursor.rowcount
+        if on_progress:
+            on_progress(copied)
+    return copied
+
+def rebuild_table(cursor, table, create_sql, columns, expressions=None, batch_size=MIGRATION_BATCH_SIZE,
+                  on_progress=None):
+    """Reescribe una tabla con un nuevo esquema (create_sql con {table} como nombre).
+
+    Los índices y triggers de la tabla anterior desaparecen con ella: la migración
+    debe volver a crearlos después.
+    """
+    new_table = f"{table}_new"
+    cursor.execute(f"DROP TABLE IF EXISTS {new_table}")
+    cursor.execute(create_sql.format(table=new_table))
+    copied = copy_table_in_batches(cursor, table, new_table, columns, expressions, batch_size, on_progress)
+    cursor.execute(f"DROP TABLE {table}")
+    cursor.execute(f"ALTER TABLE {new_table} RENAME TO {table}")
+    return copied
+
+def _migration_items_natural_key(cursor, on_progress=None):
+    # Las bases de datos anteriores pueden tener artículos repetidos por haber procesado
+    # varias veces los mismos PDFs: se deja la última versión de cada uno, como el upsert
+    cursor.execute("""
+        DELETE FROM items WHERE invoice_number IS NOT NULL AND id NOT IN (
+            SELECT MAX(id) FROM items WHERE invoice_number IS NOT NULL
+            GROUP BY invoice_number, position, item_number
+        )
+    """)
+    if cursor.rowcount:
+        print(f"Eliminados {cursor.rowcount} artículos duplicados")
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_items_natural_key ON items (invoice_number, position, item_number)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_items_invoice_date ON items (invoice_date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_items_product_code ON items (product_code)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_items_description ON items (description)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_invoices_invoice_date ON invoices (invoice_date)")
+
+# Tablas resumen de items que mantienen los triggers de ROLLUP_TRIGGERS en la misma
+# transacción que cada escritura. Los artículos sin número de factura se agrupan con ''.
+# Como en generate_statistics, los meses y los productos solo cuentan las líneas con
+# fecha e importe. Para cada tabla: SQL de creación y consulta que la calcula desde cero
+# (rebuild_rollups y check_rollups). Los importes van en céntimos, como en items; las
+# migraciones 2 y 3 las crean con estas definiciones y la 6 las vuelve a crear.
+ROLLUP_TABLES = {
+    "invoice_rollup": ("""
+        CREATE TABLE IF NOT EXISTS invoice_rollup (
+            invoice_number TEXT PRIMARY KEY,
+            n_items INTEGER,
+            net_value INTEGER,
+            quantity REAL,
+            price_sum INTEGER,
+            price_count INTEGER,
+            max_unit_price INTEGER
+        )
+    """, """
+        SELECT IFNULL(invoice_number, ''), COUNT(*), IFNULL(SUM(net_value), 0), TOTAL(quantity),
+               IFNULL(SUM(unit_price), 0), COUNT(unit_price), MAX(unit_price)
+        FROM items GROUP BY 1
+    """),
+    "monthly_rollup": ("""
+        CREATE TABLE IF NOT EXISTS monthly_rollup (
+            month TEXT PRIMARY KEY,
+            n_items INTEGER,
+            net_value INTEGER,
+            last_date TEXT
+        )
+    """, """
+        SELECT substr(invoice_date, 1, 7), COUNT(*), SUM(net_value), MAX(invoice_date)
+        FROM items WHERE invoice_date IS NOT NULL AND net_value IS NOT NULL GROUP BY 1
+    """),
+    "product_rollup": ("""
+        CREATE TABLE IF NOT EXISTS product_rollup (
+            product_id INTEGER PRIMARY KEY,
+            n_items INTEGER,
+            net_value INTEGER,
+            quantity REAL
+        )
+    """, """
+        SELECT product_id, COUNT(*), SUM(net_value), TOTAL(quantity)
+        FROM items WHERE invoice_date IS NOT NULL AND net_value IS NOT NULL GROUP BY 1
+    """),
+}
+# Diferencia máxima entre un valor del resumen y el recalculado: las sumas incrementales
+# de cantidades (REAL) acumulan errores de redondeo de coma flotante. Los importes son
+# enteros y tienen que coincidir exactamente
+ROLLUP_TOLERANCE = 0.005
+
+# Suma una línea nueva (NEW) a las tablas resumen por factura y por mes
+ROLLUP_ADD_NEW_INVOICE_MONTH = """
+    INSERT INTO invoice_rollup (invoice_number, n_items, net_value, quantity, price_sum, price_count, max_unit_price)
+    VALUES (IFNULL(NEW.invoice_number, ''), 1, IFNULL(NEW.net_value, 0), IFNULL(NEW.quantity, 0),
+            IFNULL(NEW.unit_price, 0), NEW.unit_price IS NOT NULL, NEW.unit_price)
+    ON CONFLICT (invoice_number) DO UPDATE SET
+        n_items = n_items + 1, net_value = net_value + excluded.net_value, quantity = quantity + excluded.quantity,
+        price_sum = price_sum + excluded.price_sum, price_count = price_count + excluded.price_count,
+        max_unit_price = MAX(IFNULL(max_unit_price, excluded.max_unit_price), IFNULL(excluded.max_unit_price, max_unit_price));
+    INSERT INTO monthly_rollup (month, n_items, net_value, last_date)
+    SELECT substr(NEW.invoice_date, 1, 7), 1, NEW.net_value, NEW.invoice_date
+    WHERE NEW.invoice_date IS NOT NULL AND NEW.net_value IS NOT NULL
+    ON CONFLICT (month) DO UPDATE SET
+        n_items = n_items + 1, net_value = net_value + excluded.net_value, last_date = MAX(last_date, excluded.last_date);
+"""
+# Resta una línea borrada o modificada (OLD). Los máximos no se pueden restar: se
+# recalculan con los artículos que quedan de la factura o del mes (por sus índices)
+ROLLUP_REMOVE_OLD_INVOICE_MONTH = """
+    UPDATE invoice_rollup SET
+        n_items = n_items - 1, net_value = net_value - IFNULL(OLD.net_value, 0), quantity = quantity - IFNULL(OLD.quantity, 0),
+        price_sum = price_sum - IFNULL(OLD.unit_price, 0), price_count = price_count - (OLD.unit_price IS NOT NULL),
+        max_unit_price = (SELECT MAX(unit_price) FROM items WHERE invoice_number IS OLD.invoice_number)
+    WHERE invoice_number = IFNULL(OLD.invoice_number, '');
+    DELETE FROM invoice_rollup WHERE invoice_number = IFNULL(OLD.invoice_number, '') AND n_items <= 0;
+    UPDATE monthly_rollup SET
+        n_items = n_items - 1, net_value = net_value - OLD.net_value,
+        last_date = (SELECT MAX(invoice_date) FROM items
+                     WHERE invoice_date >= month || '-01' AND invoice_date <= month || '-31' AND net_value IS NOT NULL)
+    WHERE month = substr(OLD.invoice_date, 1, 7) AND OLD.net_value IS NOT NULL;
+    DELETE FROM monthly_rollup WHERE month = substr(OLD.invoice_date, 1, 7) AND n_items <= 0;
+"""
+ROLLUP_ADD_NEW = ROLLUP_ADD_NEW_INVOICE_MONTH + """
+    INSERT INTO product_rollup (product_id, n_items, net_value, quantity)
+    SELECT NEW.product_id, 1, NEW.net_value, IFNULL(NEW.quantity, 0)
+    WHERE NEW.invoice_date IS NOT NULL AND NEW.net_value IS NOT NULL
+    ON CONFLICT (product_id) DO UPDATE SET
+        n_items = n_items + 1, net_value = net_value + excluded.net_value, quantity = quantity + excluded.quantity;
+"""
+ROLLUP_REMOVE_OLD = ROLLUP_REMOVE_OLD_INVOICE_MONTH + """
+    UPDATE product_rollup SET
+        n_items = n_items - 1, net_value = net_value - OLD.net_value, quantity = quantity - IFNULL(OLD.quantity, 0)
+    WHERE product_id = OLD.product_id AND OLD.invoice_date IS NOT NULL AND OLD.net_value IS NOT NULL;
+    DELETE FROM product_rollup WHERE product_id = OLD.product_id AND n_items <= 0;
+"""
+
+def rollup_trigger_sqls(add_new, remove_old, changed_columns):
+    """Triggers de INSERT, DELETE y UPDATE de items que aplican add_new y remove_old.
+
+    El de UPDATE solo se dispara si cambia alguna de changed_columns: volver a procesar
+    una factura sin cambios (upsert con los mismos valores) no toca los resúmenes.
+    """
+    changed = " OR ".join(f"OLD.{column} IS NOT NEW.{column}" for column in changed_columns)
+    return (
+        f"CREATE TRIGGER IF NOT EXISTS items_rollup_insert AFTER INSERT ON items BEGIN {add_new} END",
+        f"CREATE TRIGGER IF NOT EXISTS items_rollup_delete AFTER DELETE ON items BEGIN {remove_old} END",
+        f"CREATE TRIGGER IF NOT EXISTS items_rollup_update AFTER UPDATE ON items WHEN {changed} "
+        f"BEGIN {remove_old} {add_new} END",
+    )
+
+ROLLUP_TRIGGERS = rollup_trigger_sqls(ROLLUP_ADD_NEW, ROLLUP_REMOVE_OLD, (
+    "invoice_number", "invoice_date", "quantity", "unit_price", "product_id", "net_value"
+))
+
+# product_rollup y triggers de la versión 2 del esquema, cuando items guardaba
+# product_code y description: la migración 2 los crea así y la 3 los sustituye
+ROLLUP_PRODUCT_TABLE_V2 = ("""
+    CREATE TABLE IF NOT EXISTS product_rollup (
+        description TEXT,
+        product_code TEXT,
+        n_items INTEGER,
+        net_value REAL,
+        quantity REAL,
+        PRIMARY KEY (description, product_code)
+    )
+""", """
+    SELECT description, IFNULL(product_code, ''), COUNT(*), TOTAL(net_value), TOTAL(quantity)
+    FROM items WHERE description IS NOT NULL AND invoice_date IS NOT NULL AND net_value IS NOT NULL GROUP BY 1, 2
+""")
+ROLLUP_TRIGGERS_V2 = rollup_trigger_sqls(ROLLUP_ADD_NEW_INVOICE_MONTH + """
+    INSERT INTO product_rollup (description, product_code, n_items, net_value, quantity)
+    SELECT NEW.description, IFNULL(NEW.product_code, ''), 1, NEW.net_value, IFNULL(NEW.quantity, 0)
+    WHERE NEW.description IS NOT NULL AND NEW.invoice_date IS NOT NULL AND NEW.net_value IS NOT NULL
+    ON CONFLICT (description, product_code) DO UPDATE SET
+        n_items = n_items + 1, net_value = net_value + excluded.net_value, quantity = quantity + excluded.quantity;
+""", ROLLUP_REMOVE_OLD_INVOICE_MONTH + """
+    UPDATE product_rollup SET
+        n_items = n_items - 1, net_value = net_value - OLD.net_value, quantity = quantity - IFNULL(OLD.quantity, 0)
+    WHERE description = OLD.description AND product_code = IFNULL(OLD.product_code, '')
+        AND OLD.invoice_date IS NOT NULL AND OLD.net_value IS NOT NULL;
+    DELETE FROM product_rollup WHERE description = OLD.description AND product_code = IFNULL(OLD.product_code, '') AND n_items <= 0;
+""", ("invoice_number", "invoice_date", "quantity", "unit_price", "product_code", "net_value", "description"))
+
+def create_rollup_triggers(cursor):
+    """Crea los triggers de las tablas resumen; las migraciones que reescriben items deben volver a llamarla."""
+    for trigger_sql in ROLLUP_TRIGGERS:
+        cursor.execute(trigger_sql)
+
+def fill_rollups(cursor):
+    """Calcula desde cero el contenido de las tablas resumen."""
+    for table, (_, select_sql) in ROLLUP_TABLES.items():
+        cursor.execute(f"DELETE FROM {table}")
+        cursor.execute(f"INSERT INTO {table} {select_sql}")
+
+def _migration_rollups(cursor, on_progress=None):
+    rollup_tables = dict(ROLLUP_TABLES, product_rollup=ROLLUP_PRODUCT_TABLE_V2)
+    for table, (create_sql, select_sql) in rollup_tables.items():
+        cursor.execute(create_sql)
+        cursor.execute(f"INSERT INTO {table} {select_sql}")
+    for trigger_sql in ROLLUP_TRIGGERS_V2:
+        cursor.execute(trigger_sql)
+
+def _migration_products(cursor, on_progress=None):
+    # Un producto por cada par (código, descripción) distinto; DISTINCT trata los NULL como iguales
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS products (
+            id INTEGER PRIMARY KEY,
+            product_code TEXT,
+            description TEXT,
+            UNIQUE (product_code, description)
+        )
+    """)
+    cursor.execute("""
+        INSERT INTO products (product_code, description)
+        SELECT DISTINCT product_code, description FROM items ORDER BY product_code, description
+    """)
+    columns = ["id", "invoice_number", "invoice_date", "item_number", "position", "quantity", "unit_price",
+               "product_id", "discount", "iva", "net_value"]
+    expressions = list(columns)
+    expressions[columns.index("product_id")] = ("(SELECT id FROM products WHERE product_code IS items.product_code "
+                                                "AND description IS items.description)")
+    rebuild_table(cursor, "items", """
+        CREATE TABLE {table} (
+            id INTEGER PRIMARY KEY,
+            invoice_number TEXT,
+            invoice_date TEXT,
+            item_number TEXT,
+            position INTEGER,
+            quantity REAL,
+            unit_price REAL,
+            product_id INTEGER NOT NULL REFERENCES products (id),
+            discount REAL,
+            iva REAL,
+            net_value REAL
+        )
+    """, columns, expressions, on_progress=on_progress)
+    cursor.execute("CREATE UNIQUE INDEX idx_items_natural_key ON items (invoice_number, position, item_number)")
+    cursor.execute("CREATE INDEX idx_items_invoice_date ON items (invoice_date)")
+    cursor.execute("CREATE INDEX idx_items_product_id ON items (product_id)")
+    
+    # Los triggers de la versión 2 han desaparecido con la tabla anterior
+    create_sql, select_sql = ROLLUP_TABLES["product_rollup"]
+    cursor.execute("DROP TABLE product_rollup")
+    cursor.execute(create_sql)
+    cursor.execute(f"INSERT INTO product_rollup {select_sql}")
+    create_rollup_triggers(cursor)
+
+# Índice de texto de los productos para search_items: tabla FTS5 con el contenido de
+# products (no duplica los textos) que mantienen los triggers al dar de alta productos.
+# El tokenizador ignora mayúsculas y acentos
+SEARCH_INDEX_SQL = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+        product_code, description, content='products', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts (rowid, product_code, description) VALUES (NEW.id, NEW.product_code, NEW.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts (products_fts, rowid, product_code, description)
+        VALUES ('delete', OLD.id, OLD.product_code, OLD.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE ON products BEGIN
+        INSERT INTO products_fts (products_fts, rowid, product_code, description)
+        VALUES ('delete', OLD.id, OLD.product_code, OLD.description);
+        INSERT INTO products_fts (rowid, product_code, description) VALUES (NEW.id, NEW.product_code, NEW.description);
+    END""",
+)
+
+def _migration_search_index(cursor, on_progress=None):
+    # Con un SQLite compilado sin FTS5 no se crea: search_items busca entonces con LIKE
+    try:
+        cursor.execute(SEARCH_INDEX_SQL[0])
+    except sqlite3.OperationalError as e:
+        print(f"Búsqueda sin índice de texto (FTS5 no disponible): {e}")
+        return
+    for trigger_sql in SEARCH_INDEX_SQL[1:]:
+        cursor.execute(trigger_sql)
+    cursor.execute("INSERT INTO products_fts (products_fts) VALUES ('rebuild')")
+
+# Contador de cambios de items e invoices que mantienen los triggers: la instantánea en
+# columnas está al día si guarda la misma versión. rewrites solo cuenta modificaciones y
+# borrados; mientras no cambie basta con añadir a la instantánea las filas de id mayor
+DATA_VERSION_TABLE = """
+    CREATE TABLE IF NOT EXISTS data_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL,
+        rewrites INTEGER NOT NULL
+    )
+"""
+
+def data_version_trigger_sqls(table):
+    """Triggers de table que incrementan data_version; el de UPDATE solo si cambia alguna columna."""
+    changed = " OR ".join(f"OLD.{column} IS NOT NEW.{column}" for column in SNAPSHOT_TABLES[table] if column != "id")
+    rewrite = "UPDATE data_version SET version = version + 1, rewrites = rewrites + 1;"
+    return (
+        f"CREATE TRIGGER IF NOT EXISTS {table}_version_insert AFTER INSERT ON {table} "
+        f"BEGIN UPDATE data_version SET version = version + 1; END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_version_delete AFTER DELETE ON {table} BEGIN {rewrite} END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_version_update AFTER UPDATE ON {table} WHEN {changed} "
+        f"BEGIN {rewrite} END",
+    )
+
+DATA_VERSION_TRIGGERS = data_version_trigger_sqls("items") + data_version_trigger_sqls("invoices")
+
+def create_data_version_triggers(cursor):
+    """Crea los triggers de data_version; las migraciones que reescriben items o invoices deben volver a llamarla."""
+    for trigger_sql in DATA_VERSION_TRIGGERS:
+        cursor.execute(trigger_sql)
+
+def _migration_data_version(cursor, on_progress=None):
+    cursor.execute(DATA_VERSION_TABLE)
+    cursor.execute("INSERT OR IGNORE INTO data_version (id, version, rewrites) VALUES (1, 0, 0)")
+    create_data_version_triggers(cursor)
+
+def _migration_money_cents(cursor, on_progress=None):
+    # Los importes pasan de REAL en euros a INTEGER en céntimos (redondeados al céntimo)
+    def cents(column):
+        return f"CAST(ROUND({column} * 100) AS INTEGER)"
+    
+    columns = ["id", "invoice_number", "invoice_date", "item_number", "position", "quantity", "unit_price",
+               "product_id", "discount", "iva", "net_value"]
+    expressions = [cents(column) if column in ("unit_price", "net_value") else column for column in columns]
+    rebuild_table(cursor, "items", """
+        CREATE TABLE {table} (
+            id INTEGER PRIMARY KEY,
+            invoice_number TEXT,
+            invoice_date TEXT,
+            item_number TEXT,
+            position INTEGER,
+            quantity REAL,
+            unit_price INTEGER,
+            product_id INTEGER NOT NULL REFERENCES products (id),
+            discount REAL,
+            iva REAL,
+            net_value INTEGER
+        )
+    """, columns, expressions, on_progress=on_progress)
+    cursor.execute("CREATE UNIQUE INDEX idx_items_natural_key ON items (invoice_number, position, item_number)")
+    cursor.execute("CREATE INDEX idx_items_invoice_date ON items (invoice_date)")
+    cursor.execute("CREATE INDEX idx_items_product_id ON items (product_id)")
+    
+    columns = ["id", "invoice_number", "invoice_date", "ports", "net_value", "iva", "iva_amount", "total_amount"]
+    expressions = [cents(column) if column in ("ports", "net_value", "iva_amount", "total_amount") else column
+                   for column in columns]
+    rebuild_table(cursor, "invoices", """
+        CREATE TABLE {table} (
+            id INTEGER PRIMARY KEY,
+            invoice_number TEXT UNIQUE,
+            invoice_date TEXT,
+            ports INTEGER,
+            net_value INTEGER,
+            iva REAL,
+            iva_amount INTEGER,
+            total_amount INTEGER
+        )
+    """, columns, expressions)
+    cursor.execute("CREATE INDEX idx_invoices_invoice_date ON invoices (invoice_date)")
+    
+    # Las tablas resumen se recalculan en céntimos y los triggers han desaparecido con las tablas
+    for table, (create_sql, select_sql) in ROLLUP_TABLES.items():
+        cursor.execute(f"DROP TABLE {table}")
+        cursor.execute(create_sql)
+        cursor.execute(f"INSERT INTO {table} {select_sql}")
+    create_rollup_triggers(cursor)
+    create_data_version_triggers(cursor)
+    cursor.execute("UPDATE data_version SET version = version + 1, rewrites = rewrites + 1")
+
+# Migraciones del esquema en orden: (versión, descripción, función(cursor, on_progress)).
+# create_tables crea el esquema inicial (versión 0) y después se aplican todas, así una
+# base de datos nueva y una antigua terminan con el mismo esquema. No se modifican las
+# migraciones ya publicadas: cada cambio es una versión nueva al final de la lista.
+SCHEMA_MIGRATIONS = [
+    (1, "clave natural de artículos e índices de fechas y productos", _migration_items_natural_key),
+    (2, "tablas resumen por mes, producto y factura", _migration_rollups),
+    (3, "tabla de productos: los artículos guardan el id del producto", _migration_products),
+    (4, "índice de búsqueda de texto de productos (FTS5)", _migration_search_index),
+    (5, "contador de versión de los datos para la instantánea en columnas", _migration_data_version),
+    (6, "importes en céntimos enteros", _migration_money_cents),
+]
+
 class DatabaseManager:
-    def __init__(self, db_name="expenditure_data.db"):
+    """Acceso a la base de datos con conexiones de larga duración.
+
+    Todas las escrituras pasan por una única conexión protegida por un lock y las
+    lecturas usan un pequeño pool de conexiones. En modo WAL los lectores no esperan
+    al escritor, así la ingesta y las estadísticas pueden ejecutarse a la vez.
+    """
+    def __init__(self, db_name="expenditure_data.db", read_pool_size=READ_POOL_SIZE):
         app_data_path = get_app_data_path()
         self.db_path = os.path.join(app_data_path, db_name)
+        self._write_lock = threading.Lock()
+        self._writer = None
+        self._readers = queue.LifoQueue(maxsize=read_pool_size)
+        self._search_index = None
+        # Instantánea en columnas de items e invoices (ver refresh_snapshot)
+        self.snapshot_dir = self.db_path + "-snapshot"
+        self._snapshot_lock = threading.Lock()
 
-    def create_tables(self):
-        """Crea las tablas si no existen."""
+    def _connect(self):
+        # Las conexiones se comparten entre los hilos de la interfaz: el lock y el pool
+        # garantizan que cada una la usa un solo hilo a la vez
+        conn = sqlite3.connect(self.db_path, timeout=SQLITE_BUSY_TIMEOUT, isolation_level=None,
+                               check_same_thread=False)
+        for pragma in SQLITE_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    @contextmanager
+    def write_transaction(self):
+        """Abre una transacción en la conexión de escritura y devuelve su cursor.
+
+        Confirma al salir del bloque y la deshace si se produce una excepción.
+        """
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self._connect()
+            cursor = self._writer.cursor()
+            # IMMEDIATE toma el bloqueo de escritura al empezar: otro proceso que escriba
+            # a la vez espera (busy timeout) en lugar de fallar a mitad de la transacción
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                yield cursor
+            except BaseException:
+                self._writer.rollback()
+                raise
+            self._writer.commit()
+
+    @contextmanager
+    def read_connection(self):
+        """Presta una conexión de lectura del pool (o una nueva si todas están en uso)."""
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            try:
+                self._readers.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def close(self):
+        """Cierra las conexiones abiertas; se vuelven a abrir si se sigue usando el objeto."""
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def create_tables(self, migrate=True):
+        """Crea las tablas si no existen.
+
+        Con migrate=False la base de datos se queda en el esquema inicial (versión 0),
+        sin aplicar SCHEMA_MIGRATIONS (para medir o probar las migraciones).
+        """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
             items_table = """
             CREATE TABLE IF NOT EXISTS items (
                 id INTEGER PRIMARY KEY,
@@ -72,149 +1270,1443 @@ class DatabaseManager:
             );
             """
             
-            cursor.execute(items_table)
-            cursor.execute(invoices_table)
-            conn.commit()
-            conn.close()
+            # Registro de los PDFs ya procesados para no volver a extraerlos
+            manifest_table = """
+            CREATE TABLE IF NOT EXISTS ingest_manifest (
+                file_path TEXT PRIMARY KEY,
+                file_size INTEGER,
+                mtime REAL,
+                content_hash TEXT,
+                parser_version INTEGER,
+                invoice_numbers TEXT,
+                processed_at TEXT
+            );
+            """
+            
+            # Tiempos por etapa y contadores de cada ejecución (ver RunMetrics)
+            run_log_table = """
+            CREATE TABLE IF NOT EXISTS run_log (
+                id INTEGER PRIMARY KEY,
+                command TEXT,
+                started_at TEXT,
+                duration REAL,
+                stages TEXT,
+                counters TEXT
+            );
+            """
+            
+            with self.write_transaction() as cursor:
+                cursor.execute(items_table)
+                cursor.execute(invoices_table)
+                cursor.execute(manifest_table)
+                cursor.execute(run_log_table)
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_manifest_hash ON ingest_manifest (content_hash, parser_version)")
+            if migrate:
+                self.migrate()
         except sqlite3.Error as e:
             print(f"Error creando tablas de la base de datos: {e}")
-            messagebox.showerror("Error de Base de Datos", f"No se pudo crear las tablas: {e}")
+            raise
+
+    def schema_version(self):
+        with self.read_connection() as conn:
+            return conn.execute("PRAGMA user_version").fetchone()[0]
 
-    def insert_data(self, df_items, df_totals):
-        """Inserta datos en la base de datos."""
+    def migrate(self, on_progress=None):
+        """Aplica en orden las migraciones pendientes de SCHEMA_MIGRATIONS.
+
+        Cada migración y su cambio de PRAGMA user_version se hacen en una sola
+        transacción: si falla, la base de datos se queda en la versión anterior sin
+        perder datos. on_progress(filas) recibe el avance de las tablas que se
+        reescriben por lotes. Devuelve la versión final del esquema.
+        """
+        latest = SCHEMA_MIGRATIONS[-1][0]
+        version = self.schema_version()
+        if version > latest:
+            raise sqlite3.DatabaseError(
+                f"La base de datos tiene la versión {version} del esquema y esta aplicación solo conoce hasta la {latest}"
+            )
+        
+        for number, description, migration in SCHEMA_MIGRATIONS:
+            if number <= version:
+                continue
+            start = time.perf_counter()
+            with self.write_transaction() as cursor:
+                # Otro proceso puede haberla aplicado mientras esperábamos el bloqueo
+                if cursor.execute("PRAGMA user_version").fetchone()[0] >= number:
+                    continue
+                print(f"Migrando la base de datos a la versión {number}: {description}")
+                migration(cursor, on_progress)
+                cursor.execute(f"PRAGMA user_version = {number}")
+            print(f"Migración {number} completada en {time.perf_counter() - start:.2f} s")
+        return max(version, latest)
+
+    def insert_data(self, df_items, df_totals, manifest_entries=None, batch_size=INSERT_BATCH_SIZE):
+        """Inserta datos en la base de datos.
+
+        Todas las filas se escriben en una sola transacción explícita con executemany,
+        en lotes de batch_size filas convertidas a tuplas de columnas; las fechas se
+        pasan a texto de una vez por columna. Las entradas del manifiesto se guardan
+        en la misma transacción que los datos, así un PDF solo se marca como procesado
+        si sus filas se han guardado. Devuelve el número de filas insertadas.
+        """
+        start = time.perf_counter()
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            items_to_insert = df_items.to_dict('records')
-            for item in items_to_insert:
-                # Corregido: convertir Timestamp a cadena de texto, manejando NaT
-                invoice_date_ts = item.get('Fecha Factura')
-                if pd.isna(invoice_date_ts):
-                    invoice_date_str = None
-                else:
-                    invoice_date_str = invoice_date_ts.strftime('%Y-%m-%d')
+            with self.write_transaction() as cursor:
+                n_rows = 0
+                for rows in iter_row_batches(df_items, ITEM_COLUMNS, batch_size):
+                    self._write_items(cursor, rows)
+                    n_rows += len(rows)
                 
-                cursor.execute("""
-                    INSERT OR REPLACE INTO items (
-                        invoice_number, invoice_date, item_number, position, quantity, 
-                        unit_price, product_code, discount, iva, net_value, description
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    item.get('Nº Factura'), invoice_date_str, item.get('Nº Artículo'),
-                    item.get('Posición'), item.get('Cantidad'), item.get('Precio Unitario (EUR)'),
-                    item.get('Código Producto'), item.get('Descuento %'), item.get('IVA %'),
-                    item.get('Valor Neto (EUR)'), item.get('Descripción')
-                ))
-
-            totals_to_insert = df_totals.to_dict('records')
-            for total in totals_to_insert:
-                # Corregido: convertir Timestamp a cadena de texto, manejando NaT
-                invoice_date_ts = total.get('Fecha Factura')
-                if pd.isna(invoice_date_ts):
-                    invoice_date_str = None
-                else:
-                    invoice_date_str = invoice_date_ts.strftime('%Y-%m-%d')
+                for rows in iter_row_batches(df_totals, TOTAL_COLUMNS, batch_size):
+                    cursor.executemany(INVOICE_INSERT_SQL, rows)
+                    n_rows += len(rows)
                 
-                cursor.execute("""
-                    INSERT OR IGNORE INTO invoices (
-                        invoice_number, invoice_date, ports, net_value, iva, iva_amount, total_amount
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    total.get('Nº Factura'), invoice_date_str, total.get('Portes (EUR)'),
-                    total.get('Valor Neto (EUR)'), total.get('IVA %'), total.get('Importe IVA (EUR)'),
-                    total.get('Importe Total (EUR)')
-                ))
-            
-            conn.commit()
-            conn.close()
+                if manifest_entries:
+                    self._write_manifest(cursor, manifest_entries)
         except sqlite3.Error as e:
             print(f"Error insertando datos en la base de datos: {e}")
             raise
+        
+        elapsed = time.perf_counter() - start
+        if n_rows:
+            print(f"Insertadas {n_rows} filas en {elapsed:.2f} s ({n_rows / max(elapsed, 1e-9):,.0f} filas/s)")
+        return n_rows
+
+    def insert_rows(self, item_rows, total_rows, manifest_entries=None, replace_invoices=None):
+        """Inserta filas ya convertidas (ver item_to_db_row/total_to_db_row) en una sola transacción.
+
+        Las filas existentes de las facturas de replace_invoices se borran antes de insertar.
+        """
+        self.insert_batches([(item_rows, total_rows, manifest_entries, replace_invoices)])
+
+    def insert_batches(self, batches):
+        """Inserta varios lotes (item_rows, total_rows, manifest_entries, replace_invoices) en una transacción.
+
+        Los lotes se aplican en orden, como varias llamadas seguidas a insert_rows.
+        """
+        try:
+            with self.write_transaction() as cursor:
+                for item_rows, total_rows, manifest_entries, replace_invoices in batches:
+                    if replace_invoices:
+                        numbers = [(number,) for number in replace_invoices]
+                        cursor.executemany("DELETE FROM items WHERE invoice_number = ?", numbers)
+                        cursor.executemany("DELETE FROM invoices WHERE invoice_number = ?", numbers)
+                    self._write_items(cursor, item_rows)
+                    cursor.executemany(INVOICE_INSERT_SQL, total_rows)
+                    
+                    if manifest_entries:
+                        self._write_manifest(cursor, manifest_entries)
+        except sqlite3.Error as e:
+            print(f"Error insertando datos en la base de datos: {e}")
+            raise
+
+    @staticmethod
+    def _write_items(cursor, item_rows):
+        # Primero los productos nuevos de las filas: el upsert de items busca su id en products
+        cursor.executemany(PRODUCT_INSERT_SQL, {(row[PRODUCT_CODE_INDEX], row[DESCRIPTION_INDEX]) for row in item_rows})
+        cursor.executemany(ITEM_UPSERT_SQL, item_rows)
+
+    def record_manifest(self, manifest_entries):
+        """Marca como procesados PDFs que no han aportado datos."""
+        try:
+            with self.write_transaction() as cursor:
+                self._write_manifest(cursor, manifest_entries)
+        except sqlite3.Error as e:
+            print(f"Error guardando el manifiesto de PDFs: {e}")
+            raise
+
+    def _write_manifest(self, cursor, manifest_entries):
+        processed_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        cursor.executemany("""
+            INSERT OR REPLACE INTO ingest_manifest (
+                file_path, file_size, mtime, content_hash, parser_version, invoice_numbers, processed_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, [
+            (entry['file_path'], entry['file_size'], entry['mtime'], entry['content_hash'],
+             entry['parser_version'], json.dumps(entry['invoice_numbers']), processed_at)
+            for entry in manifest_entries
+        ])
+
+    def get_manifest(self):
+        """Devuelve el manifiesto de PDFs procesados indexado por ruta."""
+        try:
+            with self.read_connection() as conn:
+                rows = conn.execute("""
+                    SELECT file_path, file_size, mtime, content_hash, parser_version, invoice_numbers
+                    FROM ingest_manifest
+                """).fetchall()
+        except sqlite3.Error as e:
+            print(f"Error leyendo el manifiesto de PDFs: {e}")
+            return {}
+        
+        return {
+            row[0]: {
+                'file_path': row[0], 'file_size': row[1], 'mtime': row[2], 'content_hash': row[3],
+                'parser_version': row[4], 'invoice_numbers': json.loads(row[5] or '[]')
+            }
+            for row in rows
+        }
+    
+    def record_run(self, metrics):
+        """Guarda en run_log los tiempos y contadores de una ejecución."""
+        try:
+            with self.write_transaction() as cursor:
+                cursor.execute("""
+                    INSERT INTO run_log (command, started_at, duration, stages, counters) VALUES (?, ?, ?, ?, ?)
+                """, (metrics.command, metrics.started_at, metrics.duration,
+                      json.dumps(metrics.stages), json.dumps(metrics.counters)))
+        except sqlite3.Error as e:
+            print(f"Error guardando el registro de ejecución: {e}")
+            raise
+    
+    def get_run_log(self, limit=20):
+        """Devuelve las últimas ejecuciones registradas, de la más reciente a la más antigua."""
+        try:
+            with self.read_connection() as conn:
+                rows = conn.execute("""
+                    SELECT command, started_at, duration, stages, counters FROM run_log ORDER BY id DESC LIMIT ?
+                """, (limit,)).fetchall()
+        except sqlite3.Error as e:
+            print(f"Error leyendo el registro de ejecuciones: {e}")
+            return []
+        
+        return [
+            {'command': row[0], 'started_at': row[1], 'duration': row[2],
+             'stages': json.loads(row[3] or '{}'), 'counters': json.loads(row[4] or '{}')}
+            for row in rows
+        ]
     
     def get_all_data(self):
         """Obtiene todos los datos de la base de datos."""
+        import pandas as pd
+        
+        try:
+            return self.query_data()
+        except Exception as e:
+            print(f"Error obteniendo datos de la base de datos: {e}")
+            return pd.DataFrame(), pd.DataFrame()
+
+    def query_items(self, columns=None, limit=None, **filters):
+        """Artículos que cumplen los filtros, con las columnas de create_dataframes.
+
+        Filtros: start_date y end_date (inclusivos, texto AAAA-MM-DD o fechas),
+        invoice_numbers, product_code y description (ver query_filter_conditions).
+        Se aplican en SQL sobre los índices de la tabla, así solo se leen las filas y
+        columnas pedidas. columns elige las columnas por su nombre en el DataFrame
+        ("id" incluido) y limit el número máximo de filas, en orden de inserción.
+        """
+        invoice_conditions, product_conditions = query_filter_conditions(**filters)
+        try:
+            with self.read_connection() as conn:
+                return self._load_frame(conn, "items", ITEM_SQL_COLUMNS, columns,
+                                        invoice_conditions + product_conditions, limit)
+        except sqlite3.Error as e:
+            print(f"Error consultando artículos: {e}")
+            raise
+
+    def query_invoices(self, columns=None, limit=None, **filters):
+        """Totales de las facturas que cumplen los filtros (los mismos que query_items).
+
+        Con filtros de producto se devuelven las facturas que tienen algún artículo que
+        los cumple.
+        """
+        try:
+            with self.read_connection() as conn:
+                return self._load_frame(conn, "invoices", TOTAL_SQL_COLUMNS, columns,
+                                        self._invoice_conditions(*query_filter_conditions(**filters)), limit)
+        except sqlite3.Error as e:
+            print(f"Error consultando facturas: {e}")
+            raise
+
+    def query_data(self, item_columns=None, total_columns=None, limit=None, **filters):
+        """Artículos y totales filtrados como query_items y query_invoices, de la misma versión de los datos.
+
+        limit se aplica a cada tabla por separado.
+        """
+        invoice_conditions, product_conditions = query_filter_conditions(**filters)
+        try:
+            with self.read_connection() as conn:
+                # Una sola transacción de lectura: artículos y totales de la misma versión de los datos
+                conn.execute("BEGIN")
+                df_items = self._load_frame(conn, "items", ITEM_SQL_COLUMNS, item_columns,
+                                            invoice_conditions + product_conditions, limit)
+                df_invoices = self._load_frame(conn, "invoices", TOTAL_SQL_COLUMNS, total_columns,
+                                               self._invoice_conditions(invoice_conditions, product_conditions), limit)
+        except sqlite3.Error as e:
+            print(f"Error consultando datos: {e}")
+            raise
+        return df_items, df_invoices
+
+    def count_items(self, **filters):
+        """Número de artículos que cumplen los filtros, sin cargar las filas."""
+        invoice_conditions, product_conditions = query_filter_conditions(**filters)
+        where, params = where_clause(invoice_conditions + product_conditions)
+        with self.read_connection() as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM items{where}", params).fetchone()[0]
+
+    def has_search_index(self):
+        """True si la base de datos tiene el índice FTS5 de search_items."""
+        if self._search_index is None:
+            with self.read_connection() as conn:
+                self._search_index = conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'"
+                ).fetchone() is not None
+        return self._search_index
+
+    def search_items(self, text, limit=SEARCH_PAGE_SIZE, offset=0, columns=SEARCH_ITEM_COLUMNS,
+                     count_limit=SEARCH_COUNT_LIMIT):
+        """Artículos cuyo producto contiene todas las palabras de text en el código o la descripción.
+
+        La búsqueda se hace en el índice FTS5 de la tabla products, que tiene una fila por
+        producto y no por compra; sin FTS5 (ver has_search_index) se busca con LIKE.
+        Devuelve (página, total): los artículos de offset a offset + limit, del más reciente
+        al más antiguo, y el número de artículos encontrados, o None si son más de
+        count_limit.
+        """
+        condition = search_condition(text, full_text=self.has_search_index())
+        if condition is None:
+            return self.query_items(columns=columns, limit=0), 0
+        sql, params = condition
+        try:
+            with self.read_connection() as conn:
+                conn.execute("BEGIN")
+                total = conn.execute(f"SELECT COUNT(*) FROM (SELECT 1 FROM items WHERE {sql} LIMIT ?)",
+                                     params + [count_limit + 1]).fetchone()[0]
+                # Con muchos artículos encontrados, ordenarlos todos cuesta más que recorrer el
+                # índice de fechas hacia atrás hasta llenar la página: se estima con product_rollup
+                # y se desactiva el índice de product_id con + para que SQLite use el de fechas
+                if total > count_limit:
+                    matched, n_items = conn.execute(f"""
+                        SELECT TOTAL(CASE WHEN {sql} THEN n_items END), TOTAL(n_items) FROM product_rollup
+                    """, params).fetchone()
+                    if (offset + (limit or 0)) * n_items < matched * matched:
+                        sql = "+" + sql
+                page = self._read_frame(conn, "items", ITEM_SQL_COLUMNS, columns, [(sql, params)], limit,
+                                        offset=offset, order_by="invoice_date DESC, id DESC")
+        except sqlite3.Error as e:
+            print(f"Error buscando artículos: {e}")
+            raise
+        return page, None if total > count_limit else total
+
+    def rollup_statistics(self):
+        """Estadísticas de generate_statistics sobre todos los datos, leídas de las tablas resumen.
+
+        Solo se leen unos cientos de filas agregadas (y el artículo más caro por el
+        índice de facturas) en lugar de agrupar toda la tabla items.
+        """
+        import pandas as pd
+        
+        accumulator = StatisticsAccumulator()
+        try:
+            with self.read_connection() as conn:
+                conn.execute("BEGIN")
+                (accumulator.n_items, accumulator.n_invoices, accumulator.total_spent, accumulator.price_sum,
+                 accumulator.price_count, max_price) = conn.execute("""
+                    SELECT IFNULL(SUM(n_items), 0), COUNT(*), IFNULL(SUM(net_value), 0),
+                           IFNULL(SUM(price_sum), 0), IFNULL(SUM(price_count), 0), MAX(max_unit_price)
+                    FROM invoice_rollup
+                """).fetchone()
+                
+                if max_price is not None:
+                    # El primero en orden de inserción, como idxmax en generate_statistics. Se busca
+                    # en las facturas con ese máximo; si es de un artículo sin número de factura
+                    # (agrupados con ''), en toda la tabla
+                    price_condition = ("unit_price = ?", [max_price])
+                    invoice_condition = ("invoice_number IN (SELECT invoice_number FROM invoice_rollup "
+                                         "WHERE max_unit_price = ?)", [max_price])
+                    for conditions in ([invoice_condition, price_condition], [price_condition]):
+                        item = self._read_frame(conn, "items", ITEM_SQL_COLUMNS, STATS_ITEM_COLUMNS, conditions, limit=1)
+                        if not item.empty:
+                            accumulator.most_expensive_item = item.iloc[0]
+                            break
+                
+                months = conn.execute("SELECT month, net_value, last_date FROM monthly_rollup ORDER BY month").fetchall()
+                if months:
+                    accumulator.monthly_spending = pd.Series(
+                        [net_value for _, net_value, _ in months], name='Valor Neto (EUR)',
+                        index=pd.PeriodIndex([month for month, _, _ in months], freq='M', name='Mes'))
+                    accumulator.last_date = pd.Timestamp(max(last_date for _, _, last_date in months))
+                
+                products = pd.read_sql_query("""
+                    SELECT products.description, SUM(net_value), SUM(quantity), SUM(n_items)
+                    FROM product_rollup JOIN products ON products.id = product_rollup.product_id
+                    WHERE products.description IS NOT NULL
+                    GROUP BY products.description ORDER BY products.description
+                """, conn, index_col='description')
+                if not products.empty:
+                    products.columns = ['Valor Neto (EUR)', 'Cantidad', 'count']
+                    accumulator.products = products.rename_axis('Descripción')
+                
+                (accumulator.n_totals, accumulator.total_taxes, accumulator.invoice_total_sum,
+                 accumulator.invoice_total_count) = conn.execute(
+                    "SELECT COUNT(*), IFNULL(SUM(iva_amount), 0), IFNULL(SUM(total_amount), 0), COUNT(total_amount) "
+                    "FROM invoices"
+                ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Error leyendo las tablas resumen: {e}")
+            raise
+        return accumulator.result()
+
+    def rebuild_rollups(self):
+        """Vuelve a calcular desde cero las tablas resumen a partir de items."""
+        start = time.perf_counter()
+        try:
+            with self.write_transaction() as cursor:
+                fill_rollups(cursor)
+        except sqlite3.Error as e:
+            print(f"Error reconstruyendo las tablas resumen: {e}")
+            raise
+        print(f"Tablas resumen reconstruidas en {time.perf_counter() - start:.2f} s")
+
+    def check_rollups(self, tolerance=ROLLUP_TOLERANCE):
+        """Compara las tablas resumen con lo que se obtiene de items.
+
+        Devuelve la lista de diferencias como (tabla, clave, fila guardada, fila
+        recalculada), con None en lugar de la fila si falta en uno de los lados; los
+        importes se comparan con una tolerancia de tolerance. Lista vacía si coinciden.
+        """
+        differences = []
+        try:
+            with self.read_connection() as conn:
+                conn.execute("BEGIN")
+                for table, (_, select_sql) in ROLLUP_TABLES.items():
+                    table_info = conn.execute(f"PRAGMA table_info({table})").fetchall()
+                    keys = [row[1] for row in table_info if row[5]]
+                    values = [row[1] for row in table_info if not row[5]]
+                    
+                    # El recálculo va a una tabla temporal de la conexión: no bloquea a los escritores
+                    conn.execute("DROP TABLE IF EXISTS temp.rollup_check")
+                    conn.execute(f"CREATE TEMP TABLE rollup_check AS SELECT * FROM {table} WHERE 0")
+                    conn.execute(f"INSERT INTO temp.rollup_check {select_sql}")
+                    
+                    join = " AND ".join(f"stored.{key} = expected.{key}" for key in keys)
+                    differs = " OR ".join(
+                        f"NOT (stored.{value} IS expected.{value} OR ABS(stored.{value} - expected.{value}) <= ?)"
+                        for value in values
+                    )
+                    stored_columns = ", ".join(f"stored.{column}" for column in keys + values)
+                    expected_columns = ", ".join(f"expected.{column}" for column in keys + values)
+                    rows = conn.execute(f"""
+                        SELECT {stored_columns}, {expected_columns} FROM temp.rollup_check AS expected
+                        LEFT JOIN {table} AS stored ON {join}
+                        WHERE stored.{keys[0]} IS NULL OR {differs}
+                        UNION ALL
+                        SELECT {stored_columns}, {expected_columns} FROM {table} AS stored
+                        LEFT JOIN temp.rollup_check AS expected ON {join}
+                        WHERE expected.{keys[0]} IS NULL
+                    """, [tolerance] * len(values)).fetchall()
+                    conn.execute("DROP TABLE temp.rollup_check")
+                    
+                    width = len(keys) + len(values)
+                    for row in rows:
+                        stored, expected = row[:width], row[width:]
+                        stored = None if stored[0] is None else stored
+                        expected = None if expected[0] is None else expected
+                        key = (stored or expected)[:len(keys)]
+                        differences.append((table, key, stored, expected))
+        except sqlite3.Error as e:
+            print(f"Error comprobando las tablas resumen: {e}")
+            raise
+        return differences
+
+    @staticmethod
+    def data_version(conn):
+        """(versión, reescrituras) de la tabla data_version, o None si el esquema es anterior."""
+        try:
+            return conn.execute("SELECT version, rewrites FROM data_version").fetchone()
+        except sqlite3.OperationalError:
+            return None
+
+    def snapshot_state(self):
+        """Estado guardado de la instantánea en columnas, o None si no hay ninguna válida."""
+        try:
+            with open(os.path.join(self.snapshot_dir, "state.json"), encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return state if state.get("format") == SNAPSHOT_FORMAT else None
+
+    def refresh_snapshot(self, rebuild=False):
+        """Pone al día la instantánea en columnas (Arrow IPC) de items e invoices.
+
+        Si desde la anterior solo se han añadido filas, se guardan en un segmento nuevo
+        y no se vuelve a leer el resto; si se han modificado o borrado filas (o con
+        rebuild=True) se escribe entera. Todo se lee en una transacción, así la
+        instantánea corresponde a una sola versión de los datos. Devuelve su estado, o
+        None si pyarrow no está instalado.
+        """
+        # Al día: se comprueba con sqlite3 antes de importar pyarrow y pandas, que cuestan
+        # más que todo lo demás cuando no hay nada que escribir
+        state = None if rebuild else self.snapshot_state()
+        if state is not None:
+            with self.read_connection() as conn:
+                if self.data_version(conn) == (state["version"], state["rewrites"]):
+                    return state
+        try:
+            import pyarrow as pa
+        except ImportError:
+            return None
+        import pandas as pd
+        
+        try:
+            with self._snapshot_lock, self.read_connection() as conn:
+                conn.execute("BEGIN")
+                current = self.data_version(conn)
+                if current is None:
+                    return None
+                version, rewrites = current
+                state = self.snapshot_state()
+                if state is not None and state["version"] == version and not rebuild:
+                    return state
+                incremental = state is not None and state["rewrites"] == rewrites and not rebuild
+                os.makedirs(self.snapshot_dir, exist_ok=True)
+                
+                new_state = {"format": SNAPSHOT_FORMAT, "version": version, "rewrites": rewrites, "tables": {}}
+                for table, sql_columns in SNAPSHOT_TABLES.items():
+                    previous = state["tables"][table] if incremental else {"max_id": 0, "rows": 0, "segments": []}
+                    # Con demasiados segmentos se copian al nuevo y se sigue con uno solo
+                    merged = previous["segments"] if len(previous["segments"]) >= SNAPSHOT_MAX_SEGMENTS else []
+                    name = f"{table}-{version}-{os.getpid()}.arrow"
+                    schema = snapshot_schema(table)
+                    # position y los importes pueden tener nulos: se leen como enteros con nulos de pandas
+                    dtypes = {column: 'Int64' if column == "position" or column in MONEY_SQL_COLUMNS
+                              else 'int64' if column in ("id", "product_id") else 'float64' for column in sql_columns
+                              if column in SQL_FLOAT_COLUMNS or column in MONEY_SQL_COLUMNS
+                              or column in ("id", "product_id", "position")}
+                    max_id, new_rows = previous["max_id"], 0
+                    with pa.OSFile(os.path.join(self.snapshot_dir, name), "wb") as sink, \
+                            pa.ipc.new_file(sink, schema) as writer:
+                        for segment in merged:
+                            writer.write_table(self._open_snapshot_segment(segment))
+                        frames = pd.read_sql_query(
+                            f"SELECT {', '.join(sql_columns)} FROM {table} WHERE id > ? ORDER BY id", conn,
+                            params=(max_id,), chunksize=READ_CHUNK_SIZE, dtype=dtypes)
+                        for df in frames:
+                            if len(df):
+                                writer.write_batch(snapshot_record_batch(df, schema))
+                                max_id = int(df['id'].iat[-1])
+                                new_rows += len(df)
+                    
+                    segments = [segment for segment in previous["segments"] if segment not in merged]
+                    if new_rows or merged or not segments:
+                        segments.append(name)
+                    else:
+                        os.remove(os.path.join(self.snapshot_dir, name))
+                    new_state["tables"][table] = {"max_id": max_id, "rows": previous["rows"] + new_rows,
+                                                  "segments": segments}
+        except (OSError, pa.ArrowException) as e:
+            print(f"Error actualizando la instantánea de datos: {e}")
+            raise
+        
+        # El estado se sustituye de una vez: quien lea a la vez ve la instantánea anterior o la nueva
+        state_path = os.path.join(self.snapshot_dir, "state.json")
+        with open(state_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(new_state, f)
+        os.replace(state_path + ".tmp", state_path)
+        in_use = {segment for table_state in new_state["tables"].values() for segment in table_state["segments"]}
+        for table_state in (state or {"tables": {}})["tables"].values():
+            for segment in table_state["segments"]:
+                if segment not in in_use:
+                    try:
+                        os.remove(os.path.join(self.snapshot_dir, segment))
+                    except OSError:
+                        # En Windows no se puede borrar mientras otro proceso lo tenga abierto
+                        pass
+        return new_state
+
+    def _open_snapshot_segment(self, segment):
+        import pyarrow as pa
+        # Con memory_map los buffers de la tabla apuntan al fichero: no se copian al leer
+        return pa.ipc.open_file(pa.memory_map(os.path.join(self.snapshot_dir, segment))).read_all()
+
+    def _snapshot_frames(self, conn, table, sql_columns, columns, limit, chunksize=None):
+        """DataFrame (o iterador de trozos) de toda la tabla desde la instantánea, o None si no está al día.
+
+        La versión se comprueba en la transacción de conn, la misma en la que se lee el
+        diccionario de productos. Los importes y los ids se devuelven sin copiar desde
+        el fichero en memoria (arrays de solo lectura).
+        """
+        try:
+            import pyarrow as pa
+        except ImportError:
+            return None
+        state = self.snapshot_state()
+        if state is None:
+            return None
+        if not conn.in_transaction:
+            conn.execute("BEGIN")
+        if self.data_version(conn) != (state["version"], state["rewrites"]):
+            return None
+        try:
+            arrow_table = pa.concat_tables([self._open_snapshot_segment(segment)
+                                            for segment in state["tables"][table]["segments"]])
+        except (OSError, pa.ArrowException):
+            # Sustituida por otro proceso mientras se leía: se lee de SQLite
+            return None
+        
+        columns, selected, product_columns, queried, products = self._frame_columns(conn, table, sql_columns, columns)
+        arrow_table = arrow_table.select(queried)
+        if limit is not None:
+            arrow_table = arrow_table.slice(0, int(limit))
+        
+        def typed(data):
+            return typed_frame(data.to_pandas(split_blocks=True), columns, selected, product_columns, products)
+        
+        if chunksize is None:
+            return typed(arrow_table)
+        batches = arrow_table.to_batches(max_chunksize=chunksize) or [arrow_table.schema.empty_table()]
+        return (typed(batch) for batch in batches)
+
+    @staticmethod
+    def _invoice_conditions(invoice_conditions, product_conditions):
+        if not product_conditions:
+            return invoice_conditions
+        where, params = where_clause(product_conditions)
+        return invoice_conditions + [(f"invoice_number IN (SELECT invoice_number FROM items{where})", params)]
+
+    def iter_items(self, chunksize=READ_CHUNK_SIZE, columns=None, limit=None, after_id=None, conn=None, **filters):
+        """Como query_items, pero devuelve los artículos en DataFrames de chunksize filas como máximo.
+
+        Las filas se leen del cursor a medida que se piden: la memoria depende de
+        chunksize y no del tamaño de la tabla. Todos los trozos son de la misma versión
+        de los datos (la transacción de lectura dura lo que la iteración) y siempre hay
+        al menos uno, vacío si nada cumple los filtros, con las columnas y tipos de
+        query_items. Con after_id solo se leen las filas con id mayor (las añadidas después).
+        Con conn (de read_connection, con una transacción abierta) se lee en esa
+        transacción, así varias lecturas ven la misma versión de los datos.
+        """
+        invoice_conditions, product_conditions = query_filter_conditions(**filters)
+        conditions = invoice_conditions + product_conditions + self._after_id_conditions(after_id)
+        yield from self._iter_frames("items", ITEM_SQL_COLUMNS, columns, conditions, limit, chunksize, conn)
+
+    def iter_invoices(self, chunksize=READ_CHUNK_SIZE, columns=None, limit=None, after_id=None, conn=None,
+                      **filters):
+        """Como query_invoices, en DataFrames de chunksize filas como máximo (ver iter_items)."""
+        conditions = self._invoice_conditions(*query_filter_conditions(**filters)) + self._after_id_conditions(after_id)
+        yield from self._iter_frames("invoices", TOTAL_SQL_COLUMNS, columns, conditions, limit, chunksize, conn)
+
+    @staticmethod
+    def _after_id_conditions(after_id):
+        # Los ids crecen con cada inserción: las filas con id mayor son las escritas después
+        return [("id > ?", [int(after_id)])] if after_id else []
+
+    def _iter_frames(self, table, sql_columns, columns, conditions, limit, chunksize, conn=None):
         try:
-            conn = sqlite3.connect(self.db_path)
-            df_items = pd.read_sql_query("SELECT * FROM items", conn)
-            df_invoices = pd.read_sql_query("SELECT * FROM invoices", conn)
+            if conn is not None:
+                yield from self._load_frame(conn, table, sql_columns, columns, conditions, limit, chunksize)
+                return
+            with self.read_connection() as conn:
+                conn.execute("BEGIN")
+                yield from self._load_frame(conn, table, sql_columns, columns, conditions, limit, chunksize)
+        except sqlite3.Error as e:
+            print(f"Error leyendo la tabla {table}: {e}")
+            raise
+
+    def _load_frame(self, conn, table, sql_columns, columns, conditions, limit, chunksize=None):
+        """Como _read_frame; sin condiciones lee de la instantánea en columnas si está al día."""
+        if not conditions:
+            frames = self._snapshot_frames(conn, table, sql_columns, columns, limit, chunksize)
+            if frames is not None:
+                return frames
+        return self._read_frame(conn, table, sql_columns, columns, conditions, limit, chunksize)
+
+    @staticmethod
+    def _read_frame(conn, table, sql_columns, columns, conditions, limit, chunksize=None, offset=None, order_by=None):
+        """Ejecuta la consulta y devuelve el DataFrame con los nombres y tipos de create_dataframes.
+
+        Los importes son céntimos en int64 (float64 si hay nulos), las cantidades y
+        porcentajes float64 y la fecha datetime64 aunque no haya filas, así quien filtra
+        no tiene que comprobar tipos ni columnas vacías. El código y la descripción
+        de los artículos se leen como product_id y se devuelven como pd.Categorical con
+        las categorías de la tabla products (las mismas en todos los trozos), así las
+        agrupaciones por producto trabajan con enteros. Con chunksize devuelve, como
+        pd.read_sql_query, un iterador de DataFrames de chunksize filas como máximo.
+        order_by sustituye el orden por defecto (id, o fecha e id con rango de fechas).
+        """
+        import pandas as pd
+        
+        columns, selected, product_columns, queried, products = DatabaseManager._frame_columns(
+            conn, table, sql_columns, columns)
+        where, params = where_clause(conditions)
+        # Con rango de fechas se ordena como el índice de invoice_date (que incluye el id):
+        # ORDER BY id solo haría que SQLite prefiriese recorrer toda la tabla para no ordenar
+        date_range = any(condition.startswith("invoice_date") for condition, _ in conditions)
+        order_by = order_by or ('invoice_date, id' if date_range else 'id')
+        query = f"SELECT {', '.join(queried)} FROM {table}{where} ORDER BY {order_by}"
+        if limit is not None or offset:
+            query += " LIMIT ? OFFSET ?"
+            params += [-1 if limit is None else int(limit), int(offset or 0)]
+        
+        frames = pd.read_sql_query(query, conn, params=params, chunksize=chunksize,
+                                   dtype={column: 'int64' if column in ("id", "product_id") else 'float64'
+                                          for column in queried
+                                          if column in ("id", "product_id") or column in SQL_FLOAT_COLUMNS})
+        if chunksize is None:
+            return typed_frame(frames, columns, selected, product_columns, products)
+        return (typed_frame(df, columns, selected, product_columns, products) for df in frames)
+
+    @staticmethod
+    def _frame_columns(conn, table, sql_columns, columns):
+        """Columnas de un DataFrame de _read_frame: (nombres, columnas de la tabla, de products, leídas, diccionario)."""
+        columns = ["id", *sql_columns] if columns is None else list(columns)
+        unknown = [column for column in columns if column != "id" and column not in sql_columns]
+        if unknown:
+            raise ValueError(f"Columnas desconocidas en {table}: {', '.join(unknown)}")
+        selected = ["id" if column == "id" else sql_columns[column] for column in columns]
+        product_columns = [column for column in selected if column in PRODUCT_SQL_COLUMNS] if table == "items" else []
+        if not product_columns:
+            return columns, selected, product_columns, selected, None
+        # El diccionario y los artículos tienen que ser de la misma versión de los datos
+        if not conn.in_transaction:
+            conn.execute("BEGIN")
+        queried = [column for column in selected if column not in PRODUCT_SQL_COLUMNS] + ["product_id"]
+        return columns, selected, product_columns, queried, read_product_dictionary(conn)
+
+class DatabaseWriter:
+    """Hilo que escribe en la base de datos los lotes que le envían los analizadores.
+
+    submit() deja el lote en una cola acotada y vuelve enseguida; si la cola está
+    llena espera a que el hilo escritor la vacíe, así la memoria no crece cuando el
+    disco es más lento que el análisis. El hilo agrupa los lotes pendientes en una
+    sola transacción cuando suman commit_rows filas, cuando el más antiguo lleva
+    flush_interval segundos esperando o cuando se llama a flush() o close(). Es el
+    único que escribe filas de facturas, así SQLite no ve escritores compitiendo.
+
+    Si una escritura falla, los lotes siguientes se descartan y el error se lanza en
+    la siguiente llamada a submit(), flush() o close().
+    Uso: "with DatabaseWriter(db) as writer:" y dentro writer.submit(items, totals).
+    """
+    _STOP = object()
+
+    def __init__(self, db, queue_size=WRITER_QUEUE_SIZE, commit_rows=WRITER_COMMIT_ROWS,
+                 flush_interval=WRITER_FLUSH_INTERVAL, metrics=None):
+        self.db = db
+        self.commit_rows = commit_rows
+        self.flush_interval = flush_interval
+        # RunMetrics donde se mide la etapa "insert"; se puede cambiar entre ejecuciones
+        self.metrics = metrics or RunMetrics(enabled=False)
+        self.error = None
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="DatabaseWriter", daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # Se guardan los lotes ya enviados; el error original es el que interesa
+            try:
+                self.close()
+            except Exception:
+                pass
+        return False
+
+    def submit(self, item_rows, total_rows, manifest_entries=None, replace_invoices=None, on_commit=None):
+        """Encola un lote (ver DatabaseManager.insert_rows); espera si la cola está llena.
+
+        on_commit() se llama desde el hilo escritor cuando el lote se ha confirmado; sus
+        excepciones se muestran y no afectan a la escritura.
+        """
+        self._check()
+        self._queue.put((item_rows, total_rows, manifest_entries, replace_invoices, on_commit))
+
+    def flush(self):
+        """Espera a que se confirmen todos los lotes enviados hasta ahora."""
+        self._check()
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+        self._raise_error()
+
+    def close(self):
+        """Confirma los lotes pendientes y termina el hilo escritor."""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(self._STOP)
+            self._thread.join()
+        self._raise_error()
+
+    def _check(self):
+        if self._closed:
+            raise RuntimeError("El escritor de la base de datos está cerrado")
+        self._raise_error()
+
+    def _raise_error(self):
+        error, self.error = self.error, None
+        if error is not None:
+            raise error
+
+    def _run(self):
+        pending = []
+        pending_rows = 0
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                message = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                message = None
+            
+            if isinstance(message, tuple):
+                pending.append(message)
+                pending_rows += len(message[0]) + len(message[1])
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                if pending_rows < self.commit_rows:
+                    continue
+            
+            # Intervalo cumplido, lote grande, flush() o close(): se confirma lo pendiente
+            if pending:
+                self._commit(pending)
+                pending = []
+                pending_rows = 0
+            deadline = None
+            if isinstance(message, threading.Event):
+                message.set()
+            elif message is self._STOP:
+                return
+
+    def _commit(self, batches):
+        if self.error is not None:
+            return
+        try:
+            with self.metrics.stage("insert"):
+                self.db.insert_batches([batch[:4] for batch in batches])
+        except Exception as e:
+            self.error = e
+            return
+        for item_rows, total_rows, _, _, on_commit in batches:
+            self.metrics.count("items", len(item_rows))
+            self.metrics.count("totals", len(total_rows))
+            if on_commit:
+                # Un fallo al avisar no debe parar el hilo: flush() y close() esperarían para siempre
+                try:
+                    on_commit()
+                except Exception as e:
+                    print(f"Error notificando un lote guardado: {e}")
+
+# Patrones de extract_data_from_text, compilados una sola vez
+INVOICE_NUMBER_PATTERN = re.compile(r'Nº factura\s+(\S+)')
+DATE_PATTERN = re.compile(r'Fecha\s+(\d{2}\.\d{2}\.\d{4})')
+ITEM_PATTERN = re.compile(r'^\s*(\d{13,})\s+(\S+)\s+(\d+)\s+([\d,.-]+)\s+(\S+)\s+([\d,.-]+)\s+([\d,.-]+)\s+([\d,.-]+)$')
+# La descripción va en una de las dos líneas siguientes al artículo
+DESCRIPTION_PATTERN = re.compile(r'^(?!Nº pedido Oficina)(?!Albarán)(?!Dirección de envío)(?!WURTH)\s+(.*)$')
+TOTAL_PATTERN = re.compile(r'^\s*([\d,]+)\s+([\d,]+)\s+([\d,]+%)\s+([\d,]+)\s+([\d,]+)$')
+# Primer carácter posible de una línea de artículo o de totales
+ROW_FIRST_CHARS = frozenset('0123456789,')
+
+class TextCache:
+    """Caché en disco del texto extraído de cada página, por hash del PDF y número de página.
+
+    El texto se guarda comprimido en una base SQLite propia. Cuando supera max_bytes
+    se expulsan completos los PDFs usados hace más tiempo. Con create=False no se
+    crean las tablas (ya las ha creado el proceso principal) y con persistent se usa
+    una sola conexión para todas las operaciones, como en los procesos del pool (ver
+    init_pool_worker); sin persistent cada operación abre la suya, así la caché se
+    puede usar desde varios hilos.
+    """
+    def __init__(self, db_path=None, max_bytes=TEXT_CACHE_MAX_BYTES, create=True, persistent=False):
+        self.db_path = db_path or os.path.join(get_app_data_path(), "text_cache.db")
+        self.max_bytes = max_bytes
+        self._conn = None
+        if create:
+            self.create_tables()
+        if persistent:
+            self._conn = self._connect()
+
+    def _connect(self):
+        if self._conn is not None:
+            return self._conn
+        # Varios procesos del pool pueden escribir a la vez
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _release(self, conn):
+        if conn is not self._conn:
+            conn.close()
+
+    def create_tables(self):
+        conn = self._connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                content_hash TEXT,
+                page_index INTEGER,
+                page_count INTEGER,
+                text BLOB,
+                size INTEGER,
+                last_used REAL,
+                PRIMARY KEY (content_hash, page_index)
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_pages_last_used ON pages (last_used)")
+        conn.commit()
+        self._release(conn)
+
+    def get_pages(self, content_hash, first_page=0, last_page=None):
+        """Devuelve el texto de las páginas [first_page, last_page) o None si falta alguna."""
+        conn = self._connect()
+        try:
+            query = "SELECT page_index, page_count, text FROM pages WHERE content_hash = ? AND page_index >= ?"
+            params = [content_hash, first_page]
+            if last_page is not None:
+                query += " AND page_index < ?"
+                params.append(last_page)
+            rows = conn.execute(query + " ORDER BY page_index", params).fetchall()
+            if not rows:
+                return None
+            
+            page_count = rows[0][1]
+            end = page_count if last_page is None else min(last_page, page_count)
+            if [row[0] for row in rows] != list(range(first_page, end)):
+                return None
+            
+            conn.execute("UPDATE pages SET last_used = ? WHERE content_hash = ?", (time.time(), content_hash))
+            conn.commit()
+            return [zlib.decompress(row[2]).decode('utf-8') for row in rows]
+        finally:
+            self._release(conn)
+
+    def put_pages(self, content_hash, page_count, pages):
+        """Guarda una lista de (page_index, text) de un PDF."""
+        now = time.time()
+        rows = []
+        for page_index, text in pages:
+            compressed = zlib.compress(text.encode('utf-8'))
+            rows.append((content_hash, page_index, page_count, compressed, len(compressed), now))
+        
+        conn = self._connect()
+        try:
+            conn.executemany("""
+                INSERT OR REPLACE INTO pages (content_hash, page_index, page_count, text, size, last_used)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, rows)
+            conn.commit()
+        finally:
+            self._release(conn)
+
+    def evict(self):
+        """Expulsa los PDFs usados hace más tiempo hasta quedar por debajo de max_bytes."""
+        conn = self._connect()
+        try:
+            total_size = conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+            if total_size <= self.max_bytes:
+                return 0
+            
+            documents = conn.execute("""
+                SELECT content_hash, SUM(size) FROM pages
+                GROUP BY content_hash ORDER BY MAX(last_used)
+            """).fetchall()
+            evicted = []
+            for content_hash, size in documents:
+                if total_size <= self.max_bytes:
+                    break
+                evicted.append((content_hash,))
+                total_size -= size
+            
+            conn.executemany("DELETE FROM pages WHERE content_hash = ?", evicted)
+            conn.commit()
+            return len(evicted)
+        finally:
+            self._release(conn)
+
+class StatisticsCache:
+    """Caché en disco de las estadísticas y los gráficos ya calculados, por versión de los datos.
+
+    Cada entrada guarda la versión de la tabla data_version con la que se calculó (cada
+    escritura confirmada de items o invoices la incrementa): mientras no cambie, las mismas
+    estadísticas se devuelven sin leer los artículos y los gráficos se copian en lugar de
+    volver a dibujarlos. Al guardar una entrada se borran las de versiones anteriores de la
+    misma base de datos. Aparte se guardan los agregados parciales (StatisticsAccumulator)
+    de cada combinación de filtros, a los que incremental_statistics suma las filas nuevas.
+    Se guarda comprimido en una base SQLite propia, como TextCache.
+    """
+    def __init__(self, db_path=None, max_entries=STATS_CACHE_MAX_ENTRIES):
+        self.db_path = db_path or os.path.join(get_app_data_path(), "stats_cache.db")
+        self.max_entries = max_entries
+        self.create_tables()
+
+    def _connect(self):
+        # La ventana y la línea de comandos pueden usarla a la vez
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def create_tables(self):
+        conn = self._connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS stats (
+                key TEXT PRIMARY KEY,
+                database TEXT,
+                data_version INTEGER,
+                stats BLOB,
+                last_used REAL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS charts (
+                key TEXT,
+                name TEXT,
+                image BLOB,
+                PRIMARY KEY (key, name)
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS partials (
+                key TEXT PRIMARY KEY,
+                database TEXT,
+                rewrites INTEGER,
+                accumulator BLOB,
+                last_used REAL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_stats_database ON stats (database, data_version)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_partials_database ON partials (database, rewrites)")
+        conn.commit()
+        conn.close()
+
+    @staticmethod
+    def database_id(db_path):
+        """Ruta absoluta e inodo de la base de datos: si se borra y se crea de nuevo su versión vuelve a empezar."""
+        return f"{os.path.abspath(db_path)}:{os.stat(db_path).st_ino}"
+
+    @staticmethod
+    def make_key(database, data_version, **params):
+        """Clave de una entrada: base de datos, versión de los datos (None en los agregados parciales) y parámetros."""
+        text = json.dumps({"format": STATS_CACHE_FORMAT, "database": database,
+                           "data_version": data_version, **params}, sort_keys=True, default=str)
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def get_stats(self, key):
+        """Estadísticas guardadas con key, o None si no están."""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT stats FROM stats WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE stats SET last_used = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+            return pickle.loads(zlib.decompress(row[0]))
+        finally:
+            conn.close()
+
+    def put_stats(self, key, database, data_version, stats):
+        """Guarda las estadísticas y borra las entradas de versiones anteriores de database."""
+        blob = zlib.compress(pickle.dumps(stats, protocol=pickle.HIGHEST_PROTOCOL))
+        conn = self._connect()
+        try:
+            stale = "SELECT key FROM stats WHERE database = ? AND data_version < ?"
+            conn.execute(f"DELETE FROM charts WHERE key IN ({stale})", (database, data_version[0]))
+            conn.execute(f"DELETE FROM stats WHERE key IN ({stale})", (database, data_version[0]))
+            conn.execute("""
+                INSERT OR REPLACE INTO stats (key, database, data_version, stats, last_used)
+                VALUES (?, ?, ?, ?, ?)
+            """, (key, database, data_version[0], blob, time.time()))
+            # Por si se usan muchas combinaciones de filtros o bases de datos
+            evicted = "SELECT key FROM stats ORDER BY last_used DESC LIMIT -1 OFFSET ?"
+            conn.execute(f"DELETE FROM charts WHERE key IN ({evicted})", (self.max_entries,))
+            conn.execute(f"DELETE FROM stats WHERE key IN ({evicted})", (self.max_entries,))
+            conn.commit()
+        finally:
             conn.close()
+
+    def get_partial(self, key):
+        """(reescrituras, StatisticsAccumulator) guardados con key, o None si no están."""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT rewrites, accumulator FROM partials WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE partials SET last_used = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+        finally:
+            conn.close()
+        # Se guarda el estado y no el objeto: no depende del nombre del módulo (__main__ o no)
+        accumulator = StatisticsAccumulator()
+        accumulator.__dict__.update(pickle.loads(zlib.decompress(row[1])))
+        return row[0], accumulator
+
+    def put_partial(self, key, database, data_version, accumulator):
+        """Guarda el acumulador y borra los de la misma base de datos con reescrituras anteriores."""
+        accumulator.flush()
+        blob = zlib.compress(pickle.dumps(vars(accumulator), protocol=pickle.HIGHEST_PROTOCOL))
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM partials WHERE database = ? AND rewrites < ?", (database, data_version[1]))
+            conn.execute("""
+                INSERT OR REPLACE INTO partials (key, database, rewrites, accumulator, last_used)
+                VALUES (?, ?, ?, ?, ?)
+            """, (key, database, data_version[1], blob, time.time()))
+            conn.execute("""
+                DELETE FROM partials WHERE key IN (SELECT key FROM partials ORDER BY last_used DESC LIMIT -1 OFFSET ?)
+            """, (self.max_entries,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get_charts(self, key, output_dir):
+        """Copia en output_dir los gráficos guardados con key; devuelve sus rutas o None si no están."""
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT name, image FROM charts WHERE key = ? ORDER BY name", (key,)).fetchall()
+        finally:
+            conn.close()
+        if not rows:
+            return None
+        os.makedirs(output_dir, exist_ok=True)
+        paths = []
+        for name, image in rows:
+            paths.append(os.path.join(output_dir, name))
+            with open(paths[-1], "wb") as f:
+                f.write(image)
+        return paths
+
+    def put_charts(self, key, paths):
+        """Guarda con key los gráficos de paths (los que devuelve generate_visualizations)."""
+        rows = []
+        for path in paths:
+            with open(path, "rb") as f:
+                rows.append((key, os.path.basename(path), f.read()))
+        conn = self._connect()
+        try:
+            # Solo si las estadísticas siguen guardadas: otra escritura puede haberlas borrado
+            conn.executemany("""
+                INSERT OR REPLACE INTO charts (key, name, image)
+                SELECT ?, ?, ? WHERE EXISTS (SELECT 1 FROM stats WHERE key = ?)
+            """, [row + (key,) for row in rows])
+            conn.commit()
+        finally:
+            conn.close()
+
+def iter_frames(data):
+    """Trozos de un DataFrame (él mismo) o de un iterable de DataFrames como DatabaseManager.iter_items."""
+    import pandas as pd
+    
+    if isinstance(data, pd.DataFrame):
+        yield data
+    elif data is not None:
+        yield from data
+
+def add_grouped(total, part):
+    """Suma por índice dos agrupaciones (Series o DataFrame); total puede ser None.
+
+    A diferencia de add(fill_value=0), los céntimos y los recuentos siguen siendo enteros.
+    """
+    import pandas as pd
+    
+    if total is None:
+        return part
+    return pd.concat([total, part]).groupby(level=0, sort=True).sum()
+
+def grouped_sum(codes, values, size):
+    """Suma de values por grupo (codes de 0 a size - 1) con np.bincount, en una sola pasada.
+
+    bincount suma en float64: con enteros (céntimos) el resultado es exacto mientras
+    las sumas no pasen de 2**53 y se devuelve otra vez como int64.
+    """
+    import numpy as np
+    
+    sums = np.bincount(codes, weights=values, minlength=size)
+    if np.issubdtype(values.dtype, np.integer):
+        return sums.astype(np.int64)
+    return sums
+
+class StatisticsAccumulator:
+    """Estadísticas de generate_statistics calculadas por trozos de artículos y totales.
+
+    Cada trozo se resume en una sola pasada agrupada (sumas, recuentos, máximos y
+    agregados por mes y por producto, ver add_months) y se descarta: la memoria
+    depende del número de meses, productos y facturas distintos, no del número de
+    filas. Los importes se suman en céntimos enteros, sin errores de redondeo. Las
+    estadísticas, los gráficos y la predicción salen de los mismos agregados.
+    """
+    def __init__(self):
+        self.n_items = 0
+        self.n_invoices = 0
+        self.invoice_numbers = set()
+        self.total_spent = 0
+        self.price_sum = 0
+        self.price_count = 0
+        self.most_expensive_item = None
+        # Por mes, de las filas con fecha e importe; también los usa predict_future_spending
+        self.monthly_spending = None
+        self.last_date = None
+        # Por descripción: importe, cantidad y número de líneas
+        self.products = None
+        # Agregados de add_months que aún no están en monthly_spending y products (ver
+        # flush): gasto por mes (meses desde 1970) y, por código de descripción en
+        # _categories, importe, cantidad y número de líneas
+        self._months = {}
+        self._categories = None
+        self._product_sums = None
+        self.n_totals = 0
+        self.total_taxes = 0
+        self.invoice_total_sum = 0
+        self.invoice_total_count = 0
+        # Mayor id de los artículos y totales sumados, si los trozos traen la columna id:
+        # las filas posteriores se suman después con merge (ver incremental_statistics)
+        self.last_item_id = 0
+        self.last_total_id = 0
+
+    @classmethod
+    def from_frames(cls, df_items, df_totals):
+        """Acumulador de los artículos y totales (DataFrames o iteradores de trozos)."""
+        accumulator = cls()
+        for chunk in iter_frames(df_items):
+            accumulator.add_items(chunk)
+        for chunk in iter_frames(df_totals):
+            accumulator.add_totals(chunk)
+        return accumulator
+
+    def add_items(self, df_items):
+        if df_items.empty:
+            return
+        if 'id' in df_items.columns:
+            self.last_item_id = max(self.last_item_id, int(df_items['id'].max()))
+        self.n_items += len(df_items)
+        self.invoice_numbers.update(df_items['Nº Factura'].unique().tolist())
+        self.n_invoices = len(self.invoice_numbers)
+        self.total_spent += df_items['Valor Neto (EUR)'].sum()
+        
+        prices = df_items['Precio Unitario (EUR)']
+        if prices.count():
+            self.price_sum += prices.sum()
+            self.price_count += prices.count()
+            # Con empates se queda el primero, como idxmax sobre todos los artículos
+            item = df_items.loc[prices.idxmax()].drop('id', errors='ignore')
+            if self.most_expensive_item is None or item['Precio Unitario (EUR)'] > self.most_expensive_item['Precio Unitario (EUR)']:
+                self.most_expensive_item = item
+        
+        self.add_months(df_items, products=True)
+
+    def add_months(self, df_items, products=False):
+        """Agrega las filas del trozo con fecha e importe: gasto por mes y, con products,
+        importe, cantidad y líneas por descripción.
+
+        Los grupos se numeran con enteros (meses desde 1970 y códigos de la categoría de
+        la descripción) y cada agregado es un np.bincount sobre esos números: no se
+        copian las filas ni se crean objetos Period, y no hay ordenaciones ni tablas hash.
+        """
+        import numpy as np
+        import pandas as pd
+        
+        dates = df_items['Fecha Factura'].to_numpy(dtype='datetime64[ns]')
+        net = df_items['Valor Neto (EUR)'].to_numpy()
+        valid = ~(np.isnat(dates) | pd.isna(net))
+        if not valid.any():
+            return
+        all_valid = valid.all()
+        if not all_valid:
+            dates, net = dates[valid], net[valid]
+        
+        # Mes de cada fecha con una tabla de los días del trozo: convertir cada fecha a
+        # datetime64[M] cuesta varias veces más
+        days = dates.astype('datetime64[D]').astype(np.int64)
+        first_day = days.min()
+        month_of_day = np.arange(first_day, days.max() + 1).astype('datetime64[D]').astype('datetime64[M]')
+        months = month_of_day.astype(np.int64)[days - first_day]
+        first = months.min()
+        offsets = months - first
+        month_sums = grouped_sum(offsets, net, 0)
+        for offset in np.flatnonzero(np.bincount(offsets)):
+            month = int(first + offset)
+            self._months[month] = self._months.get(month, 0) + month_sums[offset]
+        last_date = pd.Timestamp(dates.max())
+        self.last_date = last_date if self.last_date is None else max(self.last_date, last_date)
+        
+        if not products:
+            return
+        description = df_items['Descripción']
+        if isinstance(description.dtype, pd.CategoricalDtype):
+            # Lecturas de la base de datos: las categorías son las mismas en todos los trozos
+            codes, categories = description.cat.codes.to_numpy(), description.cat.categories
+        else:
+            codes, categories = pd.factorize(description)
+        quantity = df_items['Cantidad'].to_numpy(dtype=np.float64)
+        if not all_valid:
+            codes, quantity = codes[valid], quantity[valid]
+        # Como en groupby, las cantidades nulas no suman y las descripciones nulas (código
+        # -1) no son un producto: van a un último código que no se devuelve
+        quantity = np.where(np.isnan(quantity), 0.0, quantity)
+        size = len(categories) + 1
+        codes = np.where(codes < 0, size - 1, codes)
+        sums = (grouped_sum(codes, net, size), grouped_sum(codes, quantity, size), np.bincount(codes, minlength=size))
+        if self._categories is not None and not (categories is self._categories or categories.equals(self._categories)):
+            self.flush()
+        if self._categories is None:
+            self._categories, self._product_sums = categories, sums
+        else:
+            self._product_sums = tuple(total + part for total, part in zip(self._product_sums, sums))
+
+    def flush(self):
+        """Pasa los agregados pendientes de add_months a monthly_spending y products."""
+        import numpy as np
+        import pandas as pd
+        
+        if self._months:
+            months = sorted(self._months)
+            index = pd.DatetimeIndex(np.array(months, dtype='datetime64[M]')).to_period('M').rename('Mes')
+            monthly_spending = pd.Series([self._months[month] for month in months], index=index, name='Valor Neto (EUR)')
+            self.monthly_spending = add_grouped(self.monthly_spending, monthly_spending)
+            self._months = {}
+        if self._categories is not None:
+            net, quantity, count = self._product_sums
+            present = np.flatnonzero(count[:-1])
+            products = pd.DataFrame({
+                'Valor Neto (EUR)': net[present],
+                'Cantidad': quantity[present],
+                'count': count[present],
+            }, index=pd.Index(self._categories[present].astype(object), name='Descripción'))
+            self.products = add_grouped(self.products, products)
+            self._categories = self._product_sums = None
+
+    def add_totals(self, df_totals):
+        if df_totals.empty:
+            return
+        if 'id' in df_totals.columns:
+            self.last_total_id = max(self.last_total_id, int(df_totals['id'].max()))
+        self.n_totals += len(df_totals)
+        self.total_taxes += df_totals['Importe IVA (EUR)'].sum()
+        self.invoice_total_sum += df_totals['Importe Total (EUR)'].sum()
+        self.invoice_total_count += df_totals['Importe Total (EUR)'].count()
+
+    def drop_totals(self):
+        """Olvida los totales sumados, para volver a sumarlos todos."""
+        self.n_totals = 0
+        self.total_taxes = 0
+        self.invoice_total_sum = 0
+        self.invoice_total_count = 0
+        self.last_total_id = 0
+
+    def merge(self, other):
+        """Suma a este acumulador los agregados de other (por ejemplo, de las filas nuevas).
+
+        Todos los agregados son sumas, recuentos, máximos o uniones: el resultado es el
+        mismo que si las filas de los dos se hubieran añadido a uno solo. Con empate en
+        el precio máximo se queda el artículo de este acumulador. Devuelve self.
+        """
+        self.flush()
+        other.flush()
+        self.n_items += other.n_items
+        self.invoice_numbers |= other.invoice_numbers
+        self.n_invoices = len(self.invoice_numbers)
+        self.total_spent += other.total_spent
+        self.price_sum += other.price_sum
+        self.price_count += other.price_count
+        if other.most_expensive_item is not None and (
+                self.most_expensive_item is None
+                or other.most_expensive_item['Precio Unitario (EUR)'] > self.most_expensive_item['Precio Unitario (EUR)']):
+            self.most_expensive_item = other.most_expensive_item
+        if other.monthly_spending is not None:
+            self.monthly_spending = add_grouped(self.monthly_spending, other.monthly_spending)
+        if other.last_date is not None:
+            self.last_date = other.last_date if self.last_date is None else max(self.last_date, other.last_date)
+        if other.products is not None:
+            self.products = add_grouped(self.products, other.products)
+        self.n_totals += other.n_totals
+        self.total_taxes += other.total_taxes
+        self.invoice_total_sum += other.invoice_total_sum
+        self.invoice_total_count += other.invoice_total_count
+        self.last_item_id = max(self.last_item_id, other.last_item_id)
+        self.last_total_id = max(self.last_total_id, other.last_total_id)
+        return self
+
+    def result(self):
+        """Diccionario de estadísticas con las claves de generate_statistics."""
+        import pandas as pd
+        
+        self.flush()
+        stats = {}
+        if self.n_items:
+            stats['total_invoices'] = self.n_invoices
+            stats['total_items'] = self.n_items
+            stats['total_spent'] = self.total_spent
+            stats['avg_item_price'] = self.price_sum / self.price_count if self.price_count else float('nan')
+            stats['most_expensive_item'] = self.most_expensive_item if self.most_expensive_item is not None else pd.Series(dtype=object)
             
-            if 'invoice_date' in df_items.columns:
-                df_items['invoice_date'] = pd.to_datetime(df_items['invoice_date'])
-            if 'invoice_date' in df_invoices.columns:
-                df_invoices['invoice_date'] = pd.to_datetime(df_invoices['invoice_date'])
-
-            if not df_items.empty:
-                df_items.rename(columns={
-                    'invoice_number': 'Nº Factura', 'invoice_date': 'Fecha Factura', 'item_number': 'Nº Artículo',
-                    'position': 'Posición', 'quantity': 'Cantidad', 'unit_price': 'Precio Unitario (EUR)',
-                    'product_code': 'Código Producto', 'discount': 'Descuento %', 'iva': 'IVA %',
-                    'net_value': 'Valor Neto (EUR)', 'description': 'Descripción'
-                }, inplace=True)
-            
-            if not df_invoices.empty:
-                df_invoices.rename(columns={
-                    'invoice_number': 'Nº Factura', 'invoice_date': 'Fecha Factura', 'ports': 'Portes (EUR)',
-                    'net_value': 'Valor Neto (EUR)', 'iva': 'IVA %', 'iva_amount': 'Importe IVA (EUR)',
-                    'total_amount': 'Importe Total (EUR)'
-                }, inplace=True)
-
-            return df_items, df_invoices
-        except Exception as e:
-            print(f"Error obteniendo datos de la base de datos: {e}")
-            return pd.DataFrame(), pd.DataFrame()
+            monthly_spending = self.monthly_spending
+            if monthly_spending is None:
+                monthly_spending = pd.Series(dtype='float64', name='Valor Neto (EUR)')
+            stats['monthly_spending'] = monthly_spending
+            
+            products = self.products
+            if products is None:
+                products = pd.DataFrame({'Valor Neto (EUR)': [], 'Cantidad': [], 'count': []})
+            products = products.sort_index()
+            stats['top_products'] = products['count'].astype('int64').sort_values(ascending=False).head(10)
+            stats['spending_per_product'] = products['Valor Neto (EUR)'].sort_values(ascending=False)
+            
+            if self.n_totals:
+                stats['total_taxes'] = self.total_taxes
+            
+            stats['total_quantity_per_product'] = products['Cantidad'].sort_values(ascending=False)
+            # Para los gráficos: la predicción empieza en el mes siguiente a la última fecha
+            stats['last_date'] = self.last_date
+        
+        if self.n_totals:
+            stats['avg_invoice_total'] = (self.invoice_total_sum / self.invoice_total_count
+                                          if self.invoice_total_count else float('nan'))
+        return stats
 
 class PDFInvoiceProcessor:
-    def __init__(self):
+    def __init__(self, text_cache=None, template=None, metrics=None):
+        if template is not None and template not in INVOICE_TEMPLATES:
+            raise ValueError(f"Plantilla de factura desconocida: {template}")
+        self.text_cache = text_cache
+        self.template = template
+        # Sin RunMetrics se usa una desactivada: las etapas no miden nada
+        self.metrics = metrics if metrics is not None else RunMetrics(enabled=False)
         self.items_data = []
         self.totals_data = []
         self.invoice_dates = []
         self.invoice_numbers = []
+        self.manifest_entries = []
+        self.skipped_files = []
+        self.failed_files = []
         
     def extract_data_from_text(self, text, filename):
+        """Extrae artículos, totales, fecha y número de factura del texto de una página.
+
+        Recorre las líneas una sola vez. Las líneas de artículos y de totales siempre
+        empiezan por un dígito (o una coma), así que solo a ellas se les aplican las
+        expresiones regulares caras.
+        """
         items_data = []
         totals_data = []
         invoice_date = None
         invoice_number = None
+        date_found = False
         
         lines = text.split('\n')
+        n_lines = len(lines)
         
-        for line in lines:
-            if 'Nº factura' in line:
-                invoice_match = re.search(r'Nº factura\s+(\S+)', line)
+        for i, raw_line in enumerate(lines):
+            if invoice_number is None and 'Nº factura' in raw_line:
+                invoice_match = INVOICE_NUMBER_PATTERN.search(raw_line)
                 if invoice_match:
                     invoice_number = invoice_match.group(1).strip()
-                    break
-        
-        for line in lines:
-            if 'Fecha' in line:
-                date_match = re.search(r'Fecha\s+(\d{2}\.\d{2}\.\d{4})', line)
+            
+            if not date_found and 'Fecha' in raw_line:
+                date_match = DATE_PATTERN.search(raw_line)
                 if date_match:
                     try:
                         invoice_date = datetime.strptime(date_match.group(1), '%d.%m.%Y')
-                        break
+                        date_found = True
                     except ValueError:
                         invoice_date = None
-        
-        # NUEVO PATRÓN DE EXTRACCIÓN
-        item_pattern = re.compile(r'^\s*(\d{13,})\s+(\S+)\s+(\d+)\s+([\d,.-]+)\s+(\S+)\s+([\d,.-]+)\s+([\d,.-]+)\s+([\d,.-]+)$')
-        # NUEVO PATRÓN PARA LA DESCRIPCIÓN EN LA LÍNEA SIGUIENTE
-        description_pattern = re.compile(r'^(?!Nº pedido Oficina)(?!Albarán)(?!Dirección de envío)(?!WURTH)\s+(.*)$')
-        total_pattern = re.compile(r'^\s*([\d,]+)\s+([\d,]+)\s+([\d,]+%)\s+([\d,]+)\s+([\d,]+)$')
-        
-        for i, line in enumerate(lines):
-            line = line.strip()
             
-            item_match = item_pattern.search(line)
+            line = raw_line.strip()
+            if not line or line[0] not in ROW_FIRST_CHARS:
+                continue
+            
+            item_match = ITEM_PATTERN.match(line)
             if item_match:
                 item_data = list(item_match.groups())
                 description_found = False
                 # Busca la descripción en las siguientes 2 líneas
-                for j in range(1, 3):
-                    if i + j < len(lines):
-                        next_line = lines[i + j].strip()
-                        description_match = description_pattern.search(next_line)
+                for j in (i + 1, i + 2):
+                    if j < n_lines:
+                        description_match = DESCRIPTION_PATTERN.match(lines[j].strip())
                         if description_match:
                             description = description_match.group(1).strip()
                             if description and '€' not in description:
@@ -228,7 +2720,7 @@ class PDFInvoiceProcessor:
                 items_data.append(item_data)
                 continue
                 
-            total_match = total_pattern.search(line)
+            total_match = TOTAL_PATTERN.match(line)
             if total_match:
                 totals_data.append(list(total_match.groups()))
         
@@ -240,35 +2732,386 @@ class PDFInvoiceProcessor:
 
         return items_data, totals_data, invoice_date, invoice_number
 
-    def process_pdf_directory(self, directory_path):
-        pdf_files = glob.glob(os.path.join(directory_path, "*.pdf"))
-        pdf_files.extend(glob.glob(os.path.join(directory_path, "*.PDF")))
-        
+    def process_pdf_directory(self, directory_path, workers=1, manifest=None, force=False):
+        """Procesa todos los PDFs de un directorio.
+
+        Con workers > 1 los ficheros (y las páginas de los PDFs grandes) se reparten
+        en un pool de procesos; los resultados se combinan en el mismo orden que el
+        procesamiento secuencial. workers=None usa todos los núcleos disponibles.
+
+        Si se pasa el manifiesto de DatabaseManager.get_manifest(), los PDFs cuyo
+        contenido y versión del parser ya están registrados se omiten. Las entradas
+        de los PDFs procesados quedan en self.manifest_entries para guardarlas junto
+        con los datos. Con force se procesan todos, pero se siguen registrando.
+        """
         all_items = []
         all_totals = []
         
+        for items, totals, _ in self.iter_pdf_directory(directory_path, workers=workers, manifest=manifest,
+                                                        force=force):
+            all_items.extend(items)
+            all_totals.extend(totals)
+        
+        return all_items, all_totals
+
+    def iter_pdf_directory(self, directory_path, workers=1, manifest=None, force=False):
+        """Extrae los PDFs de un directorio página a página.
+
+        Genera tuplas (items, totals, finished_entry) en el mismo orden que
+        process_pdf_directory. Cuando un PDF termina sin errores se genera su entrada
+        del manifiesto con items y totals vacíos: solo debe guardarse después (o en la
+        misma transacción) que las filas generadas antes que ella.
+        """
+        pdf_files = list_pdf_files(directory_path)
+        self.manifest_entries = []
+        self.skipped_files = []
+        self.failed_files = []
+        
+        file_info = {}
+        if manifest is not None:
+            with self.metrics.stage("manifest"):
+                pdf_files, file_info = self._filter_unchanged_files(pdf_files, manifest, force=force)
+            self.metrics.count("skipped", len(self.skipped_files))
+            if self.skipped_files:
+                print(f"Omitidos {len(self.skipped_files)} PDFs sin cambios")
+            # PDFs ya conocidos con otra ruta: solo hay que actualizar su registro
+            for entry in list(self.manifest_entries):
+                yield [], [], entry
+        
+        if workers is None:
+            workers = os.cpu_count() or 1
+        
+        hashes = {pdf_file: entry['content_hash'] for pdf_file, entry in file_info.items()}
+        if workers > 1 and pdf_files:
+            tasks = self._iter_tasks_parallel(pdf_files, workers, hashes)
+        else:
+            tasks = self._iter_tasks_sequential(pdf_files, hashes)
+        
+        current_file = None
+        file_numbers = []
+        failed = False
+        for pdf_file, page_results, error, timings in tasks:
+            if pdf_file != current_file:
+                if current_file is not None:
+                    entry = self._finish_file(current_file, file_info, file_numbers, failed)
+                    if entry:
+                        yield [], [], entry
+                current_file = pdf_file
+                file_numbers = []
+                failed = False
+                self.metrics.count("files")
+            
+            self.metrics.add_timings(timings)
+            if failed:
+                # Igual que en el modo secuencial: se descartan las páginas posteriores al fallo
+                continue
+            
+            self.metrics.count("pages", len(page_results))
+            for items, totals, date, number in page_results:
+                if date:
+                    self.invoice_dates.append(date)
+                if number:
+                    self.invoice_numbers.append(number)
+                    if number not in file_numbers:
+                        file_numbers.append(number)
+                
+                yield items, totals, None
+            
+            if error:
+                print(f"Error procesando {pdf_file}: {error}")
+                self.failed_files.append(pdf_file)
+                self.metrics.count("errors")
+                failed = True
+        
+        if current_file is not None:
+            entry = self._finish_file(current_file, file_info, file_numbers, failed)
+            if entry:
+                yield [], [], entry
+        
+        if self.text_cache is not None:
+            self.text_cache.evict()
+
+    def _finish_file(self, pdf_file, file_info, file_numbers, failed):
+        # Los PDFs con errores no se registran para volver a intentarlo en la próxima ejecución
+        if pdf_file not in file_info or failed:
+            return None
+        entry = file_info[pdf_file]
+        entry['invoice_numbers'] = file_numbers
+        self.manifest_entries.append(entry)
+        return entry
+
+    def stream_pdf_directory(self, directory_path, db, workers=1, manifest=None,
+                             batch_size=STREAM_BATCH_SIZE, on_batch=None, writer=None, force=False):
+        """Procesa un directorio guardando las filas en la base de datos por lotes.
+
+        Las filas se convierten a tipos de base de datos según se extraen y cada lote
+        de batch_size filas se envía al DatabaseWriter en cuanto se completa, así el
+        análisis no espera al disco y la memoria no depende del tamaño del directorio.
+        Sin writer se usa uno propio que se cierra al terminar. on_batch(items, totals)
+        recibe los totales acumulados tras confirmarse cada lote (desde el hilo
+        escritor). Devuelve el número de artículos y totales guardados.
+        """
+        with self._batch_writer(db, writer) as writer:
+            item_rows = []
+            total_rows = []
+            entries = []
+            saved_items = 0
+            saved_totals = 0
+            
+            for items, totals, finished_entry in self.iter_pdf_directory(directory_path, workers=workers,
+                                                                         manifest=manifest, force=force):
+                with self.metrics.stage("db_rows"):
+                    item_rows.extend(item_to_db_row(item) for item in items)
+                    total_rows.extend(total_to_db_row(total) for total in totals)
+                if finished_entry:
+                    entries.append(finished_entry)
+                
+                if len(item_rows) + len(total_rows) >= batch_size:
+                    saved_items, saved_totals = self._submit_batch(writer, item_rows, total_rows, entries, None,
+                                                                   saved_items, saved_totals, on_batch)
+                    item_rows, total_rows, entries = [], [], []
+            
+            if item_rows or total_rows or entries:
+                saved_items, saved_totals = self._submit_batch(writer, item_rows, total_rows, entries, None,
+                                                               saved_items, saved_totals, on_batch)
+            with self.metrics.stage("flush"):
+                writer.flush()
+        
+        return saved_items, saved_totals
+
+    @contextmanager
+    def _batch_writer(self, db, writer):
+        # Un writer recibido (el de la ventana) sigue abierto al terminar; uno propio se cierra
+        if writer is not None:
+            writer.metrics = self.metrics
+            yield writer
+        else:
+            with DatabaseWriter(db, metrics=self.metrics) as writer:
+                yield writer
+
+    def _submit_batch(self, writer, item_rows, total_rows, entries, replace_invoices, saved_items, saved_totals,
+                      on_batch):
+        saved_items += len(item_rows)
+        saved_totals += len(total_rows)
+        on_commit = functools.partial(on_batch, saved_items, saved_totals) if on_batch else None
+        with self.metrics.stage("write_wait"):
+            writer.submit(item_rows, total_rows, manifest_entries=entries, replace_invoices=replace_invoices,
+                          on_commit=on_commit)
+        return saved_items, saved_totals
+
+    def reparse_from_cache(self, db, batch_size=STREAM_BATCH_SIZE, on_batch=None, writer=None):
+        """Vuelve a aplicar extract_data_from_text a todos los PDFs del manifiesto.
+
+        Usa el texto de self.text_cache, así que solo se abre con pdfplumber un PDF
+        cuya caché se haya expulsado (si sigue existiendo sin cambios). Las filas
+        anteriores de cada factura se sustituyen en la misma transacción que las nuevas.
+        Los lotes se escriben con un DatabaseWriter, como en stream_pdf_directory.
+        Devuelve el número de artículos y totales guardados.
+        """
+        if self.text_cache is None:
+            raise ValueError("reparse_from_cache necesita una TextCache")
+        
+        with self._batch_writer(db, writer) as writer:
+            item_rows = []
+            total_rows = []
+            entries = []
+            replace_invoices = set()
+            saved_items = 0
+            saved_totals = 0
+            
+            manifest = db.get_manifest()
+            for file_path in sorted(manifest):
+                entry = dict(manifest[file_path])
+                filename = os.path.basename(file_path)
+                with self.metrics.stage("text_cache"):
+                    texts = self.text_cache.get_pages(text_cache_key(entry['content_hash'], self.template))
+                if texts is not None:
+                    with self.metrics.stage("parse"):
+                        page_results = [self.extract_data_from_text(text, filename) for text in texts]
+                    error = None
+                elif os.path.exists(file_path) and file_content_hash(file_path) == entry['content_hash']:
+                    print(f"Sin texto en caché, procesando: {filename}")
+                    timings = {} if self.metrics.enabled else None
+                    page_results, error = extract_pdf_pages(file_path, cache_path=self.text_cache.db_path,
+                                                            content_hash=entry['content_hash'], template=self.template,
+                                                            timings=timings)
+                    self.metrics.add_timings(timings)
+                else:
+                    print(f"Sin texto en caché y el PDF ya no está disponible: {file_path}")
+                    continue
+            
+                self.metrics.count("files")
+                if error:
+                    print(f"Error procesando {file_path}: {error}")
+                    self.metrics.count("errors")
+                    continue
+            
+                self.metrics.count("pages", len(page_results))
+                file_numbers = []
+                with self.metrics.stage("db_rows"):
+                    for items, totals, date, number in page_results:
+                        item_rows.extend(item_to_db_row(item) for item in items)
+                        total_rows.extend(total_to_db_row(total) for total in totals)
+                        if number and number not in file_numbers:
+                            file_numbers.append(number)
+            
+                replace_invoices.update(entry['invoice_numbers'])
+                replace_invoices.update(file_numbers)
+                entry['invoice_numbers'] = file_numbers
+                entry['parser_version'] = PARSER_VERSION
+                entries.append(entry)
+            
+                # Se corta siempre entre PDFs para sustituir cada factura en una sola transacción
+                if len(item_rows) + len(total_rows) >= batch_size:
+                    saved_items, saved_totals = self._submit_batch(writer, item_rows, total_rows, entries, replace_invoices,
+                                                                   saved_items, saved_totals, on_batch)
+                    item_rows, total_rows, entries, replace_invoices = [], [], [], set()
+            
+            if entries:
+                saved_items, saved_totals = self._submit_batch(writer, item_rows, total_rows, entries, replace_invoices,
+                                                               saved_items, saved_totals, on_batch)
+            with self.metrics.stage("flush"):
+                writer.flush()
+        
+        self.text_cache.evict()
+        return saved_items, saved_totals
+
+    def _filter_unchanged_files(self, pdf_files, manifest, force=False):
+        """Separa los PDFs nuevos o modificados de los ya registrados en el manifiesto.
+
+        Si la ruta, el tamaño y la fecha de modificación coinciden no se calcula el
+        hash; en otro caso se compara el hash del contenido, así un PDF copiado o
+        renombrado tampoco se vuelve a procesar. Con force no se omite ninguno, pero
+        se preparan igualmente sus entradas del manifiesto.
+        """
+        if force:
+            manifest = {}
+        known_hashes = {
+            entry['content_hash']: entry for entry in manifest.values()
+            if entry['parser_version'] == PARSER_VERSION
+        }
+        
+        pending = []
+        file_info = {}
         for pdf_file in pdf_files:
+            file_path = os.path.abspath(pdf_file)
             try:
-                print(f"Procesando: {os.path.basename(pdf_file)}")
-                with pdfplumber.open(pdf_file) as pdf:
-                    for page in pdf.pages:
-                        text = page.extract_text()
-                        items, totals, date, number = self.extract_data_from_text(text, os.path.basename(pdf_file))
-                        
-                        all_items.extend(items)
-                        all_totals.extend(totals)
-                        
-                        if date:
-                            self.invoice_dates.append(date)
-                        if number:
-                            self.invoice_numbers.append(number)
-                            
-            except Exception as e:
-                print(f"Error procesando {pdf_file}: {str(e)}")
+                stat = os.stat(file_path)
+                recorded = manifest.get(file_path)
+                if (recorded and recorded['parser_version'] == PARSER_VERSION
+                        and recorded['file_size'] == stat.st_size and recorded['mtime'] == stat.st_mtime):
+                    self.skipped_files.append(pdf_file)
+                    continue
+                
+                content_hash = file_content_hash(file_path)
+            except OSError as e:
+                # Se deja pasar para que el error se notifique como hasta ahora
+                print(f"Error leyendo {pdf_file}: {e}")
+                pending.append(pdf_file)
+                continue
+            
+            entry = {
+                'file_path': file_path, 'file_size': stat.st_size, 'mtime': stat.st_mtime,
+                'content_hash': content_hash, 'parser_version': PARSER_VERSION, 'invoice_numbers': []
+            }
+            if content_hash in known_hashes:
+                # Mismo contenido con otra ruta o fecha: se actualiza el registro sin extraer
+                entry['invoice_numbers'] = known_hashes[content_hash]['invoice_numbers']
+                self.manifest_entries.append(entry)
+                self.skipped_files.append(pdf_file)
+                continue
+            
+            pending.append(pdf_file)
+            file_info[pdf_file] = entry
         
-        return all_items, all_totals
+        return pending, file_info
+
+    def _iter_tasks_sequential(self, pdf_files, hashes):
+        cache_path = self.text_cache.db_path if self.text_cache is not None else None
+        for pdf_file in pdf_files:
+            print(f"Procesando: {os.path.basename(pdf_file)}")
+            timings = {} if self.metrics.enabled else None
+            page_results, error = extract_pdf_pages(pdf_file, cache_path=cache_path, content_hash=hashes.get(pdf_file),
+                                                    template=self.template, timings=timings)
+            yield pdf_file, page_results, error, timings
+
+    def _iter_tasks_parallel(self, pdf_files, workers, hashes):
+        """Reparte los PDFs en tareas por rangos de páginas y genera sus resultados en orden.
+
+        Solo se mantienen en vuelo unas pocas tareas por proceso para que la memoria
+        no crezca con el número de ficheros. Si un proceso del pool muere (falta de
+        memoria, fallo del intérprete) todas las tareas en vuelo fallan con
+        BrokenProcessPool: sus PDFs se notifican como fallidos y el resto se procesa
+        en un pool nuevo.
+        """
+        max_pending = workers * 2
+        cache_path = self.text_cache.db_path if self.text_cache is not None else None
+        # Los procesos del pool no comparten self.metrics: devuelven sus tiempos con los resultados
+        extract = _extract_pdf_pages_timed if self.metrics.enabled else extract_pdf_pages
+        executor = self._new_pool(workers, cache_path)
+        
+        def submit(pdf_file, start, end):
+            nonlocal executor
+            try:
+                return executor, executor.submit(extract, pdf_file, start, end, cache_path, hashes.get(pdf_file),
+                                                 self.template)
+            except BrokenProcessPool:
+                executor = self._replace_pool(executor, workers, cache_path)
+                return submit(pdf_file, start, end)
+        
+        def result(pdf_file, owner, task):
+            nonlocal executor
+            task_result = self._task_result(pdf_file, task)
+            # Las demás tareas del pool roto también fallarán, pero solo se sustituye una vez
+            if owner is executor and isinstance(task.exception(), BrokenProcessPool):
+                executor = self._replace_pool(executor, workers, cache_path)
+            return task_result
+        
+        try:
+            pending = deque()
+            for pdf_file in pdf_files:
+                print(f"Procesando: {os.path.basename(pdf_file)}")
+                ranges = [(0, None)]
+                try:
+                    if os.path.getsize(pdf_file) > LARGE_PDF_BYTES:
+                        page_count = count_pdf_pages(pdf_file)
+                        ranges = [(start, start + PAGES_PER_TASK) for start in range(0, page_count, PAGES_PER_TASK)] or ranges
+                except Exception:
+                    # El error real se notificará al extraer el fichero completo
+                    pass
+                
+                for start, end in ranges:
+                    pending.append((pdf_file, *submit(pdf_file, start, end)))
+                    if len(pending) >= max_pending:
+                        yield result(*pending.popleft())
+            
+            while pending:
+                yield result(*pending.popleft())
+        finally:
+            executor.shutdown()
+
+    @staticmethod
+    def _new_pool(workers, cache_path):
+        return ProcessPoolExecutor(max_workers=workers, initializer=init_pool_worker, initargs=(cache_path,))
+
+    def _replace_pool(self, executor, workers, cache_path):
+        print("Un proceso del pool ha terminado de forma anormal; se continúa con un pool nuevo")
+        executor.shutdown(wait=False)
+        return self._new_pool(workers, cache_path)
+
+    def _task_result(self, pdf_file, task):
+        try:
+            result = task.result()
+        except BrokenProcessPool as e:
+            # El proceso murió con esta tarea (u otra) en vuelo: no hay resultados de ella
+            return pdf_file, [], f"el proceso que lo extraía terminó de forma anormal ({e})", None
+        timings = result[2] if len(result) == 3 else None
+        return pdf_file, result[0], result[1], timings
 
+    @timed_stage("create_dataframes")
     def create_dataframes(self, items_data, totals_data):
+        import pandas as pd
+        
         df_items = pd.DataFrame()
         if items_data:
             df_items = pd.DataFrame(items_data)
@@ -284,7 +3127,9 @@ class PDFInvoiceProcessor:
             
             numeric_item_columns = ["Cantidad", "Precio Unitario (EUR)", "Descuento %", "IVA %", "Valor Neto (EUR)"]
             for col in numeric_item_columns:
-                if col in df_items.columns:
+                if col in MONEY_COLUMNS and col in df_items.columns:
+                    df_items[col] = cents_column(df_items[col])
+                elif col in df_items.columns:
                     df_items[col] = df_items[col].str.replace(',', '.').astype(float)
             
             if "Fecha Factura" in df_items.columns:
@@ -305,7 +3150,7 @@ class PDFInvoiceProcessor:
             numeric_total_columns = ["Portes (EUR)", "Valor Neto (EUR)", "Importe IVA (EUR)", "Importe Total (EUR)"]
             for col in numeric_total_columns:
                 if col in df_totals.columns:
-                    df_totals[col] = df_totals[col].str.replace(',', '.').astype(float)
+                    df_totals[col] = cents_column(df_totals[col])
             
             if "IVA %" in df_totals.columns:
                 df_totals["IVA %"] = df_totals["IVA %"].str.replace('%', '').str.replace(',', '.').astype(float)
@@ -315,62 +3160,45 @@ class PDFInvoiceProcessor:
         
         return df_items, df_totals
     
+    @timed_stage("statistics")
     def generate_statistics(self, df_items, df_totals):
-        stats = {}
-        if not df_items.empty:
-            stats['total_invoices'] = len(df_items['Nº Factura'].unique())
-            stats['total_items'] = len(df_items)
-            stats['total_spent'] = df_items['Valor Neto (EUR)'].sum()
-            stats['avg_item_price'] = df_items['Precio Unitario (EUR)'].mean()
-            stats['most_expensive_item'] = df_items.loc[df_items['Precio Unitario (EUR)'].idxmax()]
-            
-            # FILTRADO DE VALORES NaN
-            df_items_filtered = df_items.dropna(subset=['Fecha Factura', 'Valor Neto (EUR)'])
-            
-            df_items_filtered['Mes'] = df_items_filtered['Fecha Factura'].dt.to_period('M')
-            monthly_spending = df_items_filtered.groupby('Mes')['Valor Neto (EUR)'].sum()
-            stats['monthly_spending'] = monthly_spending
-            
-            top_products = df_items_filtered['Descripción'].value_counts().head(10)
-            stats['top_products'] = top_products
-            
-            spending_per_product = df_items_filtered.groupby('Descripción')['Valor Neto (EUR)'].sum().sort_values(ascending=False).head(10)
-            stats['spending_per_product'] = spending_per_product
-            
-            # NUEVOS CAMPOS
-            # Total de impuestos
-            if not df_totals.empty:
-                stats['total_taxes'] = df_totals['Importe IVA (EUR)'].sum()
-            
-            # Gasto por producto
-            stats['spending_per_product'] = df_items_filtered.groupby('Descripción')['Valor Neto (EUR)'].sum().sort_values(ascending=False)
-            
-            # Total de cada producto comprado
-            stats['total_quantity_per_product'] = df_items_filtered.groupby('Descripción')['Cantidad'].sum().sort_values(ascending=False)
+        """Estadísticas de gasto de los artículos y totales.
 
-        if not df_totals.empty:
-            stats['avg_invoice_total'] = df_totals['Importe Total (EUR)'].mean()
-        
-        return stats
+        df_items y df_totals pueden ser DataFrames o iteradores de trozos
+        (DatabaseManager.iter_items/iter_invoices): se recorren una sola vez.
+        """
+        return StatisticsAccumulator.from_frames(df_items, df_totals).result()
     
+    @timed_stage("forecast")
     def predict_future_spending(self, df_items):
-        if df_items.empty or 'Fecha Factura' not in df_items.columns:
-            return None, None
+        """Predicción de los próximos 6 meses a partir del gasto mensual.
+
+        df_items puede ser un DataFrame o un iterador de trozos con al menos la fecha
+        y el valor neto (FORECAST_ITEM_COLUMNS).
+        """
+        # Solo hacen falta el gasto por mes y la última fecha: se suman por trozos
+        accumulator = StatisticsAccumulator()
+        for chunk in iter_frames(df_items):
+            if 'Fecha Factura' not in chunk.columns:
+                return None, None
+            accumulator.add_months(chunk)
+        accumulator.flush()
+        return self.forecast_monthly(accumulator.monthly_spending, accumulator.last_date)
+
+    def forecast_monthly(self, monthly_spending, last_date):
+        """Predicción de los próximos 6 meses a partir del gasto por mes ya agregado
+        (stats['monthly_spending'] y stats['last_date'] de generate_statistics), en céntimos."""
+        import numpy as np
+        import pandas as pd
         
-        # FILTRADO DE VALORES NaN
-        df_items_filtered = df_items.dropna(subset=['Fecha Factura', 'Valor Neto (EUR)'])
-        if df_items_filtered.empty:
+        if monthly_spending is None or len(monthly_spending) < 3:
             return None, None
-            
-        df_items_filtered['Fecha Numerica'] = (df_items_filtered['Fecha Factura'] - df_items_filtered['Fecha Factura'].min()).dt.days
-        monthly_data = df_items_filtered.groupby(df_items_filtered['Fecha Factura'].dt.to_period('M'))['Valor Neto (EUR)'].sum().reset_index()
-        monthly_data['Mes'] = range(len(monthly_data))
         
-        if len(monthly_data) < 3:
-            return None, None
+        X = np.arange(len(monthly_spending)).reshape(-1, 1)
+        y = monthly_spending.values
         
-        X = monthly_data['Mes'].values.reshape(-1, 1)
-        y = monthly_data['Valor Neto (EUR)'].values
+        from sklearn.linear_model import LinearRegression
+        from sklearn.preprocessing import PolynomialFeatures
         
         poly = PolynomialFeatures(degree=2)
         X_poly = poly.fit_transform(X)
@@ -378,73 +3206,83 @@ class PDFInvoiceProcessor:
         model = LinearRegression()
         model.fit(X_poly, y)
         
-        future_months_idx = np.array(range(len(monthly_data), len(monthly_data) + 6)).reshape(-1, 1)
+        future_months_idx = np.array(range(len(monthly_spending), len(monthly_spending) + 6)).reshape(-1, 1)
         future_months_poly = poly.transform(future_months_idx)
         predictions = model.predict(future_months_poly)
         
-        last_date = df_items_filtered['Fecha Factura'].max()
         future_dates = pd.date_range(start=last_date, periods=7, freq='M')[1:]
         
         return predictions, future_dates
 
-    def generate_visualizations(self, df_items, df_totals, output_dir):
+    @timed_stage("visualizations")
+    def generate_visualizations(self, df_items, df_totals, output_dir, stats=None):
+        """Guarda los gráficos en output_dir.
+
+        Se dibujan a partir de las agregaciones de generate_statistics: con stats (por
+        ejemplo de DatabaseManager.rollup_statistics) no se vuelven a calcular y
+        df_items y df_totals no se usan. Devuelve las rutas de los gráficos guardados.
+        """
+        plt = load_pyplot()
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
+        saved = []
+
+        def save(name):
+            saved.append(os.path.join(output_dir, name))
+            plt.savefig(saved[-1])
+            plt.close()
         
-        # FILTRADO DE VALORES NaN
-        df_items_filtered = df_items.dropna(subset=['Fecha Factura', 'Valor Neto (EUR)'])
+        if stats is None:
+            stats = StatisticsAccumulator.from_frames(df_items, df_totals).result()
+        monthly_spending = stats.get('monthly_spending')
 
-        if not df_items_filtered.empty and 'Fecha Factura' in df_items_filtered.columns:
+        if monthly_spending is not None and not monthly_spending.empty:
             plt.figure(figsize=(12, 8))
-            df_items_filtered['Mes'] = df_items_filtered['Fecha Factura'].dt.to_period('M')
-            monthly_spending = df_items_filtered.groupby('Mes')['Valor Neto (EUR)'].sum()
             
-            monthly_spending.plot(kind='bar', color='skyblue')
+            cents_to_euros(monthly_spending).plot(kind='bar', color='skyblue')
             plt.title('Gastos Mensuales en Materiales')
             plt.xlabel('Mes')
             plt.ylabel('Euros (EUR)')
             plt.xticks(rotation=45)
             plt.tight_layout()
-            plt.savefig(os.path.join(output_dir, 'gastos_mensuales.png'))
-            plt.close()
+            save('gastos_mensuales.png')
         
-        if not df_items_filtered.empty and 'Descripción' in df_items_filtered.columns and 'Valor Neto (EUR)' in df_items_filtered.columns:
+        spending_per_product = stats.get('spending_per_product')
+        if spending_per_product is not None and not spending_per_product.empty:
             plt.figure(figsize=(12, 8))
-            spending_per_product = df_items_filtered.groupby('Descripción')['Valor Neto (EUR)'].sum().sort_values(ascending=False).head(10)
             
-            spending_per_product.plot(kind='barh', color='lightcoral')
+            cents_to_euros(spending_per_product.head(10)).plot(kind='barh', color='lightcoral')
             plt.title('Top 10 Productos por Gasto')
             plt.xlabel('Gasto Total (EUR)')
             plt.ylabel('Producto')
             plt.tight_layout()
-            plt.savefig(os.path.join(output_dir, 'gasto_por_producto.png'))
-            plt.close()
+            save('gasto_por_producto.png')
 
-        if not df_items_filtered.empty and 'Descripción' in df_items_filtered.columns and 'Cantidad' in df_items_filtered.columns:
+        quantity_per_product = stats.get('total_quantity_per_product')
+        if quantity_per_product is not None and not quantity_per_product.empty:
             plt.figure(figsize=(12, 8))
-            quantity_per_product = df_items_filtered.groupby('Descripción')['Cantidad'].sum().sort_values(ascending=False).head(10)
             
-            quantity_per_product.plot(kind='barh', color='lightgreen')
+            quantity_per_product.head(10).plot(kind='barh', color='lightgreen')
             plt.title('Top 10 Productos por Cantidad Comprada')
             plt.xlabel('Cantidad Total')
             plt.ylabel('Producto')
             plt.tight_layout()
-            plt.savefig(os.path.join(output_dir, 'cantidad_por_producto.png'))
-            plt.close()
+            save('cantidad_por_producto.png')
             
-        predictions, future_dates = self.predict_future_spending(df_items)
+        predictions, future_dates = self.forecast_monthly(monthly_spending, stats.get('last_date'))
         if predictions is not None:
             plt.figure(figsize=(12, 8))
-            df_items_filtered['Mes'] = df_items_filtered['Fecha Factura'].dt.to_period('M')
-            monthly_spending = df_items_filtered.groupby('Mes')['Valor Neto (EUR)'].sum()
             
             all_months = monthly_spending.index.astype(str).tolist()
             all_months.extend([d.strftime('%Y-%m') for d in future_dates])
 
-            all_values = monthly_spending.values.tolist()
+            # Los gráficos se dibujan en euros
+            monthly_euros = cents_to_euros(monthly_spending.values)
+            predictions = cents_to_euros(predictions)
+            all_values = monthly_euros.tolist()
             all_values.extend(predictions)
             
-            plt.plot(monthly_spending.index.astype(str), monthly_spending.values, label='Gastos históricos', marker='o', color='b')
+            plt.plot(monthly_spending.index.astype(str), monthly_euros, label='Gastos históricos', marker='o', color='b')
             plt.plot(all_months[-len(predictions):], predictions, label='Predicción (6 meses)', marker='x', linestyle='--', color='r')
             
             plt.title('Gastos Mensuales y Predicción de Futuros Gastos')
@@ -453,18 +3291,63 @@ class PDFInvoiceProcessor:
             plt.legend()
             plt.xticks(rotation=45)
             plt.tight_layout()
-            plt.savefig(os.path.join(output_dir, 'prediccion_gastos.png'))
-            plt.close()
+            save('prediccion_gastos.png')
+        return saved
+
+GENERIC_TEMPLATE_LABEL = "Genérica"
 
 class PDFProcessorApp:
     def __init__(self, root):
+        load_tkinter()
         self.root = root
         self.root.title("Procesador de Facturas PDF")
         self.root.geometry("1000x700")
         
-        self.processor = PDFInvoiceProcessor()
+        self.processor = PDFInvoiceProcessor(text_cache=TextCache())
+        self.stats_cache = StatisticsCache()
         self.db = DatabaseManager()
+        # Un único hilo escribe los lotes de las facturas mientras el análisis sigue
+        self.writer = DatabaseWriter(self.db)
+        # Mensajes de progreso de los hilos de trabajo: los muestra el hilo de Tk (ver
+        # poll_messages), así el hilo escritor nunca espera a la ventana
+        self.messages = queue.Queue()
+        self.closing = False
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         self.create_widgets()
+        self.root.after(UI_POLL_MS, self.poll_messages)
+
+    def poll_messages(self):
+        """Muestra, en orden, los mensajes que los hilos de trabajo han dejado en self.messages."""
+        try:
+            while True:
+                self.update_results_display(self.messages.get_nowait())
+        except queue.Empty:
+            pass
+        self.root.after(UI_POLL_MS, self.poll_messages)
+
+    def on_close(self):
+        # Antes de salir se confirman los lotes que el hilo escritor tenga pendientes. Se
+        # espera en otro hilo: el de Tk debe seguir atendiendo la ventana mientras tanto
+        if self.closing:
+            return
+        self.closing = True
+        self.update_results_display("Guardando los últimos datos antes de salir...")
+        closer = threading.Thread(target=self.close_writer, name="CloseWriter", daemon=True)
+        closer.start()
+        self.root.after(UI_POLL_MS, self.finish_close, closer)
+
+    def close_writer(self):
+        try:
+            self.writer.close()
+        except sqlite3.Error as e:
+            print(f"Error guardando los últimos datos: {e}")
+
+    def finish_close(self, closer):
+        if closer.is_alive():
+            self.root.after(UI_POLL_MS, self.finish_close, closer)
+            return
+        self.db.close()
+        self.root.destroy()
 
     def create_widgets(self):
         main_frame = ttk.Frame(self.root, padding="10")
@@ -481,12 +3364,54 @@ class PDFProcessorApp:
         ttk.Entry(dir_frame, textvariable=self.dir_var, width=60).grid(row=0, column=1, padx=5)
         ttk.Button(dir_frame, text="Examinar", command=self.browse_directory).grid(row=0, column=2)
         
+        ttk.Label(dir_frame, text="Procesos:").grid(row=0, column=3, padx=(10, 0))
+        self.workers_var = tk.IntVar(value=os.cpu_count() or 1)
+        ttk.Spinbox(dir_frame, from_=1, to=os.cpu_count() or 1, textvariable=self.workers_var, width=4).grid(row=0, column=4, padx=5)
+        
+        # Plantilla del proveedor: permite usar un motor de extracción más rápido
+        ttk.Label(dir_frame, text="Plantilla:").grid(row=1, column=0, sticky=tk.W, pady=(5, 0))
+        self.template_var = tk.StringVar(value=GENERIC_TEMPLATE_LABEL)
+        ttk.Combobox(dir_frame, textvariable=self.template_var, state="readonly", width=20,
+                     values=[GENERIC_TEMPLATE_LABEL] + sorted(INVOICE_TEMPLATES)).grid(row=1, column=1, sticky=tk.W, padx=5, pady=(5, 0))
+        
+        # Filtros de las estadísticas y la exportación: solo se cargan las filas que los cumplen
+        filter_frame = ttk.Frame(dir_frame)
+        filter_frame.grid(row=2, column=0, columnspan=5, sticky=tk.W, pady=(5, 0))
+        self.start_date_var = tk.StringVar()
+        self.end_date_var = tk.StringVar()
+        self.product_var = tk.StringVar()
+        ttk.Label(filter_frame, text="Desde (AAAA-MM-DD):").grid(row=0, column=0, sticky=tk.W)
+        ttk.Entry(filter_frame, textvariable=self.start_date_var, width=12).grid(row=0, column=1, padx=5)
+        ttk.Label(filter_frame, text="Hasta:").grid(row=0, column=2, sticky=tk.W)
+        ttk.Entry(filter_frame, textvariable=self.end_date_var, width=12).grid(row=0, column=3, padx=5)
+        ttk.Label(filter_frame, text="Producto:").grid(row=0, column=4, sticky=tk.W)
+        ttk.Entry(filter_frame, textvariable=self.product_var, width=25).grid(row=0, column=5, padx=5)
+        
+        # Búsqueda de artículos por código o descripción, por páginas de SEARCH_PAGE_SIZE
+        search_frame = ttk.Frame(dir_frame)
+        search_frame.grid(row=3, column=0, columnspan=5, sticky=tk.W, pady=(5, 0))
+        self.search_var = tk.StringVar()
+        self.search_text = ""
+        self.search_offset = 0
+        ttk.Label(search_frame, text="Buscar artículos:").grid(row=0, column=0, sticky=tk.W)
+        search_entry = ttk.Entry(search_frame, textvariable=self.search_var, width=40)
+        search_entry.grid(row=0, column=1, padx=5)
+        search_entry.bind("<Return>", lambda event: self.start_search())
+        ttk.Button(search_frame, text="Buscar", command=self.start_search).grid(row=0, column=2)
+        self.previous_page_button = ttk.Button(search_frame, text="◀ Anterior", state=tk.DISABLED,
+                                               command=lambda: self.load_search_page(self.search_offset - SEARCH_PAGE_SIZE))
+        self.previous_page_button.grid(row=0, column=3, padx=(10, 0))
+        self.next_page_button = ttk.Button(search_frame, text="Siguiente ▶", state=tk.DISABLED,
+                                           command=lambda: self.load_search_page(self.search_offset + SEARCH_PAGE_SIZE))
+        self.next_page_button.grid(row=0, column=4, padx=5)
+        
         button_frame = ttk.Frame(main_frame)
         button_frame.grid(row=2, column=0, columnspan=3, pady=10)
         
         ttk.Button(button_frame, text="Procesar PDFs", command=self.start_processing_thread).grid(row=0, column=0, padx=5)
         ttk.Button(button_frame, text="Generar Estadísticas", command=self.start_stats_thread).grid(row=0, column=1, padx=5)
         ttk.Button(button_frame, text="Exportar CSV", command=self.export_csv).grid(row=0, column=2, padx=5)
+        ttk.Button(button_frame, text="Reprocesar desde caché", command=self.start_reparse_thread).grid(row=0, column=3, padx=5)
         
         results_frame = ttk.LabelFrame(main_frame, text="Resultados", padding="5")
         results_frame.grid(row=3, column=0, columnspan=3, pady=10, sticky=(tk.W, tk.E, tk.N, tk.S))
@@ -508,8 +3433,12 @@ class PDFProcessorApp:
         results_frame.columnconfigure(0, weight=1)
         results_frame.rowconfigure(0, weight=1)
         
-        self.db.create_tables()
-        self.refresh_data()
+        try:
+            self.db.create_tables()
+        except sqlite3.Error as e:
+            messagebox.showerror("Error de Base de Datos", f"No se pudo crear las tablas: {e}")
+        # La carga de datos importa pandas: se lanza cuando la ventana ya está dibujada
+        self.root.after_idle(self.refresh_data)
     
     def refresh_data(self):
         thread = threading.Thread(target=self._refresh_data_thread)
@@ -517,12 +3446,17 @@ class PDFProcessorApp:
         thread.start()
         
     def _refresh_data_thread(self):
-        self.df_items, self.df_invoices = self.db.get_all_data()
-        if not self.df_items.empty:
-            message = "Datos cargados desde la base de datos. ¡Listo para generar estadísticas!"
+        # Solo se cuenta: las estadísticas y la exportación cargan después las filas que necesitan
+        try:
+            n_items = self.db.count_items()
+        except sqlite3.Error as e:
+            n_items = 0
+            print(f"Error obteniendo datos de la base de datos: {e}")
+        if n_items:
+            message = f"{n_items} artículos en la base de datos. ¡Listo para generar estadísticas!"
         else:
             message = "Base de datos vacía. Por favor, procesa algunos PDFs."
-        self.root.after(0, self.update_results_display, message)
+        self.messages.put(message)
 
     def update_results_display(self, message):
         self.results_text.configure(state=tk.NORMAL)
@@ -541,91 +3475,170 @@ class PDFProcessorApp:
             messagebox.showerror("Error", "Por favor, selecciona un directorio.")
             return
 
+        try:
+            workers = max(1, int(self.workers_var.get()))
+        except (tk.TclError, ValueError):
+            messagebox.showerror("Error", "El número de procesos debe ser un entero.")
+            return
+
+        self.processor.template = self.selected_template()
         self.update_results_display("Iniciando procesamiento de PDFs... Por favor, espera.")
         self.progress.start()
-        thread = threading.Thread(target=self.process_pdfs_in_thread, args=(directory,))
+        thread = threading.Thread(target=self.process_pdfs_in_thread, args=(directory, workers))
         thread.daemon = True
         thread.start()
 
-    def process_pdfs_in_thread(self, directory):
+    def process_pdfs_in_thread(self, directory, workers=1):
         try:
-            items, totals = self.processor.process_pdf_directory(directory)
-            df_items, df_totals = self.processor.create_dataframes(items, totals)
+            manifest = self.db.get_manifest()
+            
+            def report_progress(saved_items, saved_totals):
+                # Desde el hilo escritor: solo deja el mensaje en la cola, no llama a Tk
+                self.messages.put(f"Procesando PDFs... {saved_items} artículos y {saved_totals} totales guardados.")
+            
+            # Cada lote pasa al hilo escritor en cuanto se completa: la memoria no depende del número de PDFs
+            with self.start_metrics("ingest") as metrics:
+                saved_items, saved_totals = self.processor.stream_pdf_directory(
+                    directory, self.db, workers=workers, manifest=manifest, on_batch=report_progress,
+                    writer=self.writer
+                )
+                if saved_items or saved_totals:
+                    update_snapshot(self.db, metrics)
+            self.record_run(metrics)
+            skipped = len(self.processor.skipped_files)
 
-            if not df_items.empty and not df_totals.empty:
-                self.db.insert_data(df_items, df_totals)
-                self.root.after(0, self.update_results_display, "Procesamiento completado. Datos guardados en la base de datos.")
+            if saved_items or saved_totals:
+                message = f"Procesamiento completado. {saved_items} artículos y {saved_totals} totales guardados en la base de datos."
+                if skipped:
+                    message += f"\n{skipped} PDFs sin cambios omitidos."
+                self.messages.put(message)
                 self.root.after(0, self.refresh_data)
+            elif skipped:
+                self.messages.put(f"No hay PDFs nuevos que procesar ({skipped} sin cambios).")
             else:
-                self.root.after(0, self.update_results_display, "No se encontraron datos válidos en los PDFs procesados.")
+                self.messages.put("No se encontraron datos válidos en los PDFs procesados.")
         
         except Exception as e:
-            self.root.after(0, self.update_results_display, f"Error durante el procesamiento: {str(e)}")
+            self.messages.put(f"Error durante el procesamiento: {str(e)}")
         finally:
             self.root.after(0, self.progress.stop)
     
+    def start_metrics(self, command):
+        """Mide la siguiente operación del procesador (ver RunMetrics)."""
+        self.processor.metrics = RunMetrics(command)
+        return self.processor.metrics
+
+    def record_run(self, metrics):
+        try:
+            self.db.record_run(metrics)
+        except sqlite3.Error:
+            # El registro de tiempos no debe hacer fallar la operación
+            pass
+
+    def selected_filters(self):
+        """Filtros de consulta de la ventana; ValueError si una fecha no es válida."""
+        try:
+            return {
+                'start_date': parse_filter_date(self.start_date_var.get()),
+                'end_date': parse_filter_date(self.end_date_var.get()),
+                'description': self.product_var.get().strip() or None,
+            }
+        except ValueError:
+            raise ValueError("Las fechas deben tener el formato AAAA-MM-DD.")
+
+    def start_search(self):
+        self.search_text = self.search_var.get().strip()
+        if self.search_text:
+            self.load_search_page(0)
+
+    def load_search_page(self, offset):
+        thread = threading.Thread(target=self._search_thread, args=(self.search_text, max(offset, 0)))
+        thread.daemon = True
+        thread.start()
+
+    def _search_thread(self, text, offset):
+        # Solo se lee la página pedida: la consulta tarda milisegundos aunque haya millones de artículos
+        try:
+            page, total = self.db.search_items(text, offset=offset)
+        except sqlite3.Error as e:
+            self.root.after(0, self.update_results_display, f"Error buscando artículos: {str(e)}")
+            return
+        self.root.after(0, self.show_search_results, text, page, total, offset)
+
+    def show_search_results(self, text, page, total, offset):
+        self.search_offset = offset
+        self.update_results_display(f"Búsqueda: {text}\n" + format_search_results(page, total, offset))
+        self.previous_page_button.configure(state=tk.NORMAL if offset > 0 else tk.DISABLED)
+        has_next = total is None or offset + SEARCH_PAGE_SIZE < total
+        self.next_page_button.configure(state=tk.NORMAL if has_next else tk.DISABLED)
+
+    def selected_template(self):
+        template = self.template_var.get()
+        return None if template == GENERIC_TEMPLATE_LABEL else template
+
+    def start_reparse_thread(self):
+        self.processor.template = self.selected_template()
+        self.update_results_display("Reprocesando las facturas desde la caché de texto... Por favor, espera.")
+        self.progress.start()
+        thread = threading.Thread(target=self.reparse_in_thread)
+        thread.daemon = True
+        thread.start()
+
+    def reparse_in_thread(self):
+        try:
+            with self.start_metrics("reparse") as metrics:
+                saved_items, saved_totals = self.processor.reparse_from_cache(self.db, writer=self.writer)
+                if saved_items or saved_totals:
+                    update_snapshot(self.db, metrics)
+            self.record_run(metrics)
+            self.root.after(0, self.update_results_display,
+                            f"Reprocesamiento completado. {saved_items} artículos y {saved_totals} totales guardados en la base de datos.")
+            self.root.after(0, self.refresh_data)
+        except Exception as e:
+            self.root.after(0, self.update_results_display, f"Error durante el reprocesamiento: {str(e)}")
+        finally:
+            self.root.after(0, self.progress.stop)
+
     def start_stats_thread(self):
+        try:
+            filters = self.selected_filters()
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        
         # ANTES DE LANZAR EL HILO, ASEGURAMOS QUE LOS DATOS EXISTEN Y LUEGO LANZAMOS EL HILO
         self.update_results_display("Verificando datos y generando estadísticas... Por favor, espera.")
         self.progress.start()
-        thread = threading.Thread(target=self._check_and_generate_stats_thread)
+        thread = threading.Thread(target=self._check_and_generate_stats_thread, args=(filters,))
         thread.daemon = True
         thread.start()
 
-    def _check_and_generate_stats_thread(self):
-        # Carga los datos en el hilo secundario para evitar bloqueos
-        self.df_items, self.df_invoices = self.db.get_all_data()
+    def _check_and_generate_stats_thread(self, filters):
+        # Comprueba los datos en el hilo secundario para evitar bloqueos
+        try:
+            n_items = self.db.count_items(**filters)
+        except sqlite3.Error as e:
+            self.root.after(0, self.update_results_display, f"Error obteniendo datos de la base de datos: {str(e)}")
+            self.root.after(0, self.progress.stop)
+            return
 
         # Si no hay datos, muestra un error en la GUI usando after()
-        if self.df_items.empty:
-            self.root.after(0, lambda: messagebox.showerror("Error", "Primero procesa algunos PDFs para tener datos."))
+        if not n_items:
+            self.root.after(0, lambda: messagebox.showerror("Error", "No hay datos que cumplan los filtros. Procesa algunos PDFs o cambia los filtros."))
             self.root.after(0, self.progress.stop)
             return
 
         # Genera estadísticas y gráficos en el hilo secundario
         try:
-            # Crea una ruta segura para guardar los gráficos.
-            if sys.platform == "win32":
-                safe_path = os.path.join(os.environ.get('USERPROFILE'), 'Documents', 'ExpenditureControl_Stats')
-            else:
-                safe_path = os.path.join(os.path.expanduser('~'), 'Documents', 'ExpenditureControl_Stats')
-            
-            output_dir = safe_path
+            output_dir = get_stats_output_path()
             os.makedirs(output_dir, exist_ok=True)
             
-            stats = self.processor.generate_statistics(self.df_items, self.df_invoices)
-            
-            self.processor.generate_visualizations(self.df_items, self.df_invoices, output_dir)
-            
-            stats_text = "=== ESTADÍSTICAS ===\n\n"
-            stats_text += f"Total facturas procesadas: {stats.get('total_invoices', 0)}\n"
-            stats_text += f"Total artículos: {stats.get('total_items', 0)}\n"
-            stats_text += f"Total gastado: {stats.get('total_spent', 0):.2f} EUR\n"
-            stats_text += f"Gasto promedio por factura: {stats.get('avg_invoice_total', 0):.2f} EUR\n"
-            stats_text += f"Total de IVA pagado: {stats.get('total_taxes', 0):.2f} EUR\n\n"
-            
-            stats_text += "Gastos mensuales:\n"
-            if 'monthly_spending' in stats:
-                for month, amount in stats['monthly_spending'].items():
-                    stats_text += f"  {month}: {amount:.2f} EUR\n"
-            
-            stats_text += "\n--- Cantidad de productos comprados ---\n"
-            if 'total_quantity_per_product' in stats and not stats['total_quantity_per_product'].empty:
-                for product, count in stats['total_quantity_per_product'].items():
-                    stats_text += f"  - {product}: {int(count)} unidades\n"
-            
-            stats_text += "\n--- Productos con mayor gasto ---\n"
-            if 'spending_per_product' in stats and not stats['spending_per_product'].empty:
-                for product, amount in stats['spending_per_product'].items():
-                    stats_text += f"  - {product}: {amount:.2f} EUR\n"
-            
-            stats_text += "\n--- Artículo más caro por unidad ---\n"
-            if 'most_expensive_item' in stats and not stats['most_expensive_item'].empty:
-                item = stats['most_expensive_item']
-                stats_text += f"  - Descripción: {item['Descripción']}\n"
-                stats_text += f"  - Precio: {item['Precio Unitario (EUR)']:.2f} EUR\n"
-                stats_text += f"  - Nº Factura: {item['Nº Factura']}\n"
+            with self.start_metrics("stats") as metrics:
+                # Con los datos sin cambios se reutilizan las estadísticas y los gráficos anteriores
+                stats = cached_statistics(self.db, self.processor, self.stats_cache, output_dir, **filters)
+            self.record_run(metrics)
             
+            stats_text = format_statistics(stats)
             stats_text += f"\nGráficos guardados en: {os.path.abspath(output_dir)}\n"
             
             # Actualiza la GUI con el resultado del hilo secundario
@@ -637,11 +3650,13 @@ class PDFProcessorApp:
             self.root.after(0, self.progress.stop)
     
     def export_csv(self):
-        self.refresh_data()
-        self.root.after(100, self._check_data_and_export_csv)
-
-    def _check_data_and_export_csv(self):
-        if self.df_items.empty:
+        try:
+            filters = self.selected_filters()
+            has_data = self.db.count_items(**filters) > 0
+        except (ValueError, sqlite3.Error) as e:
+            messagebox.showerror("Error", str(e))
+            return
+        if not has_data:
             messagebox.showerror("Error", "No hay datos en la base de datos para exportar.")
             return
         
@@ -649,21 +3664,519 @@ class PDFProcessorApp:
         if not output_dir:
             return
         
+        self.progress.start()
+        thread = threading.Thread(target=self._export_csv_thread, args=(output_dir, filters))
+        thread.daemon = True
+        thread.start()
+
+    def _export_csv_thread(self, output_dir, filters):
         try:
-            items_path = os.path.join(output_dir, "articulos.csv")
-            invoices_path = os.path.join(output_dir, "totales.csv")
-            
-            self.df_items.to_csv(items_path, index=False, encoding='utf-8-sig')
-            self.df_invoices.to_csv(invoices_path, index=False, encoding='utf-8-sig')
-            
-            messagebox.showinfo("Éxito", f"CSV exportados correctamente:\n{items_path}\n{invoices_path}")
+            # Por trozos: se escriben según se leen, sin cargar toda la base de datos
+            items_path, invoices_path = export_csv_files(self.db.iter_items(**filters),
+                                                         self.db.iter_invoices(**filters), output_dir)
+            message = f"CSV exportados correctamente:\n{items_path}\n{invoices_path}"
+            self.root.after(0, lambda: messagebox.showinfo("Éxito", message))
+        except Exception as e:
+            message = f"No se pudieron exportar los CSV: {str(e)}"
+            self.root.after(0, lambda: messagebox.showerror("Error", message))
+        finally:
+            self.root.after(0, self.progress.stop)
+
+def get_stats_output_path():
+    """Directorio donde se guardan los gráficos de estadísticas."""
+    if sys.platform == "win32":
+        return os.path.join(os.environ.get('USERPROFILE'), 'Documents', 'ExpenditureControl_Stats')
+    return os.path.join(os.path.expanduser('~'), 'Documents', 'ExpenditureControl_Stats')
+
+def load_statistics(db, processor, use_rollups=True, **filters):
+    """Estadísticas (ver generate_statistics) de los artículos que cumplen los filtros.
+
+    Sin filtros se leen de las tablas resumen; con filtros, o con use_rollups=False,
+    se calculan recorriendo por trozos las filas que los cumplen.
+    """
+    if use_rollups and all(value is None for value in filters.values()):
+        with processor.metrics.stage("statistics"):
+            return db.rollup_statistics()
+    return processor.generate_statistics(db.iter_items(columns=STATS_ITEM_COLUMNS, **filters),
+                                         db.iter_invoices(columns=STATS_TOTAL_COLUMNS, **filters))
+
+def statistics_cache_filters(filters):
+    """Filtros de consulta normalizados para las claves de StatisticsCache: los equivalentes son iguales."""
+    params = dict(filters)
+    for name in ("start_date", "end_date"):
+        if name in params:
+            params[name] = parse_filter_date(params[name])
+    if params.get("invoice_numbers") is not None:
+        params["invoice_numbers"] = sorted({str(number) for number in params["invoice_numbers"]})
+    return params
+
+def statistics_cache_entry(db, cache, use_rollups=True, data_version=None, **filters):
+    """(clave, base de datos, versión) de StatisticsCache para las estadísticas con los datos actuales.
+
+    Sin data_version se lee la versión actual. None si la base de datos no tiene
+    data_version (esquema anterior) y no se puede usar la caché.
+    """
+    if data_version is None:
+        with db.read_connection() as conn:
+            data_version = db.data_version(conn)
+        if data_version is None:
+            return None
+    database = cache.database_id(db.db_path)
+    key = cache.make_key(database, data_version, use_rollups=use_rollups, filters=statistics_cache_filters(filters))
+    return key, database, data_version
+
+def incremental_statistics(db, processor, cache, database, **filters):
+    """Estadísticas de load_statistics recorriendo solo los artículos y totales nuevos.
+
+    cache guarda, por base de datos y filtros, el StatisticsAccumulator del último
+    cálculo con el id de las últimas filas que sumó. Si desde entonces solo se han
+    añadido filas (data_version cuenta aparte las modificaciones y los borrados), se
+    leen solo las filas posteriores que cumplen los filtros y se combinan con merge; si
+    no, o si no hay nada guardado, se recorren todas. Con filtros de producto los totales
+    se vuelven a sumar enteros: un artículo nuevo puede hacer que una factura anterior
+    cumpla los filtros. La versión, los artículos y los totales se leen en una sola
+    transacción, así el acumulador guardado corresponde a esa versión de los datos.
+    Devuelve las estadísticas y la versión (versión, reescrituras) con la que se han calculado.
+    """
+    key = cache.make_key(database, None, partial=True, filters=statistics_cache_filters(filters))
+    saved = None
+    try:
+        saved = cache.get_partial(key)
+    except Exception as e:
+        print(f"Error leyendo la caché de estadísticas: {e}")
+    
+    with db.read_connection() as conn:
+        conn.execute("BEGIN")
+        data_version = db.data_version(conn)
+        accumulator = None
+        last_item_id = last_total_id = 0
+        if saved is not None and saved[0] == data_version[1]:
+            accumulator = saved[1]
+            processor.metrics.count("incremental_statistics")
+            if filters.get("product_code") or filters.get("description"):
+                accumulator.drop_totals()
+            last_item_id, last_total_id = accumulator.last_item_id, accumulator.last_total_id
+        
+        with processor.metrics.stage("statistics"):
+            new_rows = StatisticsAccumulator.from_frames(
+                db.iter_items(columns=STATS_ITEM_COLUMNS + ("id",), after_id=last_item_id, conn=conn, **filters),
+                db.iter_invoices(columns=STATS_TOTAL_COLUMNS + ("id",), after_id=last_total_id, conn=conn,
+                                 **filters))
+    processor.metrics.count("statistics_rows", new_rows.n_items + new_rows.n_totals)
+    with processor.metrics.stage("statistics"):
+        accumulator = new_rows if accumulator is None else accumulator.merge(new_rows)
+        stats = accumulator.result()
+    try:
+        cache.put_partial(key, database, data_version, accumulator)
+    except Exception as e:
+        print(f"Error guardando en la caché de estadísticas: {e}")
+    return stats, data_version
+
+def statistics_differences(expected, actual, rtol=1e-9):
+    """Diferencias (estadística, esperado, obtenido) entre dos diccionarios de estadísticas.
+
+    Los importes en céntimos y los recuentos deben coincidir exactamente y las cantidades
+    y medias (float) con tolerancia rtol. Las Series se comparan por índice: con empates
+    el orden puede variar. Del artículo más caro solo se compara el precio, porque con
+    empates cada recorrido puede quedarse con uno distinto.
+    """
+    import numpy as np
+    import pandas as pd
+    
+    def same(a, b):
+        if a is None or b is None or isinstance(a, pd.Timestamp) or isinstance(b, pd.Timestamp):
+            return a is b or a == b
+        if isinstance(a, (int, np.integer)) and isinstance(b, (int, np.integer)):
+            return a == b
+        return bool(np.isclose(a, b, rtol=rtol, atol=0, equal_nan=True))
+    
+    differences = []
+    for name in list(expected) + [name for name in actual if name not in expected]:
+        value, other = expected.get(name), actual.get(name)
+        if name == 'most_expensive_item' and value is not None and other is not None:
+            value, other = value.get('Precio Unitario (EUR)'), other.get('Precio Unitario (EUR)')
+        if isinstance(value, pd.Series) and isinstance(other, pd.Series):
+            for index in value.index.union(other.index):
+                if not same(value.get(index), other.get(index)):
+                    differences.append((f"{name}[{index}]", value.get(index), other.get(index)))
+        elif not same(value, other):
+            differences.append((name, value, other))
+    return differences
+
+def cached_statistics(db, processor, cache, output_dir=None, use_rollups=True, **filters):
+    """load_statistics y, con output_dir, los gráficos de generate_visualizations a través de cache.
+
+    Con los datos sin cambios desde el último cálculo con los mismos filtros se devuelven
+    las estadísticas guardadas y se copian los gráficos. Si no, se calculan y se guardan:
+    sin filtros, de las tablas resumen; con filtros (o sin tablas resumen), sumando a los
+    agregados guardados solo las filas nuevas (ver incremental_statistics). La versión de
+    los datos se lee antes de calcular: si se escriben datos mientras tanto, la entrada
+    queda con la versión anterior y no se vuelve a usar. Sin cache (None), o si la caché
+    falla, todo se calcula como siempre.
+    """
+    entry = stats = None
+    if cache is not None:
+        try:
+            entry = statistics_cache_entry(db, cache, use_rollups=use_rollups, **filters)
+            stats = None if entry is None else cache.get_stats(entry[0])
+        except Exception as e:
+            print(f"Error leyendo la caché de estadísticas: {e}")
+            entry = None
+    if stats is not None:
+        processor.metrics.count("stats_cache_hits")
+    else:
+        if entry is None or (use_rollups and all(value is None for value in filters.values())):
+            stats = load_statistics(db, processor, use_rollups=use_rollups, **filters)
+        else:
+            stats, data_version = incremental_statistics(db, processor, cache, entry[1], **filters)
+            # Se guardan con la versión de las filas leídas, que puede ser posterior a la de entry
+            if data_version != entry[2]:
+                entry = statistics_cache_entry(db, cache, use_rollups=use_rollups, data_version=data_version,
+                                               **filters)
+        if entry is not None:
+            try:
+                cache.put_stats(*entry, stats)
+            except Exception as e:
+                print(f"Error guardando en la caché de estadísticas: {e}")
+                entry = None
+    if output_dir is None:
+        return stats
+
+    paths = None
+    if entry is not None:
+        try:
+            paths = cache.get_charts(entry[0], output_dir)
+        except Exception as e:
+            print(f"Error leyendo los gráficos de la caché: {e}")
+    if paths is not None:
+        processor.metrics.count("chart_cache_hits")
+        return stats
+    paths = processor.generate_visualizations(None, None, output_dir, stats=stats)
+    if entry is not None:
+        try:
+            cache.put_charts(entry[0], paths)
         except Exception as e:
-            messagebox.showerror("Error", f"No se pudieron exportar los CSV: {str(e)}")
+            print(f"Error guardando los gráficos en la caché: {e}")
+    return stats
+
+def update_snapshot(db, metrics):
+    """Pone al día la instantánea en columnas tras escribir; si falla se sigue leyendo de SQLite.
+
+    Solo se llama si se han guardado filas: una ingesta sin PDFs nuevos no debe cargar
+    pandas ni pyarrow.
+    """
+    try:
+        with metrics.stage("snapshot"):
+            db.refresh_snapshot()
+    except Exception:
+        # refresh_snapshot ya ha mostrado el error y la ingesta no debe fallar por él
+        pass
+
+def format_statistics(stats):
+    """Texto de las estadísticas que se muestra en la ventana y en la línea de comandos."""
+    stats_text = "=== ESTADÍSTICAS ===\n\n"
+    stats_text += f"Total facturas procesadas: {stats.get('total_invoices', 0)}\n"
+    stats_text += f"Total artículos: {stats.get('total_items', 0)}\n"
+    stats_text += f"Total gastado: {cents_to_euros(stats.get('total_spent', 0)):.2f} EUR\n"
+    stats_text += f"Gasto promedio por factura: {cents_to_euros(stats.get('avg_invoice_total', 0)):.2f} EUR\n"
+    stats_text += f"Total de IVA pagado: {cents_to_euros(stats.get('total_taxes', 0)):.2f} EUR\n\n"
+    
+    stats_text += "Gastos mensuales:\n"
+    if 'monthly_spending' in stats:
+        for month, amount in stats['monthly_spending'].items():
+            stats_text += f"  {month}: {cents_to_euros(amount):.2f} EUR\n"
+    
+    stats_text += "\n--- Cantidad de productos comprados ---\n"
+    if 'total_quantity_per_product' in stats and not stats['total_quantity_per_product'].empty:
+        for product, count in stats['total_quantity_per_product'].items():
+            stats_text += f"  - {product}: {int(count)} unidades\n"
+    
+    stats_text += "\n--- Productos con mayor gasto ---\n"
+    if 'spending_per_product' in stats and not stats['spending_per_product'].empty:
+        for product, amount in stats['spending_per_product'].items():
+            stats_text += f"  - {product}: {cents_to_euros(amount):.2f} EUR\n"
+    
+    stats_text += "\n--- Artículo más caro por unidad ---\n"
+    if 'most_expensive_item' in stats and not stats['most_expensive_item'].empty:
+        item = stats['most_expensive_item']
+        stats_text += f"  - Descripción: {item['Descripción']}\n"
+        stats_text += f"  - Precio: {cents_to_euros(item['Precio Unitario (EUR)']):.2f} EUR\n"
+        stats_text += f"  - Nº Factura: {item['Nº Factura']}\n"
+    
+    return stats_text
 
-def main():
+def format_search_results(page, total, offset, count_limit=SEARCH_COUNT_LIMIT):
+    """Texto de una página de resultados de DatabaseManager.search_items."""
+    if page.empty:
+        if total == 0:
+            return "No se han encontrado artículos."
+        return f"No hay artículos a partir del {offset + 1}."
+    page = euros_frame(page.copy())
+    if 'Fecha Factura' in page.columns:
+        page['Fecha Factura'] = page['Fecha Factura'].dt.strftime('%Y-%m-%d').fillna('')
+    found = f"más de {count_limit}" if total is None else total
+    return f"Artículos {offset + 1}-{offset + len(page)} de {found}\n\n" + page.to_string(index=False)
+
+def export_csv_files(df_items, df_invoices, output_dir):
+    """Exporta artículos y totales a CSV; devuelve las rutas de los ficheros.
+
+    df_items y df_invoices pueden ser DataFrames o iteradores de trozos
+    (DatabaseManager.iter_items/iter_invoices): cada trozo se escribe al leerlo.
+    """
+    items_path = os.path.join(output_dir, "articulos.csv")
+    invoices_path = os.path.join(output_dir, "totales.csv")
+    
+    write_csv_chunks(df_items, items_path)
+    write_csv_chunks(df_invoices, invoices_path)
+    return items_path, invoices_path
+
+def write_csv_chunks(data, path):
+    """Escribe un DataFrame o sus trozos en un CSV (importes en euros), con la cabecera solo en el primero."""
+    with open(path, 'w', encoding='utf-8-sig', newline='') as csv_file:
+        for i, chunk in enumerate(iter_frames(data)):
+            euros_frame(chunk).to_csv(csv_file, index=False, header=i == 0)
+
+# Códigos de salida de la línea de comandos (2 lo usa argparse para errores de uso)
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_NO_DATA = 3
+EXIT_PARTIAL = 4
+
+CLI_COMMANDS = ("ingest", "reparse", "stats", "export", "forecast", "search", "runs", "rollups", "snapshot")
+CLI_GLOBAL_OPTIONS = ("-h", "--help", "--db", "--metrics", "--metrics-json", "--profile")
+
+def build_cli_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m ExpenditureControl",
+        description="Procesamiento de facturas PDF sin interfaz gráfica. Sin argumentos se abre la ventana."
+    )
+    parser.add_argument("--db", default="expenditure_data.db", help="Nombre de la base de datos en la carpeta de la aplicación")
+    parser.add_argument("--metrics", action="store_true", help="Muestra los tiempos por etapa al terminar")
+    parser.add_argument("--metrics-json", metavar="FICHERO", help="Guarda los tiempos por etapa y contadores en JSON")
+    parser.add_argument("--profile", metavar="FICHERO", help="Guarda un perfil cProfile (.prof) del proceso principal")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    # Filtros de los comandos que leen datos: se aplican en la consulta SQL
+    filters = argparse.ArgumentParser(add_help=False)
+    filters.add_argument("--from", dest="start_date", type=cli_date, metavar="AAAA-MM-DD", help="Desde esta fecha de factura")
+    filters.add_argument("--to", dest="end_date", type=cli_date, metavar="AAAA-MM-DD", help="Hasta esta fecha de factura")
+    filters.add_argument("--invoice", dest="invoice_numbers", action="append", metavar="NÚMERO",
+                         help="Solo esta factura (se puede repetir)")
+    filters.add_argument("--product-code", help="Solo artículos con este código de producto")
+    filters.add_argument("--description", help="Solo artículos cuya descripción contiene este texto")
+    
+    ingest = subparsers.add_parser("ingest", help="Procesa los PDFs nuevos o modificados de un directorio")
+    ingest.add_argument("directory", help="Directorio con PDFs")
+    ingest.add_argument("--workers", type=int, default=1, help="Procesos en paralelo (0 = todos los núcleos)")
+    ingest.add_argument("--template", choices=sorted(INVOICE_TEMPLATES), help="Plantilla del proveedor")
+    ingest.add_argument("--batch-size", type=int, default=STREAM_BATCH_SIZE, help="Filas por transacción")
+    ingest.add_argument("--force", action="store_true", help="Procesa también los PDFs ya registrados")
+    ingest.add_argument("--no-cache", action="store_true", help="No usa la caché de texto extraído")
+    
+    reparse = subparsers.add_parser("reparse", help="Vuelve a analizar todas las facturas desde la caché de texto")
+    reparse.add_argument("--template", choices=sorted(INVOICE_TEMPLATES), help="Plantilla usada al procesar los PDFs")
+    
+    stats = subparsers.add_parser("stats", parents=[filters], help="Muestra las estadísticas de gasto")
+    stats.add_argument("--charts", metavar="DIR", help="Guarda además los gráficos en DIR")
+    stats.add_argument("--no-rollups", action="store_true",
+                       help="Calcula las estadísticas desde los artículos en lugar de las tablas resumen")
+    stats.add_argument("--no-cache", action="store_true",
+                       help="Calcula las estadísticas y los gráficos sin usar ni actualizar la caché")
+    stats.add_argument("--verify", action="store_true",
+                       help="Compara las estadísticas (incrementales o de la caché) con un cálculo completo desde los artículos")
+    
+    export = subparsers.add_parser("export", parents=[filters], help="Exporta artículos y totales a CSV")
+    export.add_argument("output_dir", help="Directorio de destino")
+    export.add_argument("--limit", type=int, help="Número máximo de filas de cada fichero")
+    
+    subparsers.add_parser("forecast", parents=[filters], help="Predice el gasto de los próximos 6 meses")
+    
+    search = subparsers.add_parser("search", help="Busca artículos por código o descripción de producto")
+    search.add_argument("text", nargs="+", help="Palabras que deben aparecer (comienzo de palabra)")
+    search.add_argument("--limit", type=int, default=SEARCH_PAGE_SIZE, help="Artículos por página")
+    search.add_argument("--offset", type=int, default=0, help="Artículos que se saltan (páginas anteriores)")
+    
+    runs = subparsers.add_parser("runs", help="Muestra en JSON los tiempos de las últimas ejecuciones medidas")
+    runs.add_argument("--limit", type=int, default=20, help="Número de ejecuciones")
+    
+    rollups = subparsers.add_parser("rollups", help="Comprueba las tablas resumen de las estadísticas contra los artículos")
+    rollups.add_argument("--rebuild", action="store_true", help="Las vuelve a calcular desde cero antes de comprobarlas")
+    
+    snapshot = subparsers.add_parser("snapshot", help="Pone al día la instantánea en columnas de artículos y facturas")
+    snapshot.add_argument("--rebuild", action="store_true", help="La escribe entera en lugar de añadir las filas nuevas")
+    return parser
+
+def cli_date(value):
+    try:
+        return parse_filter_date(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"fecha no válida: {value} (formato AAAA-MM-DD)")
+
+def cli_query_filters(args):
+    """Filtros de consulta (ver DatabaseManager.query_items) de los argumentos de la línea de comandos."""
+    return {
+        'start_date': args.start_date, 'end_date': args.end_date, 'invoice_numbers': args.invoice_numbers,
+        'product_code': args.product_code, 'description': args.description,
+    }
+
+def run_cli(argv):
+    """Ejecuta un comando de la línea de comandos y devuelve el código de salida.
+
+    Con --metrics, --metrics-json o --profile la ejecución se mide y se guarda en run_log.
+    """
+    args = build_cli_parser().parse_args(argv)
+    db = DatabaseManager(args.db)
+    metrics = RunMetrics(args.command, enabled=bool(args.metrics or args.metrics_json or args.profile),
+                         profile=bool(args.profile))
+    try:
+        db.create_tables()
+        with metrics:
+            status = _run_cli_command(args, db, metrics)
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        status = EXIT_ERROR
+    
+    try:
+        if metrics.enabled and metrics.duration is not None:
+            db.record_run(metrics)
+            if args.metrics_json:
+                metrics.save_json(args.metrics_json)
+            if args.profile:
+                metrics.save_profile(args.profile)
+            if args.metrics:
+                # Por stderr para no mezclarse con la salida del comando
+                print(metrics.format_summary(), file=sys.stderr)
+    except (OSError, sqlite3.Error) as e:
+        print(f"Error guardando las métricas: {e}", file=sys.stderr)
+        status = status or EXIT_ERROR
+    finally:
+        db.close()
+    return status
+
+def _run_cli_command(args, db, metrics):
+    if args.command == "ingest":
+        if not os.path.isdir(args.directory):
+            print(f"No existe el directorio: {args.directory}", file=sys.stderr)
+            return EXIT_ERROR
+        text_cache = None if args.no_cache else TextCache()
+        processor = PDFInvoiceProcessor(text_cache=text_cache, template=args.template, metrics=metrics)
+        saved_items, saved_totals = processor.stream_pdf_directory(
+            args.directory, db, workers=args.workers or None, manifest=db.get_manifest(), batch_size=args.batch_size,
+            force=args.force
+        )
+        if saved_items or saved_totals:
+            update_snapshot(db, metrics)
+        print(f"{saved_items} artículos y {saved_totals} totales guardados; "
+              f"{len(processor.skipped_files)} PDFs sin cambios omitidos; {len(processor.failed_files)} con errores.")
+        if processor.failed_files:
+            return EXIT_PARTIAL
+        return EXIT_OK
+    
+    if args.command == "reparse":
+        processor = PDFInvoiceProcessor(text_cache=TextCache(), template=args.template, metrics=metrics)
+        saved_items, saved_totals = processor.reparse_from_cache(db)
+        if saved_items or saved_totals:
+            update_snapshot(db, metrics)
+        print(f"{saved_items} artículos y {saved_totals} totales guardados.")
+        return EXIT_OK
+    
+    if args.command == "search":
+        with metrics.stage("search"):
+            page, total = db.search_items(" ".join(args.text), limit=args.limit, offset=args.offset)
+        if total == 0:
+            print("No se han encontrado artículos.", file=sys.stderr)
+            return EXIT_NO_DATA
+        print(format_search_results(page, total, args.offset))
+        return EXIT_OK
+    
+    if args.command == "runs":
+        print(json.dumps(db.get_run_log(args.limit), indent=2, ensure_ascii=False))
+        return EXIT_OK
+    
+    if args.command == "rollups":
+        if args.rebuild:
+            with metrics.stage("rebuild"):
+                db.rebuild_rollups()
+        with metrics.stage("check"):
+            differences = db.check_rollups()
+        for table, key, stored, expected in differences[:20]:
+            print(f"{table} {key}: guardado {stored}, calculado {expected}")
+        if differences:
+            print(f"❌ {len(differences)} diferencias entre las tablas resumen y los artículos. "
+                  f"Usa 'rollups --rebuild' para recalcularlas.", file=sys.stderr)
+            return EXIT_ERROR
+        print("✅ Las tablas resumen coinciden con los artículos.")
+        return EXIT_OK
+    
+    if args.command == "snapshot":
+        with metrics.stage("snapshot"):
+            state = db.refresh_snapshot(rebuild=args.rebuild)
+        if state is None:
+            print("La instantánea en columnas necesita pyarrow (pip install pyarrow).", file=sys.stderr)
+            return EXIT_ERROR
+        items, invoices = state["tables"]["items"], state["tables"]["invoices"]
+        print(f"Instantánea al día (versión {state['version']} de los datos): {items['rows']} artículos en "
+              f"{len(items['segments'])} segmentos y {invoices['rows']} facturas en {len(invoices['segments'])}.")
+        return EXIT_OK
+    
+    # Cada comando lee solo las filas de los filtros y las columnas que usa, por trozos
+    # de READ_CHUNK_SIZE filas: la memoria no depende del tamaño del histórico
+    filters = cli_query_filters(args)
+    with metrics.stage("load"):
+        n_items = db.count_items(**filters)
+    if not n_items:
+        print("La base de datos no tiene artículos. Procesa primero algunos PDFs.", file=sys.stderr)
+        return EXIT_NO_DATA
+    processor = PDFInvoiceProcessor(metrics=metrics)
+    metrics.count("items", n_items)
+    
+    if args.command == "stats":
+        cache = None if args.no_cache else StatisticsCache()
+        stats = cached_statistics(db, processor, cache, args.charts, use_rollups=not args.no_rollups, **filters)
+        print(format_statistics(stats))
+        if args.charts:
+            print(f"Gráficos guardados en: {os.path.abspath(args.charts)}")
+        if args.verify:
+            with metrics.stage("verify"):
+                expected = load_statistics(db, processor, use_rollups=False, **filters)
+            differences = statistics_differences(expected, stats)
+            for name, value, other in differences[:20]:
+                print(f"{name}: calculado {value}, obtenido {other}")
+            if differences:
+                print(f"❌ {len(differences)} diferencias con el cálculo completo. "
+                      f"Usa 'stats --no-cache' para calcularlas sin la caché.", file=sys.stderr)
+                return EXIT_ERROR
+            print("✅ Las estadísticas coinciden con el cálculo completo.")
+    elif args.command == "export":
+        os.makedirs(args.output_dir, exist_ok=True)
+        with metrics.stage("export"):
+            paths = export_csv_files(db.iter_items(limit=args.limit, **filters),
+                                     db.iter_invoices(limit=args.limit, **filters), args.output_dir)
+        for path in paths:
+            print(path)
+    elif args.command == "forecast":
+        predictions, future_dates = processor.predict_future_spending(db.iter_items(columns=FORECAST_ITEM_COLUMNS, **filters))
+        if predictions is None:
+            print("No hay suficientes meses con datos para predecir (mínimo 3).", file=sys.stderr)
+            return EXIT_NO_DATA
+        for date, amount in zip(future_dates, predictions):
+            print(f"{date.strftime('%Y-%m')}: {cents_to_euros(amount):.2f} EUR")
+    return EXIT_OK
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    # macOS puede pasar argumentos propios (-psn_...) al abrir la aplicación: solo se
+    # entra en modo línea de comandos con un comando conocido o con --help
+    if argv and (argv[0] in CLI_COMMANDS or argv[0] in CLI_GLOBAL_OPTIONS):
+        return run_cli(argv)
+    
+    load_tkinter()
     root = tk.Tk()
     app = PDFProcessorApp(root)
     root.mainloop()
+    return EXIT_OK
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # Necesario para el pool de procesos en los ejecutables de PyInstaller
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -30,8 +30,7 @@ def install_dependencies():
             "pandas==2.0.3",
             "numpy==1.24.3",
             "scikit-learn==1.3.0",
-            "matplotlib==3.7.2",
-            "seaborn==0.12.2"
+            "matplotlib==3.7.2"
         ]
     else:
         # Python 3.11+
@@ -39,8 +38,7 @@ def install_dependencies():
             "pandas==2.1.4",
             "numpy==1.26.0",
             "scikit-learn==1.3.2",
-            "matplotlib==3.8.2",
-            "seaborn==0.13.0"
+            "matplotlib==3.8.2"
         ]
     
     all_packages = base_packages + version_specific
@@ -109,7 +107,7 @@ def main():
     
     print("\n✅ Instalación completada!")
     print("\n📋 Para verificar la instalación, ejecuta:")
-    print("python -c \"import pdfplumber, pandas, numpy, sklearn, matplotlib, seaborn, PIL; print('Todas las dependencias están instaladas correctamente')\"")
+    print("python -c \"import pdfplumber, pandas, numpy, sklearn, matplotlib, PIL; print('Todas las dependencias están instaladas correctamente')\"")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -50,7 +50,6 @@ def install_in_virtualenv():
         "numpy==1.26.0",
         "scikit-learn==1.3.2",
         "matplotlib==3.8.2",
-        "seaborn==0.13.0",
         "Pillow==10.1.0",
         "openpyxl==3.1.2"
     ]